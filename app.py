@@ -1,10 +1,15 @@
+import base64
+import binascii
 import json
 import logging
 import mimetypes
 import os
 import re
 import secrets
+import time
+from datetime import datetime
 from functools import wraps
+from itertools import islice
 
 import boto3
 from botocore.exceptions import ClientError
@@ -18,15 +23,36 @@ from flask import (
     redirect,
     render_template,
     request,
-    send_file,
     session,
+    stream_with_context,
     url_for,
 )
 from flask_wtf.csrf import CSRFProtect, generate_csrf
+from werkzeug.datastructures import ContentRange
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import is_resource_modified, parse_range_header
 from werkzeug.utils import secure_filename
 
+from cache import listing_cache, metadata_cache, url_cache
 from config import s3_config
-from storage_providers import get_storage_provider
+from dedup import (
+    DEDUP_MIN_SIZE,
+    DEDUP_UPLOADS,
+    HashingUploadStream,
+    dedup_index,
+    valid_content_hash,
+)
+from index_events import ChangeEvent
+from indexer import (
+    SEARCH_DEFAULT_LIMIT,
+    SEARCH_MAX_LIMIT,
+    bucket_indexer,
+    metadata_index,
+)
+from metrics import init_app as init_metrics
+from provider_registry import provider_cache_key, provider_registry
+from streaming import MultipartUploadStream, content_disposition
+from transfer import TRANSFER_MAX_WORKERS, TRANSFER_WORKERS, transfer_manager
 
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -45,6 +71,9 @@ app.config["WTF_CSRF_CHECK_DEFAULT"] = False  # Disable default CSRF checking
 csrf = CSRFProtect()
 csrf.init_app(app)
 
+# Request timing and the /metrics endpoint
+init_metrics(app)
+
 
 @app.before_request
 def before_request():
@@ -60,7 +89,8 @@ def before_request():
         }
         session["bucket"] = s3_config.s3_bucket
 
-    if not request.is_secure and not app.debug:
+    # Scrapers reach /metrics over the private network, without TLS
+    if not request.is_secure and not app.debug and request.path != "/metrics":
         url = request.url.replace("http://", "https://", 1)
         code = 301
         return redirect(url, code=code)
@@ -87,7 +117,37 @@ def get_csrf_token():
 # Set up logging
 logger = logging.getLogger(__name__)
 
-CHUNK_SIZE = 100 * 1024 * 1024  # 100 MB chunks
+# Parse multipart uploads incrementally instead of spooling them to disk
+STREAMING_UPLOADS = os.environ.get("STREAMING_UPLOADS", "true").lower() == "true"
+
+# Maximum number of part URLs handed out per /multipart/part-urls request
+MULTIPART_MAX_URLS_PER_REQUEST = 100
+
+# Page size bounds for /list
+LIST_DEFAULT_LIMIT = 1000
+LIST_MAX_LIMIT = 10000
+
+# Maximum number of keys signed by a single /preview-urls request
+PREVIEW_URLS_MAX_KEYS = 500
+
+# How /download serves objects: "proxy" streams them through this server,
+# "redirect" sends the browser to a presigned URL, and "auto" redirects only
+# objects of at least DOWNLOAD_REDIRECT_THRESHOLD bytes. DOWNLOAD_MODE_<TYPE>
+# (e.g. DOWNLOAD_MODE_GCS) overrides the mode for a single provider type.
+DOWNLOAD_MODES = ("proxy", "redirect", "auto")
+DOWNLOAD_MODE = os.environ.get("DOWNLOAD_MODE", "auto").lower()
+DOWNLOAD_REDIRECT_THRESHOLD = int(
+    os.environ.get("DOWNLOAD_REDIRECT_THRESHOLD", 64 * 1024 * 1024)
+)
+# Lifetime of the presigned URLs /download redirects to
+DOWNLOAD_URL_EXPIRES_IN = int(os.environ.get("DOWNLOAD_URL_EXPIRES_IN", 300))
+
+# Upper bound on the keys one /delete-batch request may delete
+DELETE_BATCH_MAX_KEYS = int(os.environ.get("DELETE_BATCH_MAX_KEYS", 100000))
+# Seconds between progress lines of folder deletes, copies and moves
+FOLDER_PROGRESS_INTERVAL = 0.5
+# Failed keys reported per folder operation; the count covers the rest
+FOLDER_OPERATION_MAX_ERRORS = 100
 
 # Update MIME type detection
 mimetypes.init()
@@ -107,26 +167,216 @@ def login_required(f):
 
 
 def get_current_provider():
-    """Get the current storage provider based on session configuration"""
+    """Get the current storage provider based on session configuration.
+
+    Providers come from the process-wide registry, so clients and their
+    connection pools are reused across requests. The lease is returned to the
+    registry when the request context is torn down.
+    """
     if "provider_type" not in session:
         return None
 
+    if "provider" in g:
+        return g.provider
+
     try:
-        return get_storage_provider(
-            session["provider_type"], **session["provider_config"]
+        g.provider = provider_registry.acquire(
+            session["provider_type"], session["provider_config"]
         )
+        return g.provider
     except Exception as e:
         logger.error(f"Error creating storage provider: {str(e)}")
         return None
 
 
+def current_provider_key():
+    """Identity of the session's storage configuration, used in cache keys"""
+    return provider_cache_key(session["provider_type"], session["provider_config"])
+
+
+def record_write(key, subtree=False, deleted=False, size=None, storage=None):
+    """Drop cached listings and metadata that a write to ``key`` made stale
+    and apply the write to the search index.
+
+    ``storage`` is a ``(provider_type, provider_config)`` pair for callers
+    outside a Flask request; it defaults to the session's.
+    """
+    provider_type, provider_config = storage or (
+        session["provider_type"],
+        session["provider_config"],
+    )
+    provider_key = provider_cache_key(provider_type, provider_config)
+    listing_cache.invalidate(provider_key, key, subtree)
+    metadata_cache.invalidate(provider_key, key)
+    bucket_indexer.record_write(
+        provider_type,
+        provider_config,
+        ChangeEvent(name=key, deleted=deleted, size=size),
+        subtree,
+    )
+
+
+def record_deletes(keys):
+    """:func:`record_write` for many deleted keys at once"""
+    provider_key = current_provider_key()
+    # Invalidating any key of a folder drops the folder's listings
+    for directory in {key[: key.rfind("/") + 1] for key in keys}:
+        listing_cache.invalidate(provider_key, directory)
+    for key in keys:
+        metadata_cache.invalidate(provider_key, key)
+    bucket_indexer.record_deletes(
+        session["provider_type"], session["provider_config"], keys
+    )
+
+
+def cached_file_info(provider, filename):
+    """``provider.get_file_info`` through the shared metadata cache"""
+    provider_key = current_provider_key()
+    info = metadata_cache.get(provider_key, filename)
+    if info is None:
+        info = provider.get_file_info(filename)
+        metadata_cache.set(provider_key, filename, info)
+    return info
+
+
+def signed_urls(provider, filenames, expires_in=3600, provider_key=None):
+    """Signed URLs for ``filenames``, reusing cached ones that are still fresh"""
+    provider_key = provider_key or current_provider_key()
+    urls = url_cache.get_many(provider_key, filenames, expires_in)
+    missing = [name for name in filenames if name not in urls]
+    if missing:
+        signed = provider.get_file_urls(missing, expires_in)
+        url_cache.set_many(provider_key, signed, expires_in)
+        urls.update(signed)
+    return urls
+
+
+def signed_url(
+    provider, filename, expires_in=3600, download_name=None, provider_key=None
+):
+    """Single signed URL through the URL cache"""
+    provider_key = provider_key or current_provider_key()
+    cached = url_cache.get_many(provider_key, [filename], expires_in, download_name)
+    if filename in cached:
+        return cached[filename]
+    url = provider.get_file_url(filename, expires_in, download_name=download_name)
+    url_cache.set_many(provider_key, {filename: url}, expires_in, download_name)
+    return url
+
+
+@app.teardown_request
+def release_provider(exc=None):
+    provider = g.pop("provider", None)
+    if provider is not None:
+        provider_registry.release(provider)
+
+
 @app.route("/")
 @login_required
 def index():
     provider = get_current_provider()
     if not provider:
         return redirect(url_for("configure_storage"))
-    return render_template("index.html")
+    return render_template(
+        "index.html", dedup_min_size=DEDUP_MIN_SIZE if DEDUP_UPLOADS else 0
+    )
+
+
+# Constructor arguments of each provider, with their names in errors
+PROVIDER_FIELDS = {
+    "aws": {
+        "access_key": "Access Key",
+        "secret_key": "Secret Key",
+        "bucket": "Bucket name",
+        "region": "Region",
+    },
+    "backblaze": {
+        "application_key_id": "Application Key ID",
+        "application_key": "Application Key",
+        "bucket_name": "Bucket name",
+    },
+    "gcs": {
+        "credentials_json": "Service account JSON",
+        "project_id": "Project ID",
+        "bucket_name": "Bucket name",
+    },
+    "cloudflare": {
+        "account_id": "Account ID",
+        "access_key": "Access Key ID",
+        "secret_key": "Secret Access Key",
+        "bucket": "Bucket name",
+    },
+}
+PROVIDER_FIELDS["wasabi"] = PROVIDER_FIELDS["aws"]
+PROVIDER_FIELDS["digitalocean"] = PROVIDER_FIELDS["aws"]
+PROVIDER_FIELDS["hetzner"] = PROVIDER_FIELDS["aws"]
+
+BUCKET_NAME_FORMATS = {
+    "backblaze": (r"^[a-z0-9-]{6,50}$", "Invalid bucket name format for Backblaze B2"),
+    "wasabi": (
+        r"^[a-z0-9][a-z0-9.-]{1,61}[a-z0-9]$",
+        "Invalid bucket name format for Wasabi",
+    ),
+    "digitalocean": (
+        r"^[a-z0-9][a-z0-9.-]{2,62}[a-z0-9]$",
+        "Invalid bucket name format for DigitalOcean Spaces",
+    ),
+    "hetzner": (
+        r"^[a-z0-9][a-z0-9.-]{2,62}[a-z0-9]$",
+        "Invalid bucket name format for Hetzner Storage",
+    ),
+    "cloudflare": (r"^[a-zA-Z0-9.\-_]{3,63}$", "Invalid bucket name format"),
+}
+# Region and account values become part of the endpoint host name
+AWS_REGION_FORMAT = r"^[a-z]{2}(-[a-z]+)+-[0-9]{1,2}$"
+R2_ACCOUNT_ID_FORMAT = r"^[0-9a-f]{32}$"
+PROVIDER_REGIONS = {
+    "digitalocean": ["nyc3", "ams3", "sgp1", "fra1", "sfo3"],
+    "hetzner": ["nbg1", "fsn1", "hel1", "ash", "hil", "sin"],
+}
+PROVIDER_NAMES = {"digitalocean": "DigitalOcean Spaces", "hetzner": "Hetzner Storage"}
+
+
+def provider_credentials(provider_type, values):
+    """Validated provider arguments from untrusted ``values``, as submitted
+    to /configure or /transfers; raises ValueError with the message for the
+    client"""
+    fields = PROVIDER_FIELDS.get(provider_type)
+    if fields is None:
+        raise ValueError("Invalid storage provider selected")
+
+    credentials = {}
+    for name, label in fields.items():
+        value = values.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        elif not (name == "credentials_json" and isinstance(value, dict)):
+            value = None
+        if not value:
+            raise ValueError(f"{label} is required")
+        credentials[name] = value
+
+    bucket_format = BUCKET_NAME_FORMATS.get(provider_type)
+    if bucket_format:
+        bucket = credentials.get("bucket") or credentials.get("bucket_name")
+        if not re.match(bucket_format[0], bucket):
+            raise ValueError(bucket_format[1])
+
+    if provider_type in PROVIDER_REGIONS:
+        if credentials["region"] not in PROVIDER_REGIONS[provider_type]:
+            raise ValueError(f"Invalid region for {PROVIDER_NAMES[provider_type]}")
+    elif "region" in credentials:
+        if not re.match(AWS_REGION_FORMAT, credentials["region"]):
+            raise ValueError("Invalid region")
+    if provider_type == "cloudflare":
+        if not re.match(R2_ACCOUNT_ID_FORMAT, credentials["account_id"]):
+            raise ValueError("Invalid Cloudflare account ID")
+    if provider_type == "gcs" and isinstance(credentials["credentials_json"], str):
+        try:
+            json.loads(credentials["credentials_json"])
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid service account JSON format: {str(e)}")
+    return credentials
 
 
 @csrf.exempt
@@ -145,194 +395,24 @@ def configure_storage():
         logger.debug(f"Received configuration request for provider: {provider_type}")
         logger.debug(f"Form data: {request.form}")
 
+        values = request.form.to_dict()
+        if provider_type == "backblaze":
+            values["application_key_id"] = values.get("key_id", "")
+        if provider_type in ["aws", "wasabi"] and not values.get("region"):
+            values["region"] = "us-east-1"
+        try:
+            credentials = provider_credentials(provider_type, values)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
         try:
-            if provider_type == "cloudflare":
-                account_id = request.form.get("account_id", "").strip()
-                access_key = request.form.get("access_key", "").strip()
-                secret_key = request.form.get("secret_key", "").strip()
-                bucket = request.form.get("bucket", "").strip()
-
-                logger.debug(
-                    f"Cloudflare configuration - Account ID: {account_id}, Bucket: {bucket}"
-                )
-
-                if not account_id:
-                    return jsonify({"error": "Account ID is required"}), 400
-                if not access_key:
-                    return jsonify({"error": "Access Key ID is required"}), 400
-                if not secret_key:
-                    return jsonify({"error": "Secret Access Key is required"}), 400
-                if not bucket:
-                    return jsonify({"error": "Bucket name is required"}), 400
-                if not re.match(r"^[a-zA-Z0-9.\-_]{3,63}$", bucket):
-                    return jsonify({"error": "Invalid bucket name format"}), 400
-
-                credentials = {
-                    "account_id": account_id,
-                    "access_key": access_key,
-                    "secret_key": secret_key,
-                    "bucket": bucket,
-                }
-            elif provider_type in ["aws", "wasabi"]:
-                credentials = {
-                    "access_key": request.form.get("access_key"),
-                    "secret_key": request.form.get("secret_key"),
-                    "bucket": request.form.get("bucket"),
-                    "region": request.form.get("region", "us-east-1"),
-                }
-            elif provider_type == "backblaze":
-                key_id = request.form.get("key_id", "").strip()
-                application_key = request.form.get("application_key", "").strip()
-                bucket_name = request.form.get("bucket_name", "").strip()
-
-                if not key_id:
-                    return jsonify({"error": "Application Key ID is required"}), 400
-                if not application_key:
-                    return jsonify({"error": "Application Key is required"}), 400
-                if not bucket_name:
-                    return jsonify({"error": "Bucket name is required"}), 400
-                if not re.match(r"^[a-z0-9-]{6,50}$", bucket_name):
-                    return (
-                        jsonify(
-                            {"error": "Invalid bucket name format for Backblaze B2"}
-                        ),
-                        400,
-                    )
-
-                credentials = {
-                    "application_key_id": key_id,
-                    "application_key": application_key,
-                    "bucket_name": bucket_name,
-                }
-            elif provider_type == "wasabi":
-                access_key = request.form.get("access_key", "").strip()
-                secret_key = request.form.get("secret_key", "").strip()
-                bucket = request.form.get("bucket", "").strip()
-                region = request.form.get("region", "").strip()
-
-                if not access_key:
-                    return jsonify({"error": "Access Key is required"}), 400
-                if not secret_key:
-                    return jsonify({"error": "Secret Key is required"}), 400
-                if not bucket:
-                    return jsonify({"error": "Bucket name is required"}), 400
-                if not region:
-                    return jsonify({"error": "Region is required"}), 400
-                if not re.match(r"^[a-z0-9][a-z0-9.-]{1,61}[a-z0-9]$", bucket):
-                    return (
-                        jsonify({"error": "Invalid bucket name format for Wasabi"}),
-                        400,
-                    )
-
-                credentials = {
-                    "access_key": access_key,
-                    "secret_key": secret_key,
-                    "bucket": bucket,
-                    "region": region,
-                }
-            elif provider_type == "gcs":
-                credentials_json = request.form.get("credentials_json", "").strip()
-                if not credentials_json:
-                    return jsonify({"error": "Service account JSON is required"}), 400
-
-                try:
-                    # Validate JSON format
-                    json.loads(credentials_json)
-                    project_id = request.form.get("project_id", "").strip()
-                    bucket_name = request.form.get("bucket_name", "").strip()
-
-                    if not project_id:
-                        return jsonify({"error": "Project ID is required"}), 400
-                    if not bucket_name:
-                        return jsonify({"error": "Bucket name is required"}), 400
-
-                    credentials = {
-                        "project_id": project_id,
-                        "bucket_name": bucket_name,
-                        "credentials_json": credentials_json,
-                    }
-                except json.JSONDecodeError as e:
-                    return (
-                        jsonify(
-                            {"error": f"Invalid service account JSON format: {str(e)}"}
-                        ),
-                        400,
-                    )
-            elif provider_type == "digitalocean":
-                access_key = request.form.get("access_key", "").strip()
-                secret_key = request.form.get("secret_key", "").strip()
-                bucket = request.form.get("bucket", "").strip()
-                region = request.form.get("region", "").strip()
-
-                if not access_key:
-                    return jsonify({"error": "Access Key is required"}), 400
-                if not secret_key:
-                    return jsonify({"error": "Secret Key is required"}), 400
-                if not bucket:
-                    return jsonify({"error": "Bucket name is required"}), 400
-                if not region:
-                    return jsonify({"error": "Region is required"}), 400
-                if not re.match(r"^[a-z0-9][a-z0-9.-]{2,62}[a-z0-9]$", bucket):
-                    return (
-                        jsonify(
-                            {
-                                "error": "Invalid bucket name format for DigitalOcean Spaces"
-                            }
-                        ),
-                        400,
-                    )
-                if region not in ["nyc3", "ams3", "sgp1", "fra1", "sfo3"]:
-                    return (
-                        jsonify({"error": "Invalid region for DigitalOcean Spaces"}),
-                        400,
-                    )
-
-                credentials = {
-                    "access_key": access_key,
-                    "secret_key": secret_key,
-                    "bucket": bucket,
-                    "region": region,
-                }
-            elif provider_type == "hetzner":
-                access_key = request.form.get("access_key", "").strip()
-                secret_key = request.form.get("secret_key", "").strip()
-                bucket = request.form.get("bucket", "").strip()
-                region = request.form.get("region", "").strip()
-
-                if not access_key:
-                    return jsonify({"error": "Access Key is required"}), 400
-                if not secret_key:
-                    return jsonify({"error": "Secret Key is required"}), 400
-                if not bucket:
-                    return jsonify({"error": "Bucket name is required"}), 400
-                if not region:
-                    return jsonify({"error": "Region is required"}), 400
-                if not re.match(r"^[a-z0-9][a-z0-9.-]{2,62}[a-z0-9]$", bucket):
-                    return (
-                        jsonify(
-                            {"error": "Invalid bucket name format for Hetzner Storage"}
-                        ),
-                        400,
-                    )
-                if region not in ["nbg1", "fsn1", "hel1", "ash", "hil", "sin"]:
-                    return jsonify({"error": "Invalid region for Hetzner Storage"}), 400
-
-                credentials = {
-                    "access_key": access_key,
-                    "secret_key": secret_key,
-                    "bucket": bucket,
-                    "region": region,
-                }
-            else:
-                return jsonify({"error": "Invalid storage provider selected"}), 400
 
             # Validate credentials by creating a provider instance
             logger.debug(f"Attempting to create provider instance for {provider_type}")
-            provider = get_storage_provider(provider_type, **credentials)
-
-            # Test provider by listing files
-            logger.debug("Testing provider connection by listing files")
-            provider.list_files()
+            with provider_registry.lease(provider_type, credentials) as provider:
+                # Test provider by listing files
+                logger.debug("Testing provider connection by listing files")
+                next(iter(provider.list_files()), None)
 
             # Store configuration in session
             session["authenticated"] = True
@@ -360,6 +440,13 @@ def configure_storage():
 @app.route("/upload", methods=["POST"])
 @login_required
 def upload():
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    if STREAMING_UPLOADS and request.mimetype == "multipart/form-data":
+        return streaming_upload(provider)
+
     if "file" not in request.files:
         return jsonify({"error": "No file part"}), 400
 
@@ -367,21 +454,266 @@ def upload():
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
 
+    filename = upload_key(file.filename, request.form.get("folder", ""))
+    try:
+        stream = HashingUploadStream(file) if DEDUP_UPLOADS else file
+        provider.upload_file(stream, filename)
+        record_write(filename, size=file.content_length or None)
+        record_content(provider, filename, stream)
+        return jsonify({"message": "File uploaded successfully"}), 200
+    except Exception as e:
+        logger.error(f"Error uploading file: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def streaming_upload(provider):
+    """Pipe the file part of the request body straight into the provider.
+
+    The multipart body is parsed as it arrives, so no local copy of the file
+    is ever made. The folder must be sent before the file part or given as
+    a query argument.
+    """
+    boundary = request.mimetype_params.get("boundary")
+    if not boundary:
+        return jsonify({"error": "Missing multipart boundary"}), 400
+
+    try:
+        stream = MultipartUploadStream(request.stream, boundary.encode("latin-1"))
+        if not stream.next_file():
+            return jsonify({"error": "No file part"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not stream.filename:
+        return jsonify({"error": "No selected file"}), 400
+
+    folder = stream.fields.get("folder") or request.args.get("folder", "")
+    filename = upload_key(stream.filename, folder)
+    try:
+        # The body length slightly exceeds the file size; good enough to
+        # pick a part size
+        if DEDUP_UPLOADS:
+            stream = HashingUploadStream(stream)
+        provider.upload_file(stream, filename, size=request.content_length)
+        record_write(filename)
+        record_content(provider, filename, stream)
+        return jsonify({"message": "File uploaded successfully"}), 200
+    except Exception as e:
+        logger.error(f"Error uploading file: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def record_content(provider, filename, stream):
+    """Add an upload hashed on its way through to the dedup index"""
+    if isinstance(stream, HashingUploadStream):
+        dedup_index.record_upload(
+            provider,
+            current_provider_key(),
+            filename,
+            stream.hasher.hexdigest(),
+            stream.hasher.size,
+        )
+
+
+@app.route("/upload/dedup", methods=["POST"])
+@login_required
+def upload_dedup():
+    """Try to store a file without uploading it.
+
+    Expects ``{"filename", "folder", "size", "content_hash"}`` with the
+    hash computed as in :class:`dedup.ContentHasher`. When an object with
+    that content exists, it is copied server-side to the new key and
+    ``deduplicated`` is true; otherwise the client uploads as usual.
+    """
+    if not DEDUP_UPLOADS:
+        return jsonify({"error": "Deduplicated uploads are disabled"}), 404
     provider = get_current_provider()
     if not provider:
         return jsonify({"error": "Storage not configured"}), 400
 
-    if file:
-        filename = secure_filename(file.filename)
-        folder = request.form.get("folder", "")
-        if folder:
-            filename = f"{folder.rstrip('/')}/{filename}"
-        try:
-            provider.upload_file(file, filename)
-            return jsonify({"message": "File uploaded successfully"}), 200
-        except Exception as e:
-            logger.error(f"Error uploading file: {str(e)}")
-            return jsonify({"error": str(e)}), 500
+    data, error = multipart_params("filename", "content_hash")
+    if error:
+        return error
+    size = data.get("size")
+    if not isinstance(size, int) or size < 0:
+        return jsonify({"error": "size must be a non-negative integer"}), 400
+    if not valid_content_hash(data["content_hash"]):
+        return jsonify({"error": "content_hash must be a hex SHA-256"}), 400
+
+    key = upload_key(data["filename"], data.get("folder", ""))
+    try:
+        source = dedup_index.deduplicate(
+            provider, current_provider_key(), data["content_hash"], size, key
+        )
+    except Exception as e:
+        logger.error(f"Error deduplicating upload: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if source is None:
+        return jsonify({"deduplicated": False, "key": key}), 200
+    record_write(key, size=size)
+    return jsonify({"deduplicated": True, "key": key, "source": source}), 200
+
+
+def upload_key(original_filename, folder):
+    filename = secure_filename(original_filename)
+    if folder:
+        filename = f"{folder.rstrip('/')}/{filename}"
+    return filename
+
+
+def multipart_params(*required):
+    """JSON body of a /multipart/* request, or an error response"""
+    data = request.get_json(silent=True) or {}
+    missing = [field for field in required if not data.get(field)]
+    if missing:
+        return None, (jsonify({"error": f"Missing {', '.join(missing)}"}), 400)
+    return data, None
+
+
+def multipart_call(action, *args):
+    """Run a provider multipart operation, mapping unsupported backends to 501"""
+    try:
+        return action(*args), None
+    except NotImplementedError as e:
+        return None, (jsonify({"error": str(e)}), 501)
+    except Exception as e:
+        logger.error(f"Error in multipart upload: {str(e)}")
+        return None, (jsonify({"error": str(e)}), 500)
+
+
+@app.route("/multipart/initiate", methods=["POST"])
+@login_required
+def multipart_initiate():
+    """Start a browser-direct multipart upload.
+
+    The browser then PUTs parts straight to the bucket using presigned URLs,
+    so file bytes never pass through this server.
+    """
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    data, error = multipart_params("filename")
+    if error:
+        return error
+    try:
+        size = int(data.get("size") or 0) or None
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be an integer"}), 400
+
+    key = upload_key(data["filename"], data.get("folder", ""))
+    upload_id, error = multipart_call(provider.create_multipart_upload, key)
+    if error:
+        return error
+
+    tuning = provider.upload_tuning
+    return (
+        jsonify(
+            {
+                "key": key,
+                "upload_id": upload_id,
+                "part_size": tuning.part_size_for(size),
+                "concurrency": tuning.concurrency,
+            }
+        ),
+        200,
+    )
+
+
+@app.route("/multipart/part-urls", methods=["POST"])
+@login_required
+def multipart_part_urls():
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    data, error = multipart_params("key", "upload_id", "part_numbers")
+    if error:
+        return error
+    part_numbers = data["part_numbers"]
+    if not isinstance(part_numbers, list) or not all(
+        isinstance(n, int) and n >= 1 for n in part_numbers
+    ):
+        return jsonify({"error": "part_numbers must be positive integers"}), 400
+    if len(part_numbers) > MULTIPART_MAX_URLS_PER_REQUEST:
+        return (
+            jsonify(
+                {"error": f"At most {MULTIPART_MAX_URLS_PER_REQUEST} parts per request"}
+            ),
+            400,
+        )
+
+    urls, error = multipart_call(
+        provider.get_upload_part_urls, data["key"], data["upload_id"], part_numbers
+    )
+    if error:
+        return error
+    return jsonify({"urls": urls}), 200
+
+
+@app.route("/multipart/parts", methods=["POST"])
+@login_required
+def multipart_parts():
+    """Parts already uploaded, used by the browser to resume an upload"""
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    data, error = multipart_params("key", "upload_id")
+    if error:
+        return error
+    parts, error = multipart_call(
+        provider.list_uploaded_parts, data["key"], data["upload_id"]
+    )
+    if error:
+        return error
+    return jsonify({"parts": parts}), 200
+
+
+@app.route("/multipart/complete", methods=["POST"])
+@login_required
+def multipart_complete():
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    data, error = multipart_params("key", "upload_id", "parts")
+    if error:
+        return error
+    parts = data["parts"]
+    if not isinstance(parts, list) or not all(
+        isinstance(p, dict) and "PartNumber" in p and "ETag" in p for p in parts
+    ):
+        return jsonify({"error": "parts must list PartNumber and ETag"}), 400
+
+    _, error = multipart_call(
+        provider.complete_multipart_upload, data["key"], data["upload_id"], parts
+    )
+    if error:
+        return error
+    # Direct uploads bypass this server, so their content is never hashed
+    # here and is not added to the dedup index: a hash asserted by the
+    # client could make later uploads copy unrelated content
+    record_write(data["key"])
+    return jsonify({"message": "File uploaded successfully"}), 200
+
+
+@app.route("/multipart/abort", methods=["POST"])
+@login_required
+def multipart_abort():
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    data, error = multipart_params("key", "upload_id")
+    if error:
+        return error
+    _, error = multipart_call(
+        provider.abort_multipart_upload, data["key"], data["upload_id"]
+    )
+    if error:
+        return error
+    return jsonify({"message": "Upload aborted"}), 200
 
 
 @app.route("/download/<path:filename>")
@@ -391,15 +723,162 @@ def download(filename):
     if not provider:
         return jsonify({"error": "Storage not configured"}), 400
 
+    mode = download_mode(provider)
+    # Range and conditional requests need the object's size and validators
+    # up front, as does the size check in auto mode; plain proxied downloads
+    # skip the extra metadata round trip
+    info = None
+    conditional = request.range or request.if_none_match or request.if_modified_since
+    if mode == "auto" or (mode == "proxy" and conditional):
+        try:
+            info = cached_file_info(provider, filename)
+        except Exception as e:
+            logger.error(f"Error getting file info: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
+    if mode == "redirect" or (
+        mode == "auto" and info["size"] >= DOWNLOAD_REDIRECT_THRESHOLD
+    ):
+        # The storage backend serves the bytes (and any Range request)
+        # directly, so this worker is free as soon as the URL is signed
+        try:
+            url = signed_url(
+                provider,
+                filename,
+                DOWNLOAD_URL_EXPIRES_IN,
+                download_name=os.path.basename(filename),
+            )
+        except Exception as e:
+            logger.error(f"Error generating download URL: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+        response = redirect(url, code=302)
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    byte_range = None
+    if conditional:
+        if not is_resource_modified(
+            request.environ, etag=info["etag"], last_modified=info["last_modified"]
+        ):
+            response = Response(status=304)
+            set_cache_validators(response, info["etag"], info["last_modified"])
+            return response
+        byte_range = requested_byte_range(info, request.environ)
+
     try:
-        file_obj = provider.download_file(filename)
-        return send_file(
-            file_obj, download_name=os.path.basename(filename), as_attachment=True
-        )
+        file_obj = provider.download_file(filename, byte_range)
     except Exception as e:
         logger.error(f"Error downloading file: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+    mimetype = (
+        file_obj.content_type
+        or mimetypes.guess_type(filename)[0]
+        or "application/octet-stream"
+    )
+    # The body is relayed chunk by chunk; the request context (and with it
+    # the provider lease) is kept until the last chunk has been sent
+    response = Response(
+        stream_with_context(stream_download(file_obj)),
+        mimetype=mimetype,
+        direct_passthrough=True,
+    )
+    response.headers["Content-Disposition"] = content_disposition(
+        os.path.basename(filename)
+    )
+    response.accept_ranges = "bytes"
+    set_cache_validators(response, file_obj.etag, file_obj.last_modified)
+    if file_obj.content_length is not None:
+        response.content_length = file_obj.content_length
+    if byte_range:
+        response.status_code = 206
+        response.content_range = ContentRange(
+            "bytes",
+            byte_range[0],
+            byte_range[0] + file_obj.content_length,
+            file_obj.total_length,
+        )
+    return response
+
+
+def download_mode(provider):
+    """Configured download mode for the provider, falling back to proxying"""
+    override = f"DOWNLOAD_MODE_{provider.provider_type.upper()}"
+    mode = os.environ.get(override, DOWNLOAD_MODE).lower()
+    if mode not in DOWNLOAD_MODES:
+        logger.warning(f"Unknown download mode {mode!r}, proxying downloads")
+        return "proxy"
+    return mode
+
+
+def requested_byte_range(info, environ):
+    """Inclusive byte range to serve for the Range header, or None for all.
+
+    Multi-range requests are answered with the full object, which HTTP
+    permits, and a stale If-Range also falls back to the full object.
+    """
+    http_range = parse_range_header(environ.get("HTTP_RANGE"))
+    if not http_range or http_range.units != "bytes" or len(http_range.ranges) != 1:
+        return None
+    if "HTTP_IF_RANGE" in environ and is_resource_modified(
+        environ,
+        etag=info["etag"],
+        last_modified=info["last_modified"],
+        ignore_if_range=False,
+    ):
+        return None
+    span = http_range.range_for_length(info["size"])
+    if span is None:
+        raise RequestedRangeNotSatisfiable(length=info["size"])
+    return span[0], span[1] - 1
+
+
+def set_cache_validators(response, etag, last_modified):
+    if etag:
+        response.headers["ETag"] = etag
+    if last_modified:
+        response.last_modified = last_modified
+
+
+def stream_download(file_obj):
+    try:
+        yield from file_obj.iter_chunks()
+    except Exception as e:
+        # Headers are already sent, so the client only sees a truncated body
+        logger.error(f"Error streaming download: {str(e)}")
+        raise
+    finally:
+        file_obj.close()
+
+
+def is_previewable(filename):
+    """Images, PDFs and videos can be previewed in the browser"""
+    mime_type, _ = mimetypes.guess_type(filename)
+    return bool(mime_type) and (
+        mime_type.startswith("image/")
+        or mime_type == "application/pdf"
+        or mime_type.startswith("video/")
+    )
+
+
+def encode_list_cursor(prefix, last_key):
+    """Opaque /list cursor: the listing resumes strictly after ``last_key``"""
+    payload = json.dumps({"p": prefix, "k": last_key}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_list_cursor(cursor, prefix):
+    """Return the key to resume after, or raise ValueError for a bad cursor"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(payload, dict) or payload.get("p") != prefix:
+        raise ValueError("Cursor does not match the requested prefix")
+    if not isinstance(payload.get("k"), str):
+        raise ValueError("Invalid cursor")
+    return payload["k"]
+
 
 @app.route("/list")
 @login_required
@@ -408,35 +887,40 @@ def list_files():
     if not provider:
         return jsonify({"files": [], "message": "Storage not configured"}), 200
 
+    prefix = request.args.get("prefix", "")
+    # By default only immediate children are listed; recursive=true walks the
+    # whole subtree under the prefix
+    recursive = request.args.get("recursive", "false").lower() == "true"
+    # previews=false returns metadata only; URLs are then resolved lazily
+    # through /preview-urls for the rows the user actually sees
+    with_previews = request.args.get("previews", "true").lower() != "false"
     try:
-        prefix = request.args.get("prefix", "")
-        files = provider.list_files(prefix)
+        limit = int(request.args.get("limit", LIST_DEFAULT_LIMIT))
+        if not 1 <= limit <= LIST_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {LIST_MAX_LIMIT}")
+        cursor = request.args.get("cursor")
+        start_after = decode_list_cursor(cursor, prefix) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        file_data = []
-        for file in files:
+    try:
+        files, next_cursor = list_page(provider, prefix, recursive, start_after, limit)
+
+        preview_urls = {}
+        if with_previews:
             try:
-                mime_type, _ = mimetypes.guess_type(file["name"])
-                preview_url = None
-                if mime_type and (
-                    mime_type.startswith("image/")
-                    or mime_type == "application/pdf"
-                    or mime_type.startswith("video/")
-                ):
-                    preview_url = provider.get_file_url(file["name"])
-                file_data.append(
-                    {
-                        "name": file["name"],
-                        "size": file["size"],
-                        "preview_url": preview_url,
-                        "mime_type": mime_type,
-                        "type": "file",
-                    }
-                )
+                # Sign all preview URLs in one batch instead of once per file
+                preview_urls = signed_urls(provider, previewable_names(files))
             except Exception as e:
-                logger.warning(f"Error processing file {file['name']}: {str(e)}")
-                continue
+                logger.warning(f"Error generating preview URLs: {str(e)}")
+        file_data = list_entries(files, preview_urls)
 
-        return jsonify({"files": file_data}), 200
+        # Browsers revalidate with If-None-Match and get a 304 when the
+        # page is unchanged
+        response = jsonify({"files": file_data, "next_cursor": next_cursor})
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.add_etag()
+        return response.make_conditional(request)
 
     except Exception as e:
         logger.error(f"Error listing files: {str(e)}")
@@ -446,6 +930,157 @@ def list_files():
         )
 
 
+def previewable_names(files):
+    return [
+        file["name"]
+        for file in files
+        if file.get("type") != "folder" and is_previewable(file["name"])
+    ]
+
+
+def list_entries(files, preview_urls):
+    """Listing entries as returned by /list"""
+    file_data = []
+    for file in files:
+        if file.get("type") == "folder":
+            file_data.append({"name": file["name"], "type": "folder"})
+            continue
+        mime_type, _ = mimetypes.guess_type(file["name"])
+        file_data.append(
+            {
+                "name": file["name"],
+                "size": file["size"],
+                "preview_url": preview_urls.get(file["name"]),
+                "mime_type": mime_type,
+                "type": "file",
+            }
+        )
+    return file_data
+
+
+def list_page(provider, prefix, recursive, start_after, limit, provider_key=None):
+    """One page of listing entries and the cursor of the next page.
+
+    Pages are served from the listing cache when possible; writes made
+    through this app invalidate the affected folders.
+    """
+    provider_key = provider_key or current_provider_key()
+    params = (recursive, start_after, limit)
+    # Keyed before listing, so a write during the listing discards the page
+    page_key = listing_cache.page_key(provider_key, prefix, params)
+    cached = listing_cache.get(page_key)
+    if cached is not None:
+        return cached["files"], cached["next_cursor"]
+
+    if recursive:
+        entries = provider.list_files(prefix, start_after)
+    else:
+        entries = provider.list_directory(prefix, start_after)
+    # Fetch one extra entry to know whether another page exists
+    files = list(islice(entries, limit + 1))
+    next_cursor = None
+    if len(files) > limit:
+        files = files[:limit]
+        next_cursor = encode_list_cursor(prefix, files[-1]["name"])
+
+    listing_cache.set(page_key, {"files": files, "next_cursor": next_cursor})
+    return files, next_cursor
+
+
+def parse_search_args(args):
+    """Filters of a /search request; raises ValueError on malformed input"""
+
+    def optional(name, convert):
+        value = args.get(name)
+        return convert(value) if value not in (None, "") else None
+
+    limit = int(args.get("limit", SEARCH_DEFAULT_LIMIT))
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {SEARCH_MAX_LIMIT}")
+    extensions = [ext for ext in args.get("ext", "").split(",") if ext.strip()]
+    return {
+        "query": args.get("q", "").strip(),
+        "extensions": [ext.strip() for ext in extensions],
+        "prefix": args.get("prefix", ""),
+        "min_size": optional("min_size", int),
+        "max_size": optional("max_size", int),
+        "modified_after": optional("modified_after", datetime.fromisoformat),
+        "modified_before": optional("modified_before", datetime.fromisoformat),
+        "limit": limit,
+        "offset": max(0, int(args.get("offset", 0))),
+    }
+
+
+@app.route("/search")
+@login_required
+def search():
+    """Search the local metadata index of the configured bucket.
+
+    Supports substring (``q``), extension (``ext=jpg,png``), ``prefix``,
+    size range (``min_size``/``max_size`` in bytes) and modification date
+    (``modified_after``/``modified_before`` as ISO 8601) filters. The index
+    is built in the background on first use and refreshed periodically, so
+    results may lag behind the bucket.
+    """
+    if "provider_type" not in session:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    try:
+        filters = parse_search_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    building = bucket_indexer.ensure_fresh(
+        session["provider_type"], session["provider_config"]
+    )
+    provider_key = current_provider_key()
+    try:
+        results = metadata_index.search(provider_key, **filters)
+    except Exception as e:
+        logger.error(f"Error searching index: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    for result in results:
+        result["type"] = "file"
+    return (
+        jsonify(
+            {
+                "files": results,
+                "index": {
+                    "building": building,
+                    **(metadata_index.status(provider_key) or {}),
+                },
+            }
+        ),
+        200,
+    )
+
+
+@app.route("/preview-urls", methods=["POST"])
+@login_required
+def preview_urls():
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    data = request.get_json(silent=True) or {}
+    keys = data.get("keys")
+    if not isinstance(keys, list) or not all(isinstance(k, str) for k in keys):
+        return jsonify({"error": "keys must be a list of file names"}), 400
+    if len(keys) > PREVIEW_URLS_MAX_KEYS:
+        return (
+            jsonify({"error": f"At most {PREVIEW_URLS_MAX_KEYS} keys per request"}),
+            400,
+        )
+
+    try:
+        urls = signed_urls(provider, [k for k in keys if is_previewable(k)])
+        return jsonify({"urls": urls}), 200
+    except Exception as e:
+        logger.error(f"Error generating preview URLs: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/delete/<path:filename>", methods=["DELETE"])
 @login_required
 def delete(filename):
@@ -455,12 +1090,288 @@ def delete(filename):
 
     try:
         provider.delete_file(filename)
+        record_write(filename, deleted=True)
         return jsonify({"message": "File deleted successfully"}), 200
     except Exception as e:
         logger.error(f"Error deleting file: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/delete-batch", methods=["POST"])
+@login_required
+def delete_batch():
+    """Delete many files in one request.
+
+    Expects ``{"keys": [...]}`` and answers with the deleted keys and an
+    error message per key that could not be deleted.
+    """
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    keys = (request.get_json(silent=True) or {}).get("keys")
+    if not isinstance(keys, list) or not all(
+        isinstance(key, str) and key for key in keys
+    ):
+        return jsonify({"error": "keys must be a list of file names"}), 400
+    if len(keys) > DELETE_BATCH_MAX_KEYS:
+        return (
+            jsonify({"error": f"At most {DELETE_BATCH_MAX_KEYS} keys per request"}),
+            400,
+        )
+
+    try:
+        results = provider.delete_files(keys)
+    except Exception as e:
+        logger.error(f"Error deleting files: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    deleted = [key for key, error in results.items() if error is None]
+    errors = {key: error for key, error in results.items() if error is not None}
+    record_deletes(deleted)
+    if errors:
+        logger.warning(f"Failed to delete {len(errors)} of {len(results)} files")
+    return jsonify({"deleted": deleted, "errors": errors}), 200
+
+
+@app.route("/create_folder", methods=["POST"])
+@login_required
+def create_folder():
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    folder = normalize_folder((request.get_json(silent=True) or {}).get("folder_name"))
+    if not folder:
+        return jsonify({"error": "Invalid folder name"}), 400
+
+    try:
+        provider.create_folder(folder)
+        record_write(folder)
+        return jsonify({"message": "Folder created successfully", "folder": folder})
+    except Exception as e:
+        logger.error(f"Error creating folder: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/delete_folder", methods=["POST"])
+@login_required
+def delete_folder():
+    """Recursively delete a folder, streaming progress as NDJSON"""
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    folder = normalize_folder((request.get_json(silent=True) or {}).get("folder"))
+    if not folder:
+        return jsonify({"error": "Invalid folder name"}), 400
+
+    def finish():
+        record_write(folder, subtree=True, deleted=True)
+
+    return folder_progress_response(provider.delete_folder(folder), finish)
+
+
+@app.route("/copy", methods=["POST"])
+@login_required
+def copy():
+    """Server-side copy of a file, or of a folder when the source ends in "/" """
+    return copy_or_move(move=False)
+
+
+@app.route("/move", methods=["POST"])
+@login_required
+def move():
+    """Server-side move (rename) of a file or folder"""
+    return copy_or_move(move=True)
+
+
+def copy_or_move(move):
+    provider = get_current_provider()
+    if not provider:
+        return jsonify({"error": "Storage not configured"}), 400
+
+    data = request.get_json(silent=True) or {}
+    source, destination = data.get("source"), data.get("destination")
+    if not isinstance(source, str) or not isinstance(destination, str):
+        return jsonify({"error": "Missing source or destination"}), 400
+
+    if source.endswith("/"):
+        source, destination = normalize_folder(source), normalize_folder(destination)
+        if not source or not destination:
+            return jsonify({"error": "Invalid folder name"}), 400
+        if destination.startswith(source) or source.startswith(destination):
+            return jsonify({"error": "Folders must not contain each other"}), 400
+
+        def finish():
+            record_write(destination, subtree=True)
+            if move:
+                record_write(source, subtree=True, deleted=True)
+
+        operation = provider.move_folder if move else provider.copy_folder
+        return folder_progress_response(operation(source, destination), finish)
+
+    source, destination = source.strip("/"), destination.strip("/")
+    if not source or not destination or source == destination:
+        return jsonify({"error": "Invalid source or destination"}), 400
+    try:
+        if move:
+            provider.move_file(source, destination)
+        else:
+            provider.copy_file(source, destination)
+    except NotImplementedError as e:
+        return jsonify({"error": str(e)}), 501
+    except Exception as e:
+        logger.error(f"Error copying {source} to {destination}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        # A failed move may still have created the copy
+        record_write(destination)
+    if move:
+        record_write(source, deleted=True)
+    message = "File moved successfully" if move else "File copied successfully"
+    return jsonify({"message": message, "destination": destination})
+
+
+def normalize_folder(folder):
+    """``folder`` as a folder key ending in "/", or None if it is unusable.
+
+    The bucket root is rejected so a request can never empty a bucket.
+    """
+    if not isinstance(folder, str):
+        return None
+    parts = [part for part in folder.split("/") if part]
+    if not parts or any(part in (".", "..") for part in parts):
+        return None
+    return "/".join(parts) + "/"
+
+
+def folder_progress_response(results, finish):
+    """Stream the per-key results of a folder operation as NDJSON progress.
+
+    Each line reports the running ``done``/``failed`` counts and any new
+    ``errors``; the last line also has ``"finished": true``. ``finish`` runs
+    once the operation ends, even if the client disconnects midway.
+    """
+    return Response(
+        stream_with_context(stream_folder_progress(results, finish)),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+def stream_folder_progress(results, finish):
+    progress = {"done": 0, "failed": 0, "errors": {}}
+    reported = 0
+    last_report = time.monotonic()
+    try:
+        for chunk_results in results:
+            for key, error in chunk_results.items():
+                if error is None:
+                    progress["done"] += 1
+                    continue
+                progress["failed"] += 1
+                if reported < FOLDER_OPERATION_MAX_ERRORS:
+                    progress["errors"][key] = error
+                    reported += 1
+            if time.monotonic() - last_report >= FOLDER_PROGRESS_INTERVAL:
+                yield json.dumps(progress) + "\n"
+                progress["errors"] = {}
+                last_report = time.monotonic()
+    except Exception as e:
+        logger.error(f"Error in folder operation: {str(e)}")
+        progress["error"] = str(e)
+    finally:
+        finish()
+    if progress["failed"]:
+        logger.warning(f"Folder operation failed for {progress['failed']} keys")
+    yield json.dumps(dict(progress, finished=True)) + "\n"
+
+
+@app.route("/transfers", methods=["GET", "POST"])
+@login_required
+def transfers():
+    """List transfers, or start copying objects to another provider.
+
+    The POST body is ``{"destination": {"provider_type", "config"},
+    "source_prefix", "destination_prefix", "workers", "verify"}``. The
+    source defaults to the configured provider and may be given like the
+    destination. Both configs are validated like those of /configure.
+    Submitting a transfer again resumes it. Transfers are only visible to
+    the storage configuration that started them.
+    """
+    owner = current_provider_key()
+    if request.method == "GET":
+        return jsonify({"transfers": transfer_manager.list(owner)})
+
+    data = request.get_json(silent=True) or {}
+    destination = data.get("destination") or {}
+    source = data.get("source") or {
+        "provider_type": session["provider_type"],
+        "config": session["provider_config"],
+    }
+    configs = []
+    for side in (source, destination):
+        if not isinstance(side, dict) or not isinstance(side.get("config"), dict):
+            return jsonify({"error": "provider_type and config are required"}), 400
+        try:
+            configs.append(
+                provider_credentials(side.get("provider_type"), side["config"])
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    try:
+        workers = int(data.get("workers", TRANSFER_WORKERS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "workers must be a number"}), 400
+
+    try:
+        job_id = transfer_manager.start(
+            owner,
+            source["provider_type"],
+            configs[0],
+            destination["provider_type"],
+            configs[1],
+            source_prefix=str(data.get("source_prefix", "")),
+            destination_prefix=str(data.get("destination_prefix", "")),
+            workers=min(max(1, workers), TRANSFER_MAX_WORKERS),
+            verify=bool(data.get("verify", True)),
+        )
+    except OSError as e:
+        logger.error(f"Error starting transfer: {str(e)}")
+        return jsonify({"error": "Could not save the transfer state"}), 500
+    return jsonify({"id": job_id}), 202
+
+
+@app.route("/transfers/<job_id>")
+@login_required
+def transfer_progress(job_id):
+    progress = transfer_manager.progress(job_id, current_provider_key())
+    if progress is None:
+        return jsonify({"error": "Transfer not found"}), 404
+    return jsonify(progress)
+
+
+@app.route("/transfers/<job_id>/cancel", methods=["POST"])
+@login_required
+def cancel_transfer(job_id):
+    if not transfer_manager.cancel(job_id, current_provider_key()):
+        return jsonify({"error": "Transfer not found"}), 404
+    return jsonify({"message": "Transfer cancelled"})
+
+
+@app.route("/transfers/<job_id>/resume", methods=["POST"])
+@login_required
+def resume_transfer(job_id):
+    try:
+        resumed = transfer_manager.resume(job_id, current_provider_key())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    if not resumed:
+        return jsonify({"error": "Transfer not found"}), 404
+    return jsonify({"id": job_id}), 202
+
+
 @app.route("/logout")
 def logout():
     session.clear()
@@ -476,7 +1387,7 @@ def share_file(filename):
 
     try:
         # Generate a URL that expires in 7 days (604800 seconds)
-        url = provider.get_file_url(filename, expires_in=604800)
+        url = signed_url(provider, filename, expires_in=604800)
         return jsonify({"url": url}), 200
     except Exception as e:
         logger.error(f"Error generating share link: {str(e)}")
@@ -0,0 +1,557 @@
+import json
+import logging
+import mimetypes
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from http.cookies import SimpleCookie
+from typing import AsyncIterator, NamedTuple, Optional
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import (
+    generate_etag,
+    http_date,
+    is_resource_modified,
+    parse_etags,
+    parse_options_header,
+    quote_etag,
+)
+
+from app import (
+    DOWNLOAD_REDIRECT_THRESHOLD,
+    DOWNLOAD_URL_EXPIRES_IN,
+    LIST_DEFAULT_LIMIT,
+    LIST_MAX_LIMIT,
+    STREAMING_UPLOADS,
+    app,
+    decode_list_cursor,
+    download_mode,
+    list_entries,
+    list_page,
+    previewable_names,
+    record_write,
+    requested_byte_range,
+    signed_url,
+    signed_urls,
+    upload_key,
+)
+from async_providers import (
+    AsyncStorageProvider,
+    aio_s3_clients,
+    async_executor,
+    lease_async_provider,
+    run_blocking,
+)
+from cache import metadata_cache
+from dedup import DEDUP_UPLOADS, ContentHasher, dedup_index
+from metrics import observe_request
+from provider_registry import provider_cache_key, provider_registry
+from streaming import AsyncMultipartUploadStream, content_disposition
+
+logger = logging.getLogger(__name__)
+
+# Share links stay valid for 7 days, as in the Flask route
+SHARE_URL_EXPIRES_IN = 604800
+# Threads that run the Flask routes without an async handler. Each request
+# holds one for its duration, and its body is streamed to Flask, not
+# buffered first.
+ASYNC_FLASK_THREADS = int(os.environ.get("ASYNC_FLASK_THREADS", 32))
+
+
+class Storage(NamedTuple):
+    """Provider configuration of the requesting session"""
+
+    provider_type: str
+    provider_config: dict
+    provider_key: str
+
+
+class Request:
+    """The parts of an ASGI HTTP request the async handlers use"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope["method"]
+        self.headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope["headers"]
+        }
+        self.args = dict(
+            parse_qsl(scope.get("query_string", b"").decode("latin-1"), True)
+        )
+        # WSGI-style view of the headers for werkzeug's conditional helpers
+        self.environ = {
+            "REQUEST_METHOD": self.method,
+            **{
+                "HTTP_" + name.upper().replace("-", "_"): value
+                for name, value in self.headers.items()
+            },
+        }
+
+    def cookie(self, name: str) -> Optional[str]:
+        cookies = SimpleCookie()
+        try:
+            cookies.load(self.headers.get("cookie", ""))
+        except Exception:
+            return None
+        return cookies[name].value if name in cookies else None
+
+    def storage(self) -> Optional[Storage]:
+        """Storage of a logged-in session, read from Flask's signed cookie"""
+        value = self.cookie(app.config["SESSION_COOKIE_NAME"])
+        serializer = app.session_interface.get_signing_serializer(app)
+        if not value or serializer is None:
+            return None
+        try:
+            session = serializer.loads(
+                value, max_age=int(app.permanent_session_lifetime.total_seconds())
+            )
+        except BadSignature:
+            return None
+        if "authenticated" not in session or "provider_type" not in session:
+            return None
+        return Storage(
+            session["provider_type"],
+            session["provider_config"],
+            provider_cache_key(session["provider_type"], session["provider_config"]),
+        )
+
+    async def body(self) -> AsyncIterator[bytes]:
+        while True:
+            message = await self.receive()
+            if message["type"] == "http.disconnect":
+                raise ConnectionError("Client disconnected")
+            if message.get("body"):
+                yield message["body"]
+            if not message.get("more_body"):
+                return
+
+
+class ObservedSend:
+    """ASGI send callable that notes the response status for metrics"""
+
+    def __init__(self, send):
+        self.send = send
+        self.status: Optional[int] = None
+
+    async def __call__(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+        await self.send(message)
+
+
+async def respond(send, status: int, body: bytes = b"", headers=()) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (name.encode("latin-1"), str(value).encode("latin-1"))
+                for name, value in headers
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def respond_json(send, payload, status: int = 200, headers=()) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    await respond(
+        send,
+        status,
+        body,
+        [("Content-Type", "application/json"), ("Content-Length", len(body))]
+        + list(headers),
+    )
+
+
+@asynccontextmanager
+async def leased_provider(storage: Storage):
+    """Async adapter for a provider leased from the registry, or None when
+    the provider cannot be created"""
+    try:
+        provider = await run_blocking(
+            provider_registry.acquire, storage.provider_type, storage.provider_config
+        )
+    except Exception as e:
+        logger.error(f"Error creating storage provider: {str(e)}")
+        yield None
+        return
+    try:
+        async with lease_async_provider(
+            provider, storage.provider_config
+        ) as async_provider:
+            yield async_provider
+    finally:
+        provider_registry.release(provider)
+
+
+async def cached_file_info(
+    provider: AsyncStorageProvider, storage: Storage, filename: str
+) -> dict:
+    info = await run_blocking(metadata_cache.get, storage.provider_key, filename)
+    if info is None:
+        info = await provider.get_file_info(filename)
+        await run_blocking(metadata_cache.set, storage.provider_key, filename, info)
+    return info
+
+
+async def list_files(request: Request, send, storage: Storage) -> None:
+    args = request.args
+    prefix = args.get("prefix", "")
+    recursive = args.get("recursive", "false").lower() == "true"
+    with_previews = args.get("previews", "true").lower() != "false"
+    try:
+        limit = int(args.get("limit", LIST_DEFAULT_LIMIT))
+        if not 1 <= limit <= LIST_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {LIST_MAX_LIMIT}")
+        cursor = args.get("cursor")
+        start_after = decode_list_cursor(cursor, prefix) if cursor else None
+    except ValueError as e:
+        return await respond_json(send, {"error": str(e)}, 400)
+
+    async with leased_provider(storage) as provider:
+        if provider is None:
+            return await respond_json(
+                send, {"files": [], "message": "Storage not configured"}
+            )
+        try:
+            # Listings are paged and cached by the blocking provider
+            files, next_cursor = await run_blocking(
+                list_page,
+                provider.provider,
+                prefix,
+                recursive,
+                start_after,
+                limit,
+                storage.provider_key,
+            )
+            preview_urls = {}
+            if with_previews:
+                try:
+                    preview_urls = await run_blocking(
+                        signed_urls,
+                        provider.provider,
+                        previewable_names(files),
+                        3600,
+                        storage.provider_key,
+                    )
+                except Exception as e:
+                    logger.warning(f"Error generating preview URLs: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error listing files: {str(e)}")
+            return await respond_json(
+                send,
+                {"error": "An unexpected error occurred", "details": str(e)},
+                500,
+            )
+
+    body = json.dumps(
+        {"files": list_entries(files, preview_urls), "next_cursor": next_cursor}
+    ).encode("utf-8")
+    etag = generate_etag(body)
+    headers = [("Cache-Control", "private, no-cache"), ("ETag", quote_etag(etag))]
+    if parse_etags(request.headers.get("if-none-match")).contains(etag):
+        return await respond(send, 304, headers=headers)
+    await respond(
+        send,
+        200,
+        body,
+        [("Content-Type", "application/json"), ("Content-Length", len(body))] + headers,
+    )
+
+
+def cache_validators(etag, last_modified):
+    headers = []
+    if etag:
+        headers.append(("ETag", etag))
+    if last_modified:
+        headers.append(("Last-Modified", http_date(last_modified)))
+    return headers
+
+
+async def download(request: Request, send, storage: Storage, filename: str) -> None:
+    async with leased_provider(storage) as provider:
+        if provider is None:
+            return await respond_json(send, {"error": "Storage not configured"}, 400)
+
+        mode = download_mode(provider.provider)
+        info = None
+        conditional = any(
+            name in request.headers
+            for name in ("range", "if-none-match", "if-modified-since")
+        )
+        if mode == "auto" or (mode == "proxy" and conditional):
+            try:
+                info = await cached_file_info(provider, storage, filename)
+            except Exception as e:
+                logger.error(f"Error getting file info: {str(e)}")
+                return await respond_json(send, {"error": str(e)}, 500)
+
+        if mode == "redirect" or (
+            mode == "auto" and info["size"] >= DOWNLOAD_REDIRECT_THRESHOLD
+        ):
+            try:
+                url = await run_blocking(
+                    signed_url,
+                    provider.provider,
+                    filename,
+                    DOWNLOAD_URL_EXPIRES_IN,
+                    os.path.basename(filename),
+                    storage.provider_key,
+                )
+            except Exception as e:
+                logger.error(f"Error generating download URL: {str(e)}")
+                return await respond_json(send, {"error": str(e)}, 500)
+            return await respond(
+                send, 302, headers=[("Location", url), ("Cache-Control", "no-store")]
+            )
+
+        byte_range = None
+        if conditional:
+            if not is_resource_modified(
+                request.environ, etag=info["etag"], last_modified=info["last_modified"]
+            ):
+                return await respond(
+                    send,
+                    304,
+                    headers=cache_validators(info["etag"], info["last_modified"]),
+                )
+            try:
+                byte_range = requested_byte_range(info, request.environ)
+            except RequestedRangeNotSatisfiable:
+                return await respond(
+                    send, 416, headers=[("Content-Range", f"bytes */{info['size']}")]
+                )
+
+        try:
+            stream = await provider.download_file(filename, byte_range)
+        except Exception as e:
+            logger.error(f"Error downloading file: {str(e)}")
+            return await respond_json(send, {"error": str(e)}, 500)
+
+        try:
+            await send_download(send, filename, stream, byte_range)
+        finally:
+            await stream.aclose()
+
+
+async def send_download(send, filename, stream, byte_range) -> None:
+    headers = [
+        (
+            "Content-Type",
+            stream.content_type
+            or mimetypes.guess_type(filename)[0]
+            or "application/octet-stream",
+        ),
+        ("Content-Disposition", content_disposition(os.path.basename(filename))),
+        ("Accept-Ranges", "bytes"),
+    ] + cache_validators(stream.etag, stream.last_modified)
+    if stream.content_length is not None:
+        headers.append(("Content-Length", stream.content_length))
+    status = 200
+    if byte_range:
+        status = 206
+        last = byte_range[0] + stream.content_length - 1
+        headers.append(
+            ("Content-Range", f"bytes {byte_range[0]}-{last}/{stream.total_length}")
+        )
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (name.encode("latin-1"), str(value).encode("latin-1"))
+                for name, value in headers
+            ],
+        }
+    )
+    try:
+        async for chunk in stream:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    except Exception as e:
+        # Headers are already sent, so the client only sees a truncated body
+        logger.error(f"Error streaming download: {str(e)}")
+        raise
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def upload(request: Request, send, storage: Storage) -> None:
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if not STREAMING_UPLOADS or content_type != "multipart/form-data":
+        # Spooled uploads are parsed by Flask, which records their metrics
+        if isinstance(send, ObservedSend):
+            send = send.send
+        return await flask_application(request.scope, request.receive, send)
+    boundary = options.get("boundary")
+    if not boundary:
+        return await respond_json(send, {"error": "Missing multipart boundary"}, 400)
+
+    stream = AsyncMultipartUploadStream(request.body(), boundary.encode("latin-1"))
+    try:
+        if not await stream.next_file():
+            return await respond_json(send, {"error": "No file part"}, 400)
+    except ValueError as e:
+        return await respond_json(send, {"error": str(e)}, 400)
+    if not stream.filename:
+        return await respond_json(send, {"error": "No selected file"}, 400)
+
+    folder = stream.fields.get("folder") or request.args.get("folder", "")
+    filename = upload_key(stream.filename, folder)
+    hasher = ContentHasher() if DEDUP_UPLOADS else None
+
+    async def read(size: int) -> bytes:
+        chunk = await stream.read(size)
+        if hasher is not None:
+            hasher.update(chunk)
+        return chunk
+
+    content_length = request.headers.get("content-length")
+    async with leased_provider(storage) as provider:
+        if provider is None:
+            return await respond_json(send, {"error": "Storage not configured"}, 400)
+        try:
+            await provider.upload_file(
+                read, filename, int(content_length) if content_length else None
+            )
+            await run_blocking(
+                record_write,
+                filename,
+                False,
+                False,
+                None,
+                (storage.provider_type, storage.provider_config),
+            )
+            if hasher is not None:
+                await run_blocking(
+                    dedup_index.record_upload,
+                    provider.provider,
+                    storage.provider_key,
+                    filename,
+                    hasher.hexdigest(),
+                    hasher.size,
+                )
+        except Exception as e:
+            logger.error(f"Error uploading file: {str(e)}")
+            return await respond_json(send, {"error": str(e)}, 500)
+    await respond_json(send, {"message": "File uploaded successfully"})
+
+
+async def share_file(request: Request, send, storage: Storage, filename: str) -> None:
+    async with leased_provider(storage) as provider:
+        if provider is None:
+            return await respond_json(send, {"error": "Storage not configured"}, 400)
+        try:
+            url = await run_blocking(
+                signed_url,
+                provider.provider,
+                filename,
+                SHARE_URL_EXPIRES_IN,
+                None,
+                storage.provider_key,
+            )
+        except Exception as e:
+            logger.error(f"Error generating share link: {str(e)}")
+            return await respond_json(send, {"error": str(e)}, 500)
+    await respond_json(send, {"url": url})
+
+
+async def delete(request: Request, send, storage: Storage, filename: str) -> None:
+    async with leased_provider(storage) as provider:
+        if provider is None:
+            return await respond_json(send, {"error": "Storage not configured"}, 400)
+        try:
+            await provider.delete_file(filename)
+            await run_blocking(
+                record_write,
+                filename,
+                False,
+                True,
+                None,
+                (storage.provider_type, storage.provider_config),
+            )
+        except Exception as e:
+            logger.error(f"Error deleting file: {str(e)}")
+            return await respond_json(send, {"error": str(e)}, 500)
+    await respond_json(send, {"message": "File deleted successfully"})
+
+
+# Method, Flask rule (the route label in metrics), path pattern and handler
+ROUTES = [
+    ("GET", "/list", re.compile(r"/list"), list_files),
+    (
+        "GET",
+        "/download/<path:filename>",
+        re.compile(r"/download/(?P<filename>.+)"),
+        download,
+    ),
+    ("POST", "/upload", re.compile(r"/upload"), upload),
+    (
+        "GET",
+        "/share/<path:filename>",
+        re.compile(r"/share/(?P<filename>.+)"),
+        share_file,
+    ),
+    (
+        "DELETE",
+        "/delete/<path:filename>",
+        re.compile(r"/delete/(?P<filename>.+)"),
+        delete,
+    ),
+]
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await aio_s3_clients.close()
+            async_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send) -> None:
+    """ASGI entry point (``uvicorn asgi:application``).
+
+    The I/O-bound routes in ROUTES run on the event loop, so a slow transfer
+    holds no thread while it waits on the client. Every other request, and
+    any that needs Flask's session handling (no session yet, plain-HTTP
+    redirects), is passed to the Flask app unchanged.
+    """
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    if scope["type"] == "http" and (scope.get("scheme") == "https" or app.debug):
+        for method, rule, pattern, handler in ROUTES:
+            match = pattern.fullmatch(scope["path"])
+            if match is None or scope["method"] != method:
+                continue
+            request = Request(scope, receive)
+            storage = request.storage()
+            if storage is None:
+                # Flask redirects to the login page or auto-authenticates
+                break
+            started = time.perf_counter()
+            observed = ObservedSend(send)
+            try:
+                return await handler(request, observed, storage, **match.groupdict())
+            finally:
+                # Also when the client went away mid-transfer
+                if observed.status is not None:
+                    observe_request(
+                        rule, method, observed.status, time.perf_counter() - started
+                    )
+
+    await flask_application(scope, receive, send)
+
+
+# Create global instances
+flask_application = WSGIMiddleware(app, workers=ASYNC_FLASK_THREADS)
@@ -0,0 +1,398 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import count_bytes, provider_label, timed_operation, transfer_in_flight
+from multipart import (
+    AioS3MultipartTarget,
+    AsyncMultipartTarget,
+    ThreadedMultipartTarget,
+    async_multipart_upload,
+)
+from provider_registry import DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_SIZE
+from storage_providers import S3CompatibleProvider, StorageProvider
+from streaming import DOWNLOAD_CHUNK_SIZE
+
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session
+except ImportError:  # Optional: S3 calls are then run on threads as well
+    AioConfig = None
+    get_session = None
+
+logger = logging.getLogger(__name__)
+
+# Threads that run blocking provider calls (b2sdk, google-cloud-storage and
+# boto3 without aiobotocore). A thread is held for one call or one chunk at
+# a time, never while waiting on a slow client.
+ASYNC_PROVIDER_THREADS = int(os.environ.get("ASYNC_PROVIDER_THREADS", 64))
+
+AsyncRead = Callable[[int], Awaitable[bytes]]
+
+
+async def run_blocking(function: Callable, *args) -> Any:
+    """Run a blocking function on the provider thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        async_executor, functools.partial(function, *args)
+    )
+
+
+class AsyncDownload:
+    """Body and metadata of a download, read with ``async for``"""
+
+    def __init__(
+        self,
+        chunks: AsyncIterator[bytes],
+        close: Callable[[], Awaitable[None]],
+        content_length: Optional[int] = None,
+        total_length: Optional[int] = None,
+        content_type: Optional[str] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[datetime] = None,
+    ):
+        self._chunks = chunks
+        self._close = close
+        self.content_length = content_length
+        self.total_length = total_length
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._chunks
+
+    async def aclose(self) -> None:
+        try:
+            await self._close()
+        except Exception as e:
+            logger.warning(f"Error closing download stream: {str(e)}")
+
+
+class _BlockingReader:
+    """File-like view of an async body for providers without a multipart
+    target; reads block the calling worker thread, not the event loop"""
+
+    def __init__(self, read: AsyncRead, loop: asyncio.AbstractEventLoop):
+        self._read = read
+        self._loop = loop
+
+    def read(self, size: int = -1) -> bytes:
+        return asyncio.run_coroutine_threadsafe(self._read(size), self._loop).result()
+
+
+class AsyncStorageProvider:
+    """Async adapter for any :class:`StorageProvider`.
+
+    Blocking calls run on the shared thread pool. Downloads are pulled one
+    chunk per call and uploads are assembled into parts on the event loop,
+    so a transfer to or from a slow client costs no thread while it waits.
+    """
+
+    def __init__(self, provider: StorageProvider):
+        self.provider = provider
+
+    async def get_file_info(self, filename: str) -> dict:
+        return await run_blocking(self.provider.get_file_info, filename)
+
+    async def delete_file(self, filename: str) -> None:
+        await run_blocking(self.provider.delete_file, filename)
+
+    async def download_file(
+        self, filename: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> AsyncDownload:
+        stream = await run_blocking(self.provider.download_file, filename, byte_range)
+        chunks = stream.iter_chunks()
+
+        async def read_chunks():
+            while True:
+                chunk = await run_blocking(next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+
+        return AsyncDownload(
+            read_chunks(),
+            functools.partial(run_blocking, stream.close),
+            content_length=stream.content_length,
+            total_length=stream.total_length,
+            content_type=stream.content_type,
+            etag=stream.etag,
+            last_modified=stream.last_modified,
+        )
+
+    def multipart_target(self, filename: str) -> AsyncMultipartTarget:
+        return ThreadedMultipartTarget(
+            self.provider.multipart_target(filename), run_blocking
+        )
+
+    async def upload_file(
+        self, read: AsyncRead, filename: str, size: Optional[int] = None
+    ) -> None:
+        """Upload the body returned by ``read(n)`` in parallel parts"""
+        try:
+            target = self.multipart_target(filename)
+        except NotImplementedError:
+            reader = _BlockingReader(read, asyncio.get_running_loop())
+            await run_blocking(self.provider.upload_file, reader, filename, size)
+            return
+
+        # Parts bypass the instrumented upload_file, so they are counted here
+        provider_type = provider_label(self.provider)
+        count = count_bytes(provider_type, "upload")
+
+        async def counted_read(size: int) -> bytes:
+            chunk = await read(size)
+            count(len(chunk))
+            return chunk
+
+        done = transfer_in_flight(provider_type, "upload")
+        try:
+            with timed_operation(provider_type, "upload_file"):
+                await async_multipart_upload(
+                    counted_read, target, self.provider.upload_tuning, size
+                )
+        finally:
+            done()
+
+
+class AioS3Provider(AsyncStorageProvider):
+    """Native async calls for S3-compatible providers through aiobotocore.
+
+    Object reads, writes and deletes go through ``client``; listing and URL
+    signing stay on the blocking provider, as they are short calls.
+    """
+
+    def __init__(self, provider: S3CompatibleProvider, client):
+        super().__init__(provider)
+        self.client = client
+        self.bucket = provider.bucket
+        self.provider_type = provider_label(provider)
+
+    async def get_file_info(self, filename: str) -> dict:
+        with timed_operation(self.provider_type, "get_file_info"):
+            response = await self.client.head_object(Bucket=self.bucket, Key=filename)
+        return {
+            "name": filename,
+            "size": response["ContentLength"],
+            "content_type": response.get("ContentType"),
+            "etag": response.get("ETag"),
+            "last_modified": response.get("LastModified"),
+        }
+
+    async def delete_file(self, filename: str) -> None:
+        with timed_operation(self.provider_type, "delete_file"):
+            await self.client.delete_object(Bucket=self.bucket, Key=filename)
+
+    async def download_file(
+        self, filename: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> AsyncDownload:
+        params = {"Bucket": self.bucket, "Key": filename}
+        if byte_range:
+            params["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        with timed_operation(self.provider_type, "download_file"):
+            response = await self.client.get_object(**params)
+        body = response["Body"]
+        total_length = None
+        if response.get("ContentRange"):
+            total_length = int(response["ContentRange"].rsplit("/", 1)[1])
+        count = count_bytes(self.provider_type, "download")
+        done = transfer_in_flight(self.provider_type, "download")
+
+        async def read_chunks():
+            async for chunk in body.iter_chunks(DOWNLOAD_CHUNK_SIZE):
+                count(len(chunk))
+                yield chunk
+
+        async def close():
+            try:
+                body.close()
+            finally:
+                done()
+
+        return AsyncDownload(
+            read_chunks(),
+            close,
+            content_length=response.get("ContentLength"),
+            total_length=total_length,
+            content_type=response.get("ContentType"),
+            etag=response.get("ETag"),
+            last_modified=response.get("LastModified"),
+        )
+
+    def multipart_target(self, filename: str) -> AsyncMultipartTarget:
+        return AioS3MultipartTarget(self.client, self.bucket, filename)
+
+
+class _PooledClient:
+    __slots__ = ("context", "client", "last_used", "leases")
+
+    def __init__(self, context, client):
+        self.context = context
+        self.client = client
+        self.last_used = time.monotonic()
+        self.leases = 0
+
+
+class AioS3ClientPool:
+    """aiobotocore clients shared by all requests of the event loop, one per
+    endpoint and credentials.
+
+    Like the :class:`~provider_registry.ProviderRegistry`, the pool keeps at
+    most ``max_size`` idle clients and closes those unused for
+    ``idle_timeout`` seconds; a client evicted while leased is closed when
+    its last lease is released.
+    """
+
+    def __init__(
+        self, max_size: int = DEFAULT_MAX_SIZE, idle_timeout: int = DEFAULT_IDLE_TIMEOUT
+    ):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._clients: "OrderedDict[str, _PooledClient]" = OrderedDict()
+        # Clients evicted while a request still held them; closed on release
+        self._retired: Dict[int, _PooledClient] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self, provider: S3CompatibleProvider, config: dict):
+        """Client for ``provider``, signed with the keys of its registry
+        ``config`` and marked as in use until released"""
+        meta = provider.client.meta
+        access_key, secret_key = config["access_key"], config["secret_key"]
+        # AWS clients are built without an endpoint so that buckets are
+        # addressed virtual-host style, as by boto3
+        endpoint_url = None if provider.provider_type == "aws" else meta.endpoint_url
+        key = hashlib.sha256(
+            "\0".join(
+                [
+                    endpoint_url or "",
+                    meta.region_name or "",
+                    access_key,
+                    secret_key,
+                ]
+            ).encode("utf-8")
+        ).hexdigest()
+        entry = self._checkout(key)
+        if entry is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                entry = self._checkout(key)
+                if entry is None:
+                    client_config = meta.config
+                    context = get_session().create_client(
+                        "s3",
+                        region_name=meta.region_name,
+                        endpoint_url=endpoint_url,
+                        aws_access_key_id=access_key,
+                        aws_secret_access_key=secret_key,
+                        config=AioConfig(
+                            signature_version=client_config.signature_version,
+                            s3=client_config.s3,
+                            max_pool_connections=client_config.max_pool_connections,
+                        ),
+                    )
+                    entry = _PooledClient(context, await context.__aenter__())
+                    entry.leases = 1
+                    self._clients[key] = entry
+        await self._close_all(self._collect_evictions())
+        return entry.client
+
+    async def release(self, client) -> None:
+        """Return a client obtained from :meth:`acquire` to the pool"""
+        for entry in self._clients.values():
+            if entry.client is client:
+                entry.leases = max(0, entry.leases - 1)
+                entry.last_used = time.monotonic()
+                break
+        else:
+            entry = self._retired.get(id(client))
+            if entry is None:
+                return
+            entry.leases = max(0, entry.leases - 1)
+            if entry.leases == 0:
+                del self._retired[id(client)]
+                await self._close_all([entry])
+            return
+        await self._close_all(self._collect_evictions())
+
+    @asynccontextmanager
+    async def lease(self, provider: S3CompatibleProvider, config: dict):
+        client = await self.acquire(provider, config)
+        try:
+            yield client
+        finally:
+            await self.release(client)
+
+    async def close(self) -> None:
+        entries = list(self._clients.values()) + list(self._retired.values())
+        self._clients.clear()
+        self._retired.clear()
+        await self._close_all(entries)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def _checkout(self, key: str) -> Optional[_PooledClient]:
+        entry = self._clients.get(key)
+        if entry is None:
+            return None
+        entry.leases += 1
+        entry.last_used = time.monotonic()
+        self._clients.move_to_end(key)
+        return entry
+
+    def _collect_evictions(self) -> List[_PooledClient]:
+        """Drop idle and over-capacity clients, returning those to close"""
+        now = time.monotonic()
+        evicted = []
+        for key in list(self._clients):
+            entry = self._clients[key]
+            idle = now - entry.last_used > self.idle_timeout
+            # Least recently used clients come first; busy ones are kept
+            over_capacity = len(self._clients) > self.max_size and not entry.leases
+            if not (over_capacity or idle):
+                continue
+            del self._clients[key]
+            if entry.leases:
+                self._retired[id(entry.client)] = entry
+            else:
+                evicted.append(entry)
+        return evicted
+
+    @staticmethod
+    async def _close_all(entries: List[_PooledClient]) -> None:
+        for entry in entries:
+            try:
+                await entry.context.__aexit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Error closing S3 client: {str(e)}")
+
+
+@asynccontextmanager
+async def lease_async_provider(
+    provider: StorageProvider, config: dict
+) -> AsyncIterator[AsyncStorageProvider]:
+    """Async adapter for a provider leased with ``config``: native for
+    S3-compatible providers when aiobotocore is installed, thread-offloaded
+    otherwise"""
+    if get_session is not None and isinstance(provider, S3CompatibleProvider):
+        async with aio_s3_clients.lease(provider, config) as client:
+            yield AioS3Provider(provider, client)
+    else:
+        yield AsyncStorageProvider(provider)
+
+
+# Create global instances
+async_executor = ThreadPoolExecutor(
+    max_workers=ASYNC_PROVIDER_THREADS, thread_name_prefix="async-provider"
+)
+aio_s3_clients = AioS3ClientPool()
@@ -0,0 +1,550 @@
+import datetime
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from metrics import instrument_cache
+
+logger = logging.getLogger(__name__)
+
+# "memory" (per process), "sqlite" (shared by the workers of one host) or
+# "redis" (shared by every host that can reach the server)
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+# SQLite database path or redis:// URL
+CACHE_URL = os.environ.get("CACHE_URL", "")
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+LIST_CACHE_TTL = int(os.environ.get("LIST_CACHE_TTL", 60))
+METADATA_CACHE_TTL = int(os.environ.get("METADATA_CACHE_TTL", 30))
+# A cached signed URL is reused only while at least this share of its
+# lifetime remains
+URL_CACHE_MIN_REMAINING = float(os.environ.get("URL_CACHE_MIN_REMAINING", 0.5))
+
+# Generation tokens only need to outlive the entries keyed by them
+GENERATION_TTL = 24 * 60 * 60
+
+DEFAULT_SQLITE_PATH = os.path.join(tempfile.gettempdir(), "s3filesharegui-cache.db")
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a JSON-like value, in bytes"""
+    return len(json.dumps(value, default=str))
+
+
+class _CacheEntry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: Any, expires_at: Optional[float], size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class CacheBackend(ABC):
+    """Key-value store behind the listing, URL and metadata caches.
+
+    Values are JSON-compatible. Backends never raise on lookup or store
+    failures: a broken cache only costs extra requests to the provider.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        pass
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Values of every key that is present"""
+        found = {key: self.get(key) for key in keys}
+        return {key: value for key, value in found.items() if value is not None}
+
+    @abstractmethod
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: Optional[float] = None,
+        size: Optional[int] = None,
+    ) -> None:
+        """Store ``value`` for ``ttl`` seconds, or the backend default if None"""
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class TTLCache(CacheBackend):
+    """Thread-safe in-process LRU cache with per-entry expiry and a memory budget.
+
+    Entries are evicted least recently used first whenever the estimated size
+    of all values exceeds ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int, default_ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._get(key, time.monotonic())
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            found = {key: self._get(key, now) for key in keys}
+        return {key: value for key, value in found.items() if value is not None}
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: Optional[float] = None,
+        size: Optional[int] = None,
+    ) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        entry = _CacheEntry(value, expires_at, size or estimate_size(value))
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _get(self, key: str, now: float) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at <= now:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+
+class SQLiteCache(CacheBackend):
+    """Cache in a local SQLite database, shared by every worker on the host.
+
+    Entries survive restarts. Once the stored values exceed ``max_bytes``, the
+    least recently written entries are dropped.
+    """
+
+    # Expired and over-budget entries are purged every this many writes
+    PURGE_INTERVAL = 100
+
+    def __init__(
+        self,
+        path: str = DEFAULT_SQLITE_PATH,
+        max_bytes: int = CACHE_MAX_BYTES,
+        default_ttl: Optional[float] = None,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL, size INTEGER NOT NULL, written_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_written_at ON cache (written_at)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        try:
+            rows = self._connection().execute(
+                f"SELECT key, value FROM cache WHERE key IN ({placeholders}) "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                [*keys, time.time()],
+            )
+            return {key: json.loads(value) for key, value in rows}
+        except sqlite3.Error as e:
+            logger.warning(f"Cache lookup failed: {str(e)}")
+            return {}
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: Optional[float] = None,
+        size: Optional[int] = None,
+    ) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        payload = json.dumps(value, default=str)
+        try:
+            with self._connection() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, expires_at, len(payload), now),
+                )
+            self._writes += 1
+            if self._writes % self.PURGE_INTERVAL == 0:
+                self._purge()
+        except sqlite3.Error as e:
+            logger.warning(f"Cache store failed: {str(e)}")
+
+    def delete(self, key: str) -> None:
+        try:
+            with self._connection() as connection:
+                connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Cache delete failed: {str(e)}")
+
+    def clear(self) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM cache")
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _purge(self) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM cache WHERE expires_at <= ?", (time.time(),)
+            )
+            (total,) = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+            if total <= self.max_bytes:
+                return
+            # Drop the oldest entries until the remaining ones fit the budget
+            connection.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER "
+                "(ORDER BY written_at DESC) AS running FROM cache) "
+                "WHERE running > ?)",
+                (self.max_bytes,),
+            )
+
+
+class RedisCache(CacheBackend):
+    """Cache on a Redis-protocol server, shared by every worker and host.
+
+    Requires the optional ``redis`` package. Any server speaking the Redis
+    protocol works (Redis, Valkey, KeyDB, Dragonfly); its own ``maxmemory``
+    policy enforces the memory budget.
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        default_ttl: Optional[float] = None,
+        namespace: str = "s3filesharegui:",
+    ):
+        try:
+            import redis
+        except ImportError as e:
+            raise ValueError(
+                "CACHE_BACKEND=redis requires the redis package (pip install redis)"
+            ) from e
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.namespace = namespace
+        self._errors = (redis.RedisError, OSError)
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            values = self.client.mget([self.namespace + key for key in keys])
+        except self._errors as e:
+            logger.warning(f"Cache lookup failed: {str(e)}")
+            return {}
+        return {
+            key: json.loads(value)
+            for key, value in zip(keys, values)
+            if value is not None
+        }
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: Optional[float] = None,
+        size: Optional[int] = None,
+    ) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        payload = json.dumps(value, default=str)
+        try:
+            self.client.set(
+                self.namespace + key,
+                payload,
+                px=int(ttl * 1000) if ttl is not None else None,
+            )
+        except self._errors as e:
+            logger.warning(f"Cache store failed: {str(e)}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self.client.delete(self.namespace + key)
+        except self._errors as e:
+            logger.warning(f"Cache delete failed: {str(e)}")
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=f"{self.namespace}*", count=1000))
+        for index in range(0, len(keys), 1000):
+            self.client.delete(*keys[index : index + 1000])
+
+    def close(self) -> None:
+        self.client.close()
+
+
+def create_cache_backend(
+    backend: str = CACHE_BACKEND, url: str = CACHE_URL
+) -> CacheBackend:
+    """Cache backend selected by CACHE_BACKEND and CACHE_URL.
+
+    Falls back to the in-process cache if the shared backend is unavailable.
+    """
+    try:
+        if backend == "sqlite":
+            return SQLiteCache(url or DEFAULT_SQLITE_PATH)
+        if backend == "redis":
+            return RedisCache(url or "redis://localhost:6379/0")
+        if backend != "memory":
+            logger.warning(f"Unknown cache backend {backend!r}, using memory")
+    except Exception as e:
+        logger.error(f"Error creating {backend} cache, using memory: {str(e)}")
+    return TTLCache(CACHE_MAX_BYTES)
+
+
+def parent_directories(key: str) -> List[str]:
+    """Every folder containing ``key``, from the root down: "", "a/", "a/b/" """
+    parts = key.split("/")[:-1]
+    return [""] + ["/".join(parts[: i + 1]) + "/" for i in range(len(parts))]
+
+
+class ListingCache:
+    """Cache of listing pages, invalidated by the app's own writes.
+
+    Cached pages are keyed by generation tokens instead of being deleted on
+    writes, so a listing that races with a write can never be stored under
+    the new generation. Two tokens are kept per folder:
+
+    * the *content* generation changes on any write below the folder, and
+      is part of the key of listings of that folder;
+    * the *tree* generation changes when a whole subtree is replaced, and is
+      part of the key of listings of every folder below it.
+
+    A token missing from the cache is replaced with a fresh one, which only
+    costs a cache miss. External changes are picked up when the TTL expires.
+    """
+
+    def __init__(self, cache: CacheBackend, ttl: float = LIST_CACHE_TTL):
+        self.cache = cache
+        self.ttl = ttl
+
+    def page_key(self, provider_key: str, prefix: str, params: Tuple) -> str:
+        """Key of a listing page under the current generations.
+
+        Take it before listing the provider and pass it to :meth:`set`, so a
+        write that lands during the listing leaves the page unreachable.
+        """
+        # Listings of "a/b" include "a/bc.txt", so a prefix belongs to the
+        # folder it sits in
+        directory = prefix[: prefix.rfind("/") + 1]
+        generation_keys = [self._generation_key("content", provider_key, directory)]
+        generation_keys.extend(
+            self._generation_key("tree", provider_key, parent)
+            for parent in parent_directories(directory)
+        )
+        generations = self.cache.get_many(generation_keys)
+        tokens = []
+        for generation_key in generation_keys:
+            token = generations.get(generation_key)
+            if token is None:
+                token = self._new_generation(generation_key)
+            tokens.append(token)
+        return json.dumps(["list", provider_key, prefix, list(params), tokens])
+
+    def get(self, page_key: str) -> Optional[Any]:
+        if self.ttl <= 0:
+            return None
+        return self.cache.get(page_key)
+
+    def set(self, page_key: str, value: Any) -> None:
+        if self.ttl <= 0:
+            return
+        self.cache.set(page_key, value, ttl=self.ttl)
+
+    def invalidate(self, provider_key: str, key: str, subtree: bool = False) -> None:
+        """Record a write to ``key``; ``subtree`` for whole-folder operations"""
+        for directory in parent_directories(key):
+            self._new_generation(
+                self._generation_key("content", provider_key, directory)
+            )
+        if subtree:
+            directory = key if key.endswith("/") else f"{key}/"
+            self._new_generation(self._generation_key("tree", provider_key, directory))
+
+    def _new_generation(self, generation_key: str) -> str:
+        token = secrets.token_hex(8)
+        self.cache.set(generation_key, token, ttl=GENERATION_TTL)
+        return token
+
+    @staticmethod
+    def _generation_key(kind: str, provider_key: str, directory: str) -> str:
+        return json.dumps(["generation", kind, provider_key, directory])
+
+
+class MetadataCache:
+    """Short-lived cache of ``StorageProvider.get_file_info`` results"""
+
+    def __init__(self, cache: CacheBackend, ttl: float = METADATA_CACHE_TTL):
+        self.cache = cache
+        self.ttl = ttl
+
+    def get(self, provider_key: str, filename: str) -> Optional[dict]:
+        if self.ttl <= 0:
+            return None
+        info = self.cache.get(self._key(provider_key, filename))
+        if info is None:
+            return None
+        info = dict(info)
+        if info["last_modified"]:
+            # Stored as ISO 8601 so every backend can hold it as JSON
+            info["last_modified"] = datetime.datetime.fromisoformat(
+                info["last_modified"]
+            )
+        return info
+
+    def set(self, provider_key: str, filename: str, info: dict) -> None:
+        if self.ttl <= 0:
+            return
+        value = dict(info)
+        if value["last_modified"]:
+            value["last_modified"] = value["last_modified"].isoformat()
+        self.cache.set(self._key(provider_key, filename), value, ttl=self.ttl)
+
+    def invalidate(self, provider_key: str, filename: str) -> None:
+        self.cache.delete(self._key(provider_key, filename))
+
+    @staticmethod
+    def _key(provider_key: str, filename: str) -> str:
+        return json.dumps(["metadata", provider_key, filename])
+
+
+class UrlCache:
+    """Signed URLs reused for as long as they have enough lifetime left.
+
+    Signing costs a round trip on B2 and an RSA signature on GCS, and a
+    stable URL lets browsers keep previews in their HTTP cache. A URL signed
+    for ``expires_in`` seconds is handed out for the first
+    ``1 - URL_CACHE_MIN_REMAINING`` of that time and re-signed afterwards.
+    """
+
+    def __init__(
+        self, cache: CacheBackend, min_remaining: float = URL_CACHE_MIN_REMAINING
+    ):
+        self.cache = cache
+        self.min_remaining = min_remaining
+
+    def get_many(
+        self,
+        provider_key: str,
+        filenames: Iterable[str],
+        expires_in: int,
+        download_name: Optional[str] = None,
+    ) -> Dict[str, str]:
+        if self.min_remaining >= 1:
+            return {}
+        keys = {
+            self._key(provider_key, name, expires_in, download_name): name
+            for name in filenames
+        }
+        found = self.cache.get_many(keys)
+        return {keys[key]: url for key, url in found.items()}
+
+    def set_many(
+        self,
+        provider_key: str,
+        urls: Dict[str, str],
+        expires_in: int,
+        download_name: Optional[str] = None,
+    ) -> None:
+        ttl = expires_in * (1 - self.min_remaining)
+        if ttl <= 0:
+            return
+        for name, url in urls.items():
+            key = self._key(provider_key, name, expires_in, download_name)
+            self.cache.set(key, url, ttl=ttl)
+
+    @staticmethod
+    def _key(
+        provider_key: str, filename: str, expires_in: int, download_name: Optional[str]
+    ) -> str:
+        return json.dumps(["url", provider_key, filename, expires_in, download_name])
+
+
+# Create global instances
+cache_backend = create_cache_backend()
+listing_cache = instrument_cache(ListingCache(cache_backend), "listing")
+metadata_cache = instrument_cache(MetadataCache(cache_backend), "metadata")
+url_cache = instrument_cache(UrlCache(cache_backend), "url")
@@ -0,0 +1,226 @@
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+from storage_providers import StorageProvider
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: uploads are hashed and identical content is copied server-side
+# instead of being transferred again
+DEDUP_UPLOADS = os.environ.get("DEDUP_UPLOADS", "false").lower() == "true"
+# Smaller files are always uploaded; hashing them saves next to nothing
+DEDUP_MIN_SIZE = int(os.environ.get("DEDUP_MIN_SIZE", 1024 * 1024))
+DEDUP_INDEX_PATH = os.environ.get(
+    "DEDUP_INDEX_PATH",
+    os.path.join(tempfile.gettempdir(), "s3filesharegui-dedup.db"),
+)
+
+# Content hashes are the SHA-256 of the concatenated SHA-256 digests of
+# fixed-size blocks. Browsers can only hash whole buffers with WebCrypto, so
+# this lets them hash multi-GB files block by block at native speed.
+CONTENT_HASH_BLOCK_SIZE = 8 * 1024 * 1024
+CONTENT_HASH_LENGTH = 64
+
+
+class ContentHasher:
+    """Incremental content hash, see CONTENT_HASH_BLOCK_SIZE"""
+
+    def __init__(self):
+        self._outer = hashlib.sha256()
+        self._block = hashlib.sha256()
+        self._block_bytes = 0
+        self.size = 0
+
+    def update(self, data) -> None:
+        view = memoryview(data)
+        self.size += len(view)
+        while view:
+            take = min(len(view), CONTENT_HASH_BLOCK_SIZE - self._block_bytes)
+            self._block.update(view[:take])
+            self._block_bytes += take
+            view = view[take:]
+            if self._block_bytes == CONTENT_HASH_BLOCK_SIZE:
+                self._finish_block()
+
+    def _finish_block(self) -> None:
+        self._outer.update(self._block.digest())
+        self._block = hashlib.sha256()
+        self._block_bytes = 0
+
+    def hexdigest(self) -> str:
+        if self._block_bytes:
+            self._finish_block()
+        return self._outer.hexdigest()
+
+
+class HashingUploadStream(io.RawIOBase):
+    """Content-hashes an upload stream as the provider reads it"""
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.hasher = ContentHasher()
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.stream.read(size)
+        self.hasher.update(chunk)
+        return chunk
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+
+def valid_content_hash(value) -> bool:
+    return (
+        isinstance(value, str)
+        and len(value) == CONTENT_HASH_LENGTH
+        and all(c in "0123456789abcdef" for c in value)
+    )
+
+
+class ContentRecord(NamedTuple):
+    name: str
+    size: int
+    etag: Optional[str]
+
+
+class DedupIndex:
+    """SQLite map from content hash to the objects known to hold it.
+
+    Entries are only hints: an object may have been overwritten or deleted
+    since, so :meth:`deduplicate` checks size and ETag before copying.
+    """
+
+    def __init__(self, path: str = DEDUP_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS content_hashes (
+                    provider_key TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT,
+                    recorded_at REAL NOT NULL,
+                    PRIMARY KEY (provider_key, name)
+                );
+                CREATE INDEX IF NOT EXISTS content_hashes_hash
+                    ON content_hashes (provider_key, content_hash, size);
+                """)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def record(
+        self,
+        provider_key: str,
+        name: str,
+        content_hash: str,
+        size: int,
+        etag: Optional[str],
+    ) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO content_hashes VALUES (?, ?, ?, ?, ?, ?)",
+                (provider_key, name, content_hash, size, etag, time.time()),
+            )
+
+    def lookup(
+        self, provider_key: str, content_hash: str, size: int
+    ) -> List[ContentRecord]:
+        """Objects recorded with this content, most recent first"""
+        rows = self._connection().execute(
+            "SELECT name, size, etag FROM content_hashes "
+            "WHERE provider_key = ? AND content_hash = ? AND size = ? "
+            "ORDER BY recorded_at DESC LIMIT 10",
+            (provider_key, content_hash, size),
+        )
+        return [ContentRecord(*row) for row in rows]
+
+    def forget(self, provider_key: str, names: List[str]) -> None:
+        with self._connection() as connection:
+            connection.executemany(
+                "DELETE FROM content_hashes WHERE provider_key = ? AND name = ?",
+                [(provider_key, name) for name in names],
+            )
+
+    def record_upload(
+        self,
+        provider: StorageProvider,
+        provider_key: str,
+        name: str,
+        content_hash: str,
+        size: int,
+    ) -> None:
+        """Index a finished upload under the ETag it was stored with"""
+        try:
+            info = provider.get_file_info(name)
+        except Exception as e:
+            logger.warning(f"Not indexing content of {name}: {str(e)}")
+            return
+        if info["size"] != size:
+            # Overwritten by someone else in the meantime
+            return
+        self.record(provider_key, name, content_hash, size, info["etag"])
+
+    def deduplicate(
+        self,
+        provider: StorageProvider,
+        provider_key: str,
+        content_hash: str,
+        size: int,
+        destination: str,
+    ) -> Optional[str]:
+        """Store ``destination`` as a server-side copy of an object with the
+        same content. Returns the name of the copied object, or None when no
+        current copy exists and the bytes must be uploaded."""
+        stale = []
+        try:
+            for candidate in self.lookup(provider_key, content_hash, size):
+                try:
+                    info = provider.get_file_info(candidate.name)
+                except Exception:
+                    stale.append(candidate.name)
+                    continue
+                if (info["size"], info["etag"]) != (candidate.size, candidate.etag):
+                    stale.append(candidate.name)
+                    continue
+                if candidate.name != destination:
+                    try:
+                        provider.copy_file(candidate.name, destination, size)
+                    except NotImplementedError:
+                        return None
+                    self.record_upload(
+                        provider, provider_key, destination, content_hash, size
+                    )
+                logger.info(
+                    f"Deduplicated upload of {destination} from {candidate.name}"
+                )
+                return candidate.name
+            return None
+        finally:
+            if stale:
+                self.forget(provider_key, stale)
+
+
+# Create global instances
+dedup_index = DedupIndex()
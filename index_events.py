@@ -0,0 +1,310 @@
+import base64
+import datetime
+import glob
+import json
+import logging
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Any, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote_plus
+
+import boto3
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2 import service_account
+
+from multipart import is_upload_staging
+
+logger = logging.getLogger(__name__)
+
+# "sqs" (S3 event notifications), "pubsub" (GCS Pub/Sub notifications) or
+# "file" (JSON files dropped into a directory); empty disables events
+INDEX_EVENTS = os.environ.get("INDEX_EVENTS", "").lower()
+# SQS queue URL, Pub/Sub subscription path or drop directory
+INDEX_EVENTS_URL = os.environ.get("INDEX_EVENTS_URL", "")
+
+# Long-poll duration of SQS and Pub/Sub receive calls
+EVENTS_WAIT_SECONDS = 20
+EVENTS_BATCH_SIZE = 10
+
+
+class ChangeEvent(NamedTuple):
+    """One object created, overwritten or deleted in a bucket"""
+
+    name: str
+    deleted: bool = False
+    size: Optional[int] = None
+    etag: Optional[str] = None
+    last_modified: Optional[datetime.datetime] = None
+    bucket: Optional[str] = None
+
+    def as_entry(self) -> dict:
+        return {
+            "name": self.name,
+            "size": self.size,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+        }
+
+
+class EventSource(ABC):
+    """Stream of bucket change notifications.
+
+    :meth:`poll` returns events together with an opaque receipt per message;
+    receipts are acknowledged once the events have been applied, so a crash
+    in between redelivers them instead of losing them.
+    """
+
+    @abstractmethod
+    def poll(self) -> List[Tuple[List[ChangeEvent], Any]]:
+        pass
+
+    @abstractmethod
+    def ack(self, receipts: List[Any]) -> None:
+        pass
+
+
+def parse_s3_event(message: dict) -> List[ChangeEvent]:
+    """Events of an S3 notification, delivered directly or wrapped by SNS"""
+    if "Message" in message and "Records" not in message:
+        message = json.loads(message["Message"])
+    events = []
+    for record in message.get("Records", []):
+        name = record.get("eventName", "")
+        s3 = record.get("s3", {})
+        obj = s3.get("object", {})
+        if "key" not in obj:
+            continue
+        events.append(
+            ChangeEvent(
+                name=unquote_plus(obj["key"]),
+                deleted=name.startswith("ObjectRemoved"),
+                size=obj.get("size"),
+                etag=f'"{obj["eTag"]}"' if obj.get("eTag") else None,
+                last_modified=(
+                    datetime.datetime.fromisoformat(
+                        record["eventTime"].replace("Z", "+00:00")
+                    )
+                    if record.get("eventTime")
+                    else None
+                ),
+                bucket=s3.get("bucket", {}).get("name"),
+            )
+        )
+    return events
+
+
+def parse_gcs_event(attributes: dict, data: dict) -> List[ChangeEvent]:
+    """Event of a GCS Pub/Sub notification (JSON_API_V1 payload)"""
+    event_type = attributes.get("eventType")
+    if event_type not in ("OBJECT_FINALIZE", "OBJECT_DELETE", "OBJECT_ARCHIVE"):
+        return []
+    name = attributes.get("objectId") or data.get("name")
+    if is_upload_staging(name or ""):
+        return []
+    updated = data.get("updated")
+    return [
+        ChangeEvent(
+            name=name,
+            # A delete that belongs to an overwrite is followed by a finalize
+            deleted=event_type != "OBJECT_FINALIZE"
+            and "overwrittenByGeneration" not in attributes,
+            size=int(data["size"]) if data.get("size") else None,
+            etag=f'"{data["etag"]}"' if data.get("etag") else None,
+            last_modified=(
+                datetime.datetime.fromisoformat(updated.replace("Z", "+00:00"))
+                if updated
+                else None
+            ),
+            bucket=attributes.get("bucketId"),
+        )
+    ]
+
+
+class SQSEventSource(EventSource):
+    """S3 event notifications delivered to an SQS queue"""
+
+    def __init__(self, queue_url: str, **client_kwargs):
+        match = re.match(r"https://sqs\.([a-z0-9-]+)\.", queue_url)
+        if match and "region_name" not in client_kwargs:
+            client_kwargs["region_name"] = match.group(1)
+        self.queue_url = queue_url
+        self.client = boto3.client("sqs", **client_kwargs)
+
+    def poll(self) -> List[Tuple[List[ChangeEvent], Any]]:
+        response = self.client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=EVENTS_BATCH_SIZE,
+            WaitTimeSeconds=EVENTS_WAIT_SECONDS,
+        )
+        batches = []
+        for message in response.get("Messages", []):
+            try:
+                events = parse_s3_event(json.loads(message["Body"]))
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Skipping malformed S3 event: {str(e)}")
+                events = []
+            batches.append((events, message["ReceiptHandle"]))
+        return batches
+
+    def ack(self, receipts: List[Any]) -> None:
+        if receipts:
+            self.client.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(index), "ReceiptHandle": receipt}
+                    for index, receipt in enumerate(receipts)
+                ],
+            )
+
+
+class PubSubEventSource(EventSource):
+    """GCS notifications pulled from a Pub/Sub subscription over REST.
+
+    Uses google-auth directly, so the Pub/Sub client library is not needed.
+    """
+
+    API_URL = "https://pubsub.googleapis.com/v1"
+    SCOPES = ["https://www.googleapis.com/auth/pubsub"]
+
+    def __init__(self, subscription: str, credentials_info: Optional[dict] = None):
+        if credentials_info:
+            credentials = service_account.Credentials.from_service_account_info(
+                credentials_info, scopes=self.SCOPES
+            )
+        else:
+            credentials, _ = google.auth.default(scopes=self.SCOPES)
+        self.subscription = subscription
+        self.session = AuthorizedSession(credentials)
+
+    def poll(self) -> List[Tuple[List[ChangeEvent], Any]]:
+        response = self.session.post(
+            f"{self.API_URL}/{self.subscription}:pull",
+            json={"maxMessages": EVENTS_BATCH_SIZE},
+            timeout=EVENTS_WAIT_SECONDS + 10,
+        )
+        response.raise_for_status()
+        batches = []
+        for received in response.json().get("receivedMessages", []):
+            message = received["message"]
+            try:
+                data = json.loads(base64.b64decode(message.get("data", "")) or "{}")
+                events = parse_gcs_event(message.get("attributes", {}), data)
+            except ValueError as e:
+                logger.warning(f"Skipping malformed GCS event: {str(e)}")
+                events = []
+            batches.append((events, received["ackId"]))
+        return batches
+
+    def ack(self, receipts: List[Any]) -> None:
+        if receipts:
+            self.session.post(
+                f"{self.API_URL}/{self.subscription}:acknowledge",
+                json={"ackIds": receipts},
+                timeout=30,
+            ).raise_for_status()
+
+
+class FileDropEventSource(EventSource):
+    """Local stand-in for a notification queue.
+
+    Every ``*.json`` file in ``directory`` holds an S3 notification, or a
+    list of ``{"name", "deleted", "size", "etag", "last_modified"}``
+    objects. Files are removed once their events have been applied.
+    """
+
+    def __init__(self, directory: str, poll_interval: float = 2.0):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+
+    def poll(self) -> List[Tuple[List[ChangeEvent], Any]]:
+        paths = sorted(glob.glob(os.path.join(self.directory, "*.json")))
+        if not paths:
+            time.sleep(self.poll_interval)
+            return []
+        batches = []
+        for path in paths[: EVENTS_BATCH_SIZE * 10]:
+            try:
+                with open(path) as f:
+                    payload = json.load(f)
+                batches.append((self._parse(payload), path))
+            except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+                # Acknowledged with no events, so one bad file never stalls
+                # the queue
+                logger.warning(f"Skipping malformed event file {path}: {str(e)}")
+                batches.append(([], path))
+        return batches
+
+    def ack(self, receipts: List[Any]) -> None:
+        for path in receipts:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _parse(payload) -> List[ChangeEvent]:
+        if isinstance(payload, dict):
+            return parse_s3_event(payload)
+        events = []
+        for item in payload:
+            if not isinstance(item, dict) or not isinstance(item.get("name"), str):
+                raise ValueError("Event without an object name")
+            last_modified = item.get("last_modified")
+            events.append(
+                ChangeEvent(
+                    name=item["name"],
+                    deleted=bool(item.get("deleted")),
+                    size=item.get("size"),
+                    etag=item.get("etag"),
+                    last_modified=(
+                        datetime.datetime.fromisoformat(last_modified)
+                        if last_modified
+                        else None
+                    ),
+                    bucket=item.get("bucket"),
+                )
+            )
+        return events
+
+
+def create_event_source(
+    provider_type: str, provider_config: dict
+) -> Optional[EventSource]:
+    """Event source configured by INDEX_EVENTS, or None when disabled.
+
+    Credentials of the configured provider are reused where they fit: AWS
+    keys for SQS and the service account for Pub/Sub.
+    """
+    if not INDEX_EVENTS:
+        return None
+    if not INDEX_EVENTS_URL:
+        logger.warning("INDEX_EVENTS is set but INDEX_EVENTS_URL is missing")
+        return None
+    if INDEX_EVENTS == "sqs":
+        client_kwargs = {}
+        if provider_type == "aws":
+            client_kwargs = {
+                "aws_access_key_id": provider_config.get("access_key"),
+                "aws_secret_access_key": provider_config.get("secret_key"),
+            }
+        return SQSEventSource(INDEX_EVENTS_URL, **client_kwargs)
+    if INDEX_EVENTS == "pubsub":
+        credentials_info = None
+        if provider_type == "gcs":
+            credentials_info = provider_config.get("credentials_json")
+            if isinstance(credentials_info, str):
+                credentials_info = json.loads(credentials_info)
+        return PubSubEventSource(INDEX_EVENTS_URL, credentials_info)
+    if INDEX_EVENTS == "file":
+        return FileDropEventSource(INDEX_EVENTS_URL)
+    logger.warning(f"Unknown index event source {INDEX_EVENTS!r}")
+    return None
+
+
+def provider_bucket(provider_config: dict) -> Optional[str]:
+    """Bucket name of a provider configuration, used to filter events"""
+    return provider_config.get("bucket") or provider_config.get("bucket_name")
@@ -0,0 +1,776 @@
+import datetime
+import hashlib
+import logging
+import mimetypes
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from cache import parent_directories
+from index_events import ChangeEvent, EventSource, create_event_source, provider_bucket
+from provider_registry import provider_cache_key, provider_registry
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = os.environ.get(
+    "INDEX_PATH", os.path.join(tempfile.gettempdir(), "s3filesharegui-index.db")
+)
+# Seconds after a completed full walk before a search triggers the next one.
+# In between, folders are re-listed incrementally on their own schedule.
+INDEX_REFRESH_INTERVAL = int(os.environ.get("INDEX_REFRESH_INTERVAL", 7 * 86400))
+# Bounds of the per-folder re-list interval: folders that changed are
+# checked again after the minimum, unchanged ones back off to the maximum
+INDEX_SYNC_MIN_INTERVAL = int(os.environ.get("INDEX_SYNC_MIN_INTERVAL", 60))
+INDEX_SYNC_MAX_INTERVAL = int(os.environ.get("INDEX_SYNC_MAX_INTERVAL", 86400))
+# Folders re-listed per scheduling round
+INDEX_SYNC_BATCH_SIZE = 100
+# Objects written per transaction while walking a bucket
+INDEX_BATCH_SIZE = 5000
+
+# The trigram tokenizer only matches terms of at least three characters
+TRIGRAM_MIN_LENGTH = 3
+
+SEARCH_DEFAULT_LIMIT = 100
+SEARCH_MAX_LIMIT = 1000
+
+
+def _extension(name: str) -> str:
+    return os.path.splitext(name.rsplit("/", 1)[-1])[1].lstrip(".").lower()
+
+
+def _directory(name: str) -> str:
+    return name[: name.rfind("/") + 1]
+
+
+def _parent_folder(folder: str) -> str:
+    return _directory(folder[:-1])
+
+
+def _subtree_end(folder: str) -> str:
+    """Exclusive upper bound of every key starting with ``folder``"""
+    return folder + "\U0010ffff"
+
+
+def _entry_hash(entry: dict) -> int:
+    if entry.get("type") == "folder":
+        token = f"D{entry['name']}"
+    else:
+        token = f"F{entry['name']}\0{entry.get('etag') or ''}\0{entry.get('size')}"
+    return int.from_bytes(hashlib.sha1(token.encode("utf-8")).digest()[:8], "big")
+
+
+def directory_fingerprint(entries: Iterable[dict]) -> str:
+    """Order-independent digest of a folder's immediate children.
+
+    Hashes are combined with XOR, so the same value can be accumulated from
+    a flat recursive listing in any order.
+    """
+    fingerprint = 0
+    for entry in entries:
+        fingerprint ^= _entry_hash(entry)
+    return f"{fingerprint:016x}"
+
+
+def _timestamp(value) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+class MetadataIndex:
+    """Local SQLite index of object metadata for every configured bucket.
+
+    Names are indexed with an FTS5 trigram index, so substring searches use
+    the index instead of scanning every row. SQLite builds without FTS5
+    trigram support fall back to LIKE scans.
+    """
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.fts = True
+        with self._connection() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS objects (
+                    id INTEGER PRIMARY KEY,
+                    provider_key TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    size INTEGER,
+                    etag TEXT,
+                    last_modified REAL,
+                    mime_type TEXT,
+                    extension TEXT,
+                    walk_id INTEGER NOT NULL DEFAULT 0,
+                    directory TEXT,
+                    UNIQUE (provider_key, name)
+                );
+                CREATE INDEX IF NOT EXISTS objects_extension
+                    ON objects (provider_key, extension);
+                CREATE INDEX IF NOT EXISTS objects_size ON objects (provider_key, size);
+                CREATE INDEX IF NOT EXISTS objects_modified
+                    ON objects (provider_key, last_modified);
+                CREATE TABLE IF NOT EXISTS prefix_state (
+                    provider_key TEXT NOT NULL,
+                    prefix TEXT NOT NULL,
+                    parent TEXT,
+                    fingerprint TEXT,
+                    high_water_mark REAL,
+                    check_interval REAL NOT NULL,
+                    next_check_at REAL NOT NULL,
+                    PRIMARY KEY (provider_key, prefix)
+                );
+                CREATE INDEX IF NOT EXISTS prefix_state_due
+                    ON prefix_state (provider_key, next_check_at);
+                CREATE INDEX IF NOT EXISTS prefix_state_parent
+                    ON prefix_state (provider_key, parent);
+                CREATE TABLE IF NOT EXISTS index_state (
+                    provider_key TEXT PRIMARY KEY,
+                    walk_id INTEGER NOT NULL DEFAULT 0,
+                    started_at REAL,
+                    completed_at REAL,
+                    object_count INTEGER
+                );
+                """)
+            columns = {
+                row["name"] for row in connection.execute("PRAGMA table_info(objects)")
+            }
+            if "directory" not in columns:
+                # Indexes created before incremental sync lack the column
+                connection.execute("ALTER TABLE objects ADD COLUMN directory TEXT")
+                connection.execute(
+                    "UPDATE objects SET directory = "
+                    "rtrim(name, replace(name, '/', ''))"
+                )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS objects_directory "
+                "ON objects (provider_key, directory)"
+            )
+            try:
+                connection.executescript("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS objects_fts USING fts5(
+                        name, content='objects', content_rowid='id',
+                        tokenize='trigram'
+                    );
+                    CREATE TRIGGER IF NOT EXISTS objects_fts_insert
+                    AFTER INSERT ON objects BEGIN
+                        INSERT INTO objects_fts (rowid, name) VALUES (new.id, new.name);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS objects_fts_delete
+                    AFTER DELETE ON objects BEGIN
+                        INSERT INTO objects_fts (objects_fts, rowid, name)
+                        VALUES ('delete', old.id, old.name);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS objects_fts_update
+                    AFTER UPDATE OF name ON objects BEGIN
+                        INSERT INTO objects_fts (objects_fts, rowid, name)
+                        VALUES ('delete', old.id, old.name);
+                        INSERT INTO objects_fts (rowid, name) VALUES (new.id, new.name);
+                    END;
+                    """)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"FTS5 trigram index unavailable, using LIKE: {str(e)}")
+                self.fts = False
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def begin_walk(self, provider_key: str) -> int:
+        """Start a full walk and return its id; objects not seen by it are
+        removed when it completes."""
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO index_state (provider_key, walk_id, started_at) "
+                "VALUES (?, 1, ?) ON CONFLICT (provider_key) DO UPDATE SET "
+                "walk_id = walk_id + 1, started_at = excluded.started_at",
+                (provider_key, time.time()),
+            )
+            (walk_id,) = connection.execute(
+                "SELECT walk_id FROM index_state WHERE provider_key = ?",
+                (provider_key,),
+            ).fetchone()
+        return walk_id
+
+    def upsert(
+        self, provider_key: str, entries: Iterable[dict], walk_id: int = 0
+    ) -> int:
+        rows = [
+            (
+                provider_key,
+                entry["name"],
+                entry.get("size"),
+                entry.get("etag"),
+                _timestamp(entry.get("last_modified")),
+                mimetypes.guess_type(entry["name"])[0],
+                _extension(entry["name"]),
+                walk_id,
+                _directory(entry["name"]),
+            )
+            for entry in entries
+        ]
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT INTO objects (provider_key, name, size, etag, last_modified, "
+                "mime_type, extension, walk_id, directory) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (provider_key, name) DO UPDATE SET size = excluded.size, "
+                "etag = excluded.etag, last_modified = excluded.last_modified, "
+                "mime_type = excluded.mime_type, walk_id = excluded.walk_id",
+                rows,
+            )
+        return len(rows)
+
+    def complete_walk(self, provider_key: str, walk_id: int) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM objects WHERE provider_key = ? AND walk_id < ?",
+                (provider_key, walk_id),
+            )
+            (count,) = connection.execute(
+                "SELECT COUNT(*) FROM objects WHERE provider_key = ?", (provider_key,)
+            ).fetchone()
+            connection.execute(
+                "UPDATE index_state SET completed_at = ?, object_count = ? "
+                "WHERE provider_key = ? AND walk_id = ?",
+                (time.time(), count, provider_key, walk_id),
+            )
+
+    def current_walk_id(self, provider_key: str) -> Optional[int]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT walk_id FROM index_state WHERE provider_key = ?",
+                (provider_key,),
+            )
+            .fetchone()
+        )
+        return row["walk_id"] if row else None
+
+    def save_prefixes(
+        self,
+        provider_key: str,
+        fingerprints: Dict[str, str],
+        high_water_marks: Dict[str, float],
+    ) -> None:
+        """Replace the sync schedule with the folders seen by a full walk.
+
+        Folders whose newest object is old are assumed to be cold and start
+        with a longer re-list interval.
+        """
+        now = time.time()
+        rows = []
+        for prefix, fingerprint in fingerprints.items():
+            age = now - high_water_marks.get(prefix, now)
+            interval = _clamp_interval(age / 4)
+            rows.append(
+                (
+                    provider_key,
+                    prefix,
+                    _parent_folder(prefix) if prefix else None,
+                    fingerprint,
+                    high_water_marks.get(prefix),
+                    interval,
+                    now + interval * random.uniform(0.5, 1),
+                )
+            )
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM prefix_state WHERE provider_key = ?", (provider_key,)
+            )
+            connection.executemany(
+                "INSERT INTO prefix_state VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def due_prefixes(self, provider_key: str, limit: int) -> List[dict]:
+        rows = self._connection().execute(
+            "SELECT prefix, fingerprint, check_interval FROM prefix_state "
+            "WHERE provider_key = ? AND next_check_at <= ? "
+            "ORDER BY next_check_at LIMIT ?",
+            (provider_key, time.time(), limit),
+        )
+        return [dict(row) for row in rows]
+
+    def next_check_at(self, provider_key: str) -> Optional[float]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT MIN(next_check_at) AS due FROM prefix_state "
+                "WHERE provider_key = ?",
+                (provider_key,),
+            )
+            .fetchone()
+        )
+        return row["due"]
+
+    def sync_directory(
+        self, provider_key: str, prefix: str, entries: List[dict], state: dict
+    ) -> bool:
+        """Apply a fresh listing of one folder and reschedule its next check.
+
+        Returns whether the folder changed since it was last listed.
+        """
+        fingerprint = directory_fingerprint(entries)
+        changed = fingerprint != state["fingerprint"]
+        files = [entry for entry in entries if entry.get("type") != "folder"]
+        folders = {entry["name"] for entry in entries if entry.get("type") == "folder"}
+        modified = [_timestamp(f.get("last_modified")) for f in files]
+        high_water_mark = max((m for m in modified if m is not None), default=None)
+
+        if changed:
+            walk_id = self.current_walk_id(provider_key) or 0
+            self.upsert(provider_key, files, walk_id)
+            self._remove_missing(provider_key, prefix, files, folders)
+        interval = (
+            INDEX_SYNC_MIN_INTERVAL
+            if changed
+            else _clamp_interval(state["check_interval"] * 2)
+        )
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE prefix_state SET fingerprint = ?, high_water_mark = "
+                "COALESCE(?, high_water_mark), check_interval = ?, next_check_at = ? "
+                "WHERE provider_key = ? AND prefix = ?",
+                (
+                    fingerprint,
+                    high_water_mark,
+                    interval,
+                    time.time() + interval,
+                    provider_key,
+                    prefix,
+                ),
+            )
+        return changed
+
+    def _remove_missing(
+        self, provider_key: str, prefix: str, files: List[dict], folders: set
+    ) -> None:
+        names = {f["name"] for f in files}
+        connection = self._connection()
+        indexed = connection.execute(
+            "SELECT name FROM objects WHERE provider_key = ? AND directory = ?",
+            (provider_key, prefix),
+        )
+        gone = [
+            (provider_key, row["name"]) for row in indexed if row["name"] not in names
+        ]
+        known_folders = {
+            row["prefix"]
+            for row in connection.execute(
+                "SELECT prefix FROM prefix_state WHERE provider_key = ? AND parent = ?",
+                (provider_key, prefix),
+            )
+        }
+        now = time.time()
+        with connection:
+            connection.executemany(
+                "DELETE FROM objects WHERE provider_key = ? AND name = ?", gone
+            )
+            for folder in known_folders - folders:
+                self._delete_subtree(connection, provider_key, folder)
+            # New subfolders are listed in the next scheduling round
+            connection.executemany(
+                "INSERT OR IGNORE INTO prefix_state VALUES (?, ?, ?, NULL, NULL, ?, ?)",
+                [
+                    (provider_key, folder, prefix, INDEX_SYNC_MIN_INTERVAL, now)
+                    for folder in folders - known_folders
+                ],
+            )
+
+    @staticmethod
+    def _delete_subtree(connection, provider_key: str, folder: str) -> None:
+        bounds = (provider_key, folder, _subtree_end(folder))
+        connection.execute(
+            "DELETE FROM objects WHERE provider_key = ? AND name >= ? AND name < ?",
+            bounds,
+        )
+        connection.execute(
+            "DELETE FROM prefix_state WHERE provider_key = ? "
+            "AND prefix >= ? AND prefix < ?",
+            bounds,
+        )
+
+    def remove(self, provider_key: str, names: Iterable[str]) -> None:
+        with self._connection() as connection:
+            connection.executemany(
+                "DELETE FROM objects WHERE provider_key = ? AND name = ?",
+                [(provider_key, name) for name in names],
+            )
+
+    def apply_change(
+        self, provider_key: str, event: ChangeEvent, subtree: bool = False
+    ) -> None:
+        """Apply a single known write, e.g. from a bucket notification.
+
+        Changes without full metadata schedule their folder for a re-list.
+        """
+        walk_id = self.current_walk_id(provider_key)
+        if walk_id is None:
+            return  # bucket not indexed
+        directory = (
+            event.name
+            if subtree and event.name.endswith("/")
+            else _directory(event.name)
+        )
+        connection = self._connection()
+        if event.deleted:
+            with connection:
+                if subtree:
+                    self._delete_subtree(connection, provider_key, directory)
+                else:
+                    connection.execute(
+                        "DELETE FROM objects WHERE provider_key = ? AND name = ?",
+                        (provider_key, event.name),
+                    )
+            return
+        if not subtree:
+            self.upsert(provider_key, [event.as_entry()], walk_id)
+        if subtree or event.etag is None:
+            self.mark_due(provider_key, directory)
+
+    def mark_due(self, provider_key: str, prefix: str) -> None:
+        """Re-list ``prefix`` (and discover it if it is new) in the next round"""
+        now = time.time()
+        with self._connection() as connection:
+            for folder in reversed(parent_directories(prefix)):
+                parent = _parent_folder(folder) if folder else None
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO prefix_state "
+                    "VALUES (?, ?, ?, NULL, NULL, ?, ?)",
+                    (provider_key, folder, parent, INDEX_SYNC_MIN_INTERVAL, now),
+                )
+                if folder == prefix:
+                    connection.execute(
+                        "UPDATE prefix_state SET next_check_at = ? "
+                        "WHERE provider_key = ? AND prefix = ?",
+                        (now, provider_key, folder),
+                    )
+                elif cursor.rowcount == 0:
+                    break  # the remaining ancestors are already known
+
+    def status(self, provider_key: str) -> Optional[dict]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT started_at, completed_at, object_count FROM index_state "
+                "WHERE provider_key = ?",
+                (provider_key,),
+            )
+            .fetchone()
+        )
+        return dict(row) if row else None
+
+    def search(
+        self,
+        provider_key: str,
+        query: str = "",
+        extensions: Optional[List[str]] = None,
+        prefix: str = "",
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        modified_after: Optional[datetime.datetime] = None,
+        modified_before: Optional[datetime.datetime] = None,
+        limit: int = SEARCH_DEFAULT_LIMIT,
+        offset: int = 0,
+    ) -> List[dict]:
+        """Indexed objects matching every given filter, ordered by name"""
+        clauses = ["o.provider_key = ?"]
+        params: list = [provider_key]
+        source = "objects o"
+        if query and self.fts and len(query) >= TRIGRAM_MIN_LENGTH:
+            source = "objects_fts f JOIN objects o ON o.id = f.rowid"
+            clauses.append("objects_fts MATCH ?")
+            params.append('"' + query.replace('"', '""') + '"')
+        elif query:
+            clauses.append("o.name LIKE ? ESCAPE '\\'")
+            params.append(f"%{_escape_like(query)}%")
+        if prefix:
+            clauses.append("o.name LIKE ? ESCAPE '\\'")
+            params.append(f"{_escape_like(prefix)}%")
+        if extensions:
+            clauses.append(f"o.extension IN ({','.join('?' * len(extensions))})")
+            params.extend(ext.lstrip(".").lower() for ext in extensions)
+        if min_size is not None:
+            clauses.append("o.size >= ?")
+            params.append(min_size)
+        if max_size is not None:
+            clauses.append("o.size <= ?")
+            params.append(max_size)
+        if modified_after is not None:
+            clauses.append("o.last_modified >= ?")
+            params.append(_timestamp(modified_after))
+        if modified_before is not None:
+            clauses.append("o.last_modified < ?")
+            params.append(_timestamp(modified_before))
+
+        rows = self._connection().execute(
+            f"SELECT o.name, o.size, o.etag, o.last_modified, o.mime_type "
+            f"FROM {source} WHERE {' AND '.join(clauses)} "
+            f"ORDER BY o.name LIMIT ? OFFSET ?",
+            [*params, limit, offset],
+        )
+        return [
+            {
+                "name": row["name"],
+                "size": row["size"],
+                "etag": row["etag"],
+                "last_modified": (
+                    datetime.datetime.fromtimestamp(
+                        row["last_modified"], tz=datetime.timezone.utc
+                    ).isoformat()
+                    if row["last_modified"] is not None
+                    else None
+                ),
+                "mime_type": row["mime_type"],
+            }
+            for row in rows
+        ]
+
+
+def _clamp_interval(interval: float) -> float:
+    return min(max(interval, INDEX_SYNC_MIN_INTERVAL), INDEX_SYNC_MAX_INTERVAL)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class BucketIndexer:
+    """Keeps the metadata index in sync with buckets in the background.
+
+    The first walk lists the whole bucket and records a fingerprint and a
+    newest-modification high-water mark per folder. After that, folders are
+    re-listed one at a time on their own schedule: a folder that changed is
+    checked again soon, an unchanged one backs off exponentially. Bucket
+    notifications and the app's own writes are applied as they happen. The
+    refresh cost therefore follows the rate of change rather than the size
+    of the bucket.
+
+    One worker thread runs at a time per provider configuration, leasing the
+    provider from the shared registry.
+    """
+
+    def __init__(
+        self, index: MetadataIndex, refresh_interval: int = INDEX_REFRESH_INTERVAL
+    ):
+        self.index = index
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._running: dict = {}
+        # Bucket of every configuration that receives change events. The one
+        # queue of INDEX_EVENTS_URL is consumed by a single thread, which
+        # applies each event to every configuration of its bucket.
+        self._subscribers: Dict[str, Optional[str]] = {}
+        self._events_started = False
+
+    def is_running(self, provider_key: str) -> bool:
+        with self._lock:
+            return provider_key in self._running
+
+    def ensure_fresh(self, provider_type: str, provider_config: dict) -> bool:
+        """Start a full walk or an incremental sync as needed.
+
+        Returns True while a full walk is in progress, i.e. while results
+        may be incomplete.
+        """
+        provider_key = provider_cache_key(provider_type, provider_config)
+        status = self.index.status(provider_key)
+        completed_at = status and status["completed_at"]
+        if not completed_at or time.time() - completed_at >= self.refresh_interval:
+            self.start(provider_type, provider_config)
+            return True
+        self._start_events(provider_key, provider_type, provider_config)
+        due = self.index.next_check_at(provider_key)
+        if due is not None and due <= time.time():
+            self._start_thread(self._sync, provider_key, provider_type, provider_config)
+        return False
+
+    def start(self, provider_type: str, provider_config: dict) -> bool:
+        provider_key = provider_cache_key(provider_type, provider_config)
+        return self._start_thread(
+            self._walk, provider_key, provider_type, provider_config
+        )
+
+    def record_write(
+        self,
+        provider_type: str,
+        provider_config: dict,
+        event: ChangeEvent,
+        subtree: bool = False,
+    ) -> None:
+        """Apply a write made through the app right away"""
+        provider_key = provider_cache_key(provider_type, provider_config)
+        try:
+            self.index.apply_change(provider_key, event, subtree)
+        except Exception as e:
+            logger.warning(f"Error updating index for {event.name}: {str(e)}")
+
+    def record_deletes(
+        self, provider_type: str, provider_config: dict, names: List[str]
+    ) -> None:
+        """Remove keys deleted through the app in one transaction"""
+        provider_key = provider_cache_key(provider_type, provider_config)
+        try:
+            self.index.remove(provider_key, names)
+        except Exception as e:
+            logger.warning(f"Error removing {len(names)} keys from index: {str(e)}")
+
+    def _start_thread(
+        self, target, provider_key: str, provider_type: str, provider_config: dict
+    ) -> bool:
+        with self._lock:
+            if provider_key in self._running:
+                return True
+            thread = threading.Thread(
+                target=self._run,
+                args=(target, provider_key, provider_type, dict(provider_config)),
+                name=f"indexer-{provider_type}",
+                daemon=True,
+            )
+            self._running[provider_key] = thread
+        thread.start()
+        return True
+
+    def _run(self, target, provider_key, provider_type, provider_config) -> None:
+        try:
+            with provider_registry.lease(provider_type, provider_config) as provider:
+                target(provider_key, provider)
+        except Exception as e:
+            logger.error(f"Error indexing {provider_type} bucket: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.pop(provider_key, None)
+
+    def _walk(self, provider_key: str, provider) -> None:
+        started = time.monotonic()
+        walk_id = self.index.begin_walk(provider_key)
+        fingerprints: Dict[str, int] = {"": 0}
+        high_water_marks: Dict[str, float] = {}
+        count = 0
+        batch = []
+        for entry in provider.list_files():
+            self._account(entry, fingerprints, high_water_marks)
+            batch.append(entry)
+            if len(batch) >= INDEX_BATCH_SIZE:
+                count += self.index.upsert(provider_key, batch, walk_id)
+                batch = []
+        count += self.index.upsert(provider_key, batch, walk_id)
+        self.index.complete_walk(provider_key, walk_id)
+        self.index.save_prefixes(
+            provider_key,
+            {prefix: f"{value:016x}" for prefix, value in fingerprints.items()},
+            high_water_marks,
+        )
+        logger.info(
+            f"Indexed {count} {provider.provider_type} objects in "
+            f"{time.monotonic() - started:.1f}s"
+        )
+
+    @staticmethod
+    def _account(entry: dict, fingerprints: dict, high_water_marks: dict) -> None:
+        """Fold one key of a recursive listing into its folders' fingerprints,
+        matching what list_directory reports for each folder"""
+        name = entry["name"]
+        directory = _directory(name)
+        for folder in parent_directories(name)[1:]:
+            if folder not in fingerprints:
+                fingerprints[folder] = 0
+                parent = _parent_folder(folder)
+                fingerprints[parent] ^= _entry_hash({"name": folder, "type": "folder"})
+        if name != directory:  # folder placeholders are not listed as files
+            fingerprints[directory] ^= _entry_hash(entry)
+        modified = _timestamp(entry.get("last_modified"))
+        if modified is not None:
+            high_water_marks[directory] = max(
+                modified, high_water_marks.get(directory, modified)
+            )
+
+    def _sync(self, provider_key: str, provider) -> None:
+        checked = changed = 0
+        while True:
+            due = self.index.due_prefixes(provider_key, INDEX_SYNC_BATCH_SIZE)
+            if not due:
+                break
+            for state in due:
+                entries = list(provider.list_directory(state["prefix"]))
+                checked += 1
+                if self.index.sync_directory(
+                    provider_key, state["prefix"], entries, state
+                ):
+                    changed += 1
+        if checked:
+            logger.info(f"Index sync re-listed {checked} folders, {changed} changed")
+
+    def _start_events(
+        self, provider_key: str, provider_type: str, provider_config: dict
+    ) -> None:
+        with self._lock:
+            self._subscribers[provider_key] = provider_bucket(provider_config)
+            if self._events_started:
+                return
+            # Also set for disabled sources so creation is not retried
+            self._events_started = True
+            try:
+                source = create_event_source(provider_type, provider_config)
+            except Exception as e:
+                logger.error(f"Error creating index event source: {str(e)}")
+                source = None
+            if source is None:
+                return
+            thread = threading.Thread(
+                target=self._consume, args=(source,), name="index-events", daemon=True
+            )
+        thread.start()
+
+    def _consume(self, source: EventSource) -> None:
+        backoff = 1
+        while True:
+            try:
+                self._consume_batch(source)
+                backoff = 1
+            except Exception as e:
+                logger.error(f"Error consuming index events: {str(e)}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 300)
+
+    def _consume_batch(self, source: EventSource) -> None:
+        """Apply one poll of events and acknowledge the messages that were
+        applied; the others are redelivered by the queue"""
+        batches = source.poll()
+        applied = [receipt for events, receipt in batches if self._apply(events)]
+        source.ack(applied)
+
+    def _apply(self, events: List[ChangeEvent]) -> bool:
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        try:
+            for event in events:
+                # Events of buckets nobody indexes yet are dropped; the
+                # first walk of such a bucket lists it in full anyway
+                for provider_key, bucket in subscribers:
+                    if bucket and event.bucket and event.bucket != bucket:
+                        continue
+                    self.index.apply_change(provider_key, event)
+        except Exception as e:
+            logger.error(f"Error applying index events: {str(e)}")
+            return False
+        return True
+
+
+# Create global instances
+metadata_index = MetadataIndex()
+bucket_indexer = BucketIndexer(metadata_index)
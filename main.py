@@ -1,7 +1,6 @@
 import logging
 import os
 
-from app import app
 from config import s3_config
 
 logging.basicConfig(level=logging.INFO)
@@ -27,8 +26,13 @@ if __name__ == "__main__":
     is_production = os.environ.get("PRODUCTION", "false").lower() == "true"
 
     if is_production:
-        # Production settings
-        app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5001)), debug=False)
+        # Gunicorn, see server.py. Workers import the app after forking, so
+        # it must not be imported here.
+        from server import run_server
+
+        run_server()
     else:
         # Development settings
+        from app import app
+
         app.run(host="0.0.0.0", port=5001, debug=True)
@@ -0,0 +1,373 @@
+import hmac
+import io
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Iterable, Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Bearer token required by /metrics, which is not served without one
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# StorageProvider methods timed for every backend
+PROVIDER_OPERATIONS = (
+    "list_files",
+    "list_directory",
+    "upload_file",
+    "download_file",
+    "get_file_info",
+    "get_file_url",
+    "get_file_urls",
+    "delete_file",
+    "delete_files",
+    "copy_file",
+)
+# Listings are lazy: their time runs until the caller stops iterating
+LAZY_OPERATIONS = ("list_files", "list_directory")
+
+# Storage calls range from a cached HEAD to a multi-GB upload
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    300,
+    1800,
+)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests served", ["route", "method", "status"]
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time from request to the end of the response body",
+    ["route", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+STORAGE_OPERATION_DURATION = Histogram(
+    "storage_operation_duration_seconds",
+    "Duration of StorageProvider calls; downloads until the stream is open",
+    ["provider", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+STORAGE_OPERATION_ERRORS = Counter(
+    "storage_operation_errors_total",
+    "Failed StorageProvider calls by exception type",
+    ["provider", "operation", "exception"],
+)
+STORAGE_BYTES = Counter(
+    "storage_bytes_total",
+    "Bytes sent to (upload) or received from (download) storage providers",
+    ["provider", "direction"],
+)
+STORAGE_TRANSFERS_IN_FLIGHT = Gauge(
+    "storage_transfers_in_flight",
+    "Uploads and downloads currently streaming",
+    ["provider", "direction"],
+    multiprocess_mode="livesum",
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Cache lookups by result; the hit ratio is hit / (hit + miss)",
+    ["cache", "result"],
+)
+
+
+class _CountingReader(io.RawIOBase):
+    """Counts the bytes a provider reads from an upload stream"""
+
+    def __init__(self, stream, count: Callable[[int], None]):
+        super().__init__()
+        self.stream = stream
+        self.count = count
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.stream.read(size)
+        self.count(len(chunk))
+        return chunk
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+
+def provider_label(provider: Any) -> str:
+    return provider.provider_type or type(provider).__name__
+
+
+def count_bytes(provider_type: str, direction: str) -> Callable[[int], None]:
+    """Counter of the bytes of ``direction`` ("upload" or "download")"""
+    return STORAGE_BYTES.labels(provider_type, direction).inc
+
+
+def transfer_in_flight(provider_type: str, direction: str) -> Callable[[], None]:
+    """Count a transfer as in flight; call the result when it has ended"""
+    gauge = STORAGE_TRANSFERS_IN_FLIGHT.labels(provider_type, direction)
+    gauge.inc()
+    return gauge.dec
+
+
+def error_class(error: BaseException) -> str:
+    """Class name of the error behind ``error``.
+
+    Providers re-raise SDK errors as ValueError while handling them, so the
+    original error tells failure classes apart.
+    """
+    cause = error.__cause__
+    if cause is None and not error.__suppress_context__:
+        cause = error.__context__
+    return type(cause or error).__name__
+
+
+@contextmanager
+def timed_operation(provider_type: str, operation: str) -> Iterator[None]:
+    """Time a storage call, also one made outside an instrumented provider
+    such as the native S3 calls of the async adapters"""
+    started = time.perf_counter()
+    try:
+        yield
+    except NotImplementedError:
+        # A capability the backend lacks, which callers fall back from
+        raise
+    except Exception as e:
+        STORAGE_OPERATION_ERRORS.labels(provider_type, operation, error_class(e)).inc()
+        raise
+    finally:
+        STORAGE_OPERATION_DURATION.labels(provider_type, operation).observe(
+            time.perf_counter() - started
+        )
+
+
+def _timed_listing(
+    list_entries: Callable[[], Iterator], provider_type: str, operation: str
+) -> Iterator:
+    with timed_operation(provider_type, operation):
+        yield from list_entries()
+
+
+def _instrument(provider_type: str, operation: str, method: Callable) -> Callable:
+    @wraps(method)
+    def instrumented(*args, **kwargs):
+        if operation in LAZY_OPERATIONS:
+            return _timed_listing(
+                lambda: method(*args, **kwargs), provider_type, operation
+            )
+
+        if operation == "upload_file":
+            count = count_bytes(provider_type, "upload")
+            if args:
+                args = (_CountingReader(args[0], count),) + args[1:]
+            else:
+                kwargs["file_obj"] = _CountingReader(kwargs["file_obj"], count)
+            done = transfer_in_flight(provider_type, "upload")
+            try:
+                with timed_operation(provider_type, operation):
+                    return method(*args, **kwargs)
+            finally:
+                done()
+
+        with timed_operation(provider_type, operation):
+            result = method(*args, **kwargs)
+        if operation == "download_file":
+            # The stream is timed until it is open; its body is counted as
+            # the caller reads it
+            result.observe(
+                count_bytes(provider_type, "download"),
+                transfer_in_flight(provider_type, "download"),
+            )
+        return result
+
+    return instrumented
+
+
+def instrument_provider(provider: Any) -> Any:
+    """Time every storage operation of ``provider``.
+
+    Methods are wrapped on the instance, so every backend is covered without
+    changes to it, and overrides that call ``super()`` are counted once.
+    """
+    provider_type = provider_label(provider)
+    for operation in PROVIDER_OPERATIONS:
+        method = getattr(provider, operation, None)
+        if method is not None:
+            setattr(provider, operation, _instrument(provider_type, operation, method))
+    return provider
+
+
+def instrument_cache(cache: Any, name: str) -> Any:
+    """Count the hits and misses of a cache's ``get(...)``,
+    which returns None on a miss, and ``get_many(owner, keys, ...)``, which
+    returns the entries found"""
+    lookups = {result: CACHE_LOOKUPS.labels(name, result) for result in ("hit", "miss")}
+
+    if hasattr(cache, "get"):
+        get = cache.get
+
+        @wraps(get)
+        def counted_get(*args, **kwargs):
+            value = get(*args, **kwargs)
+            lookups["miss" if value is None else "hit"].inc()
+            return value
+
+        cache.get = counted_get
+
+    if hasattr(cache, "get_many"):
+        get_many = cache.get_many
+
+        @wraps(get_many)
+        def counted_get_many(owner, keys, *args, **kwargs):
+            keys = list(keys)
+            found = get_many(owner, keys, *args, **kwargs)
+            lookups["hit"].inc(len(found))
+            lookups["miss"].inc(len(keys) - len(found))
+            return found
+
+        cache.get_many = counted_get_many
+    return cache
+
+
+def observe_request(route: str, method: str, status: int, duration: float) -> None:
+    HTTP_REQUESTS.labels(route, method, str(status)).inc()
+    HTTP_REQUEST_DURATION.labels(route, method).observe(duration)
+
+
+def render_metrics() -> bytes:
+    """Exposition of all metrics; with PROMETHEUS_MULTIPROC_DIR set, those
+    of every worker process combined"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def authorized(authorization: str) -> bool:
+    return bool(METRICS_TOKEN) and hmac.compare_digest(
+        authorization or "", f"Bearer {METRICS_TOKEN}"
+    )
+
+
+class _ObservedBody:
+    """WSGI response iterable that calls ``on_close`` once the server has
+    sent the body and closed it"""
+
+    def __init__(self, body: Iterable[bytes], on_close: Callable[[], None]):
+        self.body = body
+        self.on_close = on_close
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self.body)
+
+    def close(self) -> None:
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            self.on_close()
+
+
+class RequestMetricsMiddleware:
+    """Times every request of a WSGI app until its body has been sent.
+
+    The time is recorded when the server closes the response iterable,
+    which also covers streamed and ``direct_passthrough`` responses such
+    as downloads, and requests served through an ASGI adapter. Bodies of
+    the server's ``wsgi.file_wrapper`` are returned as they are, so the
+    server can still send them with sendfile.
+    """
+
+    def __init__(self, wsgi_app: Callable, url_map):
+        self.wsgi_app = wsgi_app
+        self.url_map = url_map
+
+    def route(self, environ: dict) -> str:
+        from werkzeug.exceptions import HTTPException
+
+        try:
+            rule, _ = self.url_map.bind_to_environ(environ).match(return_rule=True)
+        except HTTPException:
+            return "unmatched"
+        return rule.rule
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        started = time.perf_counter()
+        route = self.route(environ)
+        method = environ.get("REQUEST_METHOD", "GET")
+        status = [500]
+
+        def observed_start_response(status_line, headers, exc_info=None):
+            status[0] = int(status_line.split(" ", 1)[0])
+            return start_response(status_line, headers, exc_info)
+
+        def record() -> None:
+            observe_request(route, method, status[0], time.perf_counter() - started)
+
+        try:
+            body = self.wsgi_app(environ, observed_start_response)
+        except Exception:
+            record()
+            raise
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if isinstance(file_wrapper, type) and isinstance(body, file_wrapper):
+            return self._observe_file(body, record)
+        return _ObservedBody(body, record)
+
+    @staticmethod
+    def _observe_file(body: Any, record: Callable[[], None]) -> Any:
+        """Hook ``record`` into the ``close`` of a file wrapper body"""
+        close = getattr(body, "close", None)
+
+        def observed_close() -> None:
+            try:
+                if close is not None:
+                    close()
+            finally:
+                record()
+
+        try:
+            body.close = observed_close
+        except AttributeError:
+            # A wrapper that cannot be hooked is timed until it is returned
+            record()
+        return body
+
+
+def init_app(app) -> None:
+    """Time every request of a Flask app and serve /metrics, which answers
+    404 unless METRICS_TOKEN is set"""
+    from flask import Response, abort, request
+
+    app.wsgi_app = RequestMetricsMiddleware(app.wsgi_app, app.url_map)
+
+    def metrics_view():
+        if not METRICS_TOKEN:
+            abort(404)
+        if not authorized(request.headers.get("Authorization")):
+            return Response("Unauthorized\n", status=401)
+        return Response(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,553 @@
+import asyncio
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import secrets
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, Awaitable, BinaryIO, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+# When the total size is unknown, the part size doubles every this many
+# parts so that very large streams still fit within the part count limit
+PART_SIZE_GROWTH_INTERVAL = 1000
+
+# GCS compose accepts at most this many source objects per call
+GCS_MAX_COMPOSE_SOURCES = 32
+# Bucket-root prefix of the temporary part objects of GCS uploads. Listings,
+# the metadata index and sync skip it. A bucket lifecycle rule should delete
+# what is left there by uploads whose process died (see the README).
+UPLOAD_STAGING_PREFIX = ".s3filesharegui-uploads/"
+
+# Ranged part copies move no data through the app, so they use much larger
+# parts than uploads to keep the number of calls down
+COPY_PART_SIZE = 512 * MB
+
+# Headers copied onto the destination of a multipart copy, which unlike
+# CopyObject does not carry them over by itself
+S3_COPY_HEADERS = (
+    "ContentType",
+    "ContentEncoding",
+    "ContentDisposition",
+    "ContentLanguage",
+    "CacheControl",
+    "Metadata",
+)
+
+
+@dataclass(frozen=True)
+class UploadTuning:
+    """Multipart settings for one storage backend"""
+
+    part_size: int
+    concurrency: int
+    min_part_size: int = 5 * MB
+    max_part_size: int = 5 * GB
+    max_parts: int = 10000
+
+    def part_size_for(self, total_size: Optional[int]) -> int:
+        """Smallest allowed part size that keeps ``total_size`` within max_parts"""
+        part_size = max(self.part_size, self.min_part_size)
+        if total_size:
+            needed = -(-total_size // self.max_parts)  # ceiling division
+            part_size = max(part_size, needed)
+        return min(part_size, self.max_part_size)
+
+
+PROVIDER_UPLOAD_TUNING = {
+    "aws": UploadTuning(part_size=16 * MB, concurrency=8),
+    "wasabi": UploadTuning(part_size=16 * MB, concurrency=8),
+    "cloudflare": UploadTuning(part_size=16 * MB, concurrency=8),
+    # Spaces and Hetzner throttle request bursts per bucket, so they get
+    # fewer, larger parts in flight
+    "digitalocean": UploadTuning(part_size=32 * MB, concurrency=4),
+    "hetzner": UploadTuning(part_size=64 * MB, concurrency=4),
+    # Composed objects have no minimum part size; parts are regular objects
+    "gcs": UploadTuning(part_size=32 * MB, concurrency=8, min_part_size=1),
+    # B2 recommends 100 MB parts for its large file API
+    "backblaze": UploadTuning(part_size=100 * MB, concurrency=4),
+}
+
+DEFAULT_UPLOAD_TUNING = UploadTuning(part_size=16 * MB, concurrency=4)
+
+
+def get_upload_tuning(provider_type: str) -> UploadTuning:
+    """Per-provider defaults, overridable with UPLOAD_PART_SIZE and UPLOAD_CONCURRENCY"""
+    tuning = PROVIDER_UPLOAD_TUNING.get(provider_type, DEFAULT_UPLOAD_TUNING)
+    overrides = {}
+    if os.environ.get("UPLOAD_PART_SIZE"):
+        overrides["part_size"] = int(os.environ["UPLOAD_PART_SIZE"])
+    if os.environ.get("UPLOAD_CONCURRENCY"):
+        overrides["concurrency"] = max(1, int(os.environ["UPLOAD_CONCURRENCY"]))
+    return replace(tuning, **overrides) if overrides else tuning
+
+
+class MultipartTarget(ABC):
+    """Backend-specific steps of a multipart upload to a single object"""
+
+    @abstractmethod
+    def put_single(self, data: bytes) -> None:
+        """Upload an object small enough to fit in a single part"""
+        pass
+
+    @abstractmethod
+    def begin(self) -> None:
+        pass
+
+    @abstractmethod
+    def upload_part(self, part_number: int, data: bytes) -> Any:
+        """Upload one part; the return value is passed on to :meth:`complete`"""
+        pass
+
+    @abstractmethod
+    def complete(self, parts: List[Any]) -> None:
+        pass
+
+    @abstractmethod
+    def abort(self) -> None:
+        pass
+
+
+def multipart_upload(
+    file_obj: BinaryIO,
+    target: MultipartTarget,
+    tuning: UploadTuning,
+    size: Optional[int] = None,
+) -> None:
+    """Upload a stream through ``target`` with parallel part uploads.
+
+    Parts are read sequentially and uploaded by a pool of
+    ``tuning.concurrency`` threads. At most ``concurrency + 1`` parts are held
+    in memory at once, so memory use is bounded regardless of the object
+    size. ``size`` is an optional hint used to pick the part size.
+    """
+    part_size = tuning.part_size_for(size)
+    data = _read_part(file_obj, part_size)
+    if len(data) < part_size:
+        target.put_single(data)
+        return
+
+    target.begin()
+    try:
+        parts = _upload_parts(file_obj, target, tuning, part_size, data, size)
+        target.complete(parts)
+    except BaseException:
+        logger.warning("Multipart upload failed, aborting")
+        try:
+            target.abort()
+        except Exception as e:
+            logger.error(f"Error aborting multipart upload: {str(e)}")
+        raise
+
+
+def _upload_parts(file_obj, target, tuning, part_size, data, size) -> List[Any]:
+    slots = threading.BoundedSemaphore(tuning.concurrency + 1)
+    failed = threading.Event()
+    futures = []
+
+    def on_done(future):
+        slots.release()
+        if future.exception() is not None:
+            failed.set()
+
+    with ThreadPoolExecutor(
+        max_workers=tuning.concurrency, thread_name_prefix="multipart"
+    ) as pool:
+        # A part takes its slot before it is read and frees it once uploaded,
+        # so the part being read counts towards the bound as well
+        slots.acquire()
+        part_number = 1
+        while data and not failed.is_set():
+            if part_number > tuning.max_parts:
+                raise ValueError("Upload exceeds the maximum number of parts")
+            future = pool.submit(target.upload_part, part_number, data)
+            future.add_done_callback(on_done)
+            futures.append(future)
+
+            part_number += 1
+            if size is None and part_number % PART_SIZE_GROWTH_INTERVAL == 0:
+                part_size = min(part_size * 2, tuning.max_part_size)
+            slots.acquire()
+            data = _read_part(file_obj, part_size)
+
+    # Raises the first part failure, if any
+    return [future.result() for future in futures]
+
+
+def _read_part(file_obj: BinaryIO, part_size: int) -> bytes:
+    """Read exactly ``part_size`` bytes unless the stream ends first"""
+    chunks = []
+    remaining = part_size
+    while remaining > 0:
+        chunk = file_obj.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+class S3MultipartTarget(MultipartTarget):
+    """S3 multipart upload API, shared by every S3-compatible provider"""
+
+    def __init__(self, client, bucket: str, key: str):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = None
+
+    def put_single(self, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self.key, Body=data)
+
+    def begin(self) -> None:
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+        self.upload_id = response["UploadId"]
+
+    def upload_part(self, part_number: int, data: bytes) -> dict:
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def complete(self, parts: List[dict]) -> None:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort(self) -> None:
+        if self.upload_id:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+
+
+def s3_multipart_copy(
+    client, bucket: str, source: str, destination: str, size: int, tuning: UploadTuning
+) -> None:
+    """Server-side copy of an object too large for CopyObject.
+
+    The destination is assembled from ranged ``UploadPartCopy`` calls, run
+    ``tuning.concurrency`` at a time.
+    """
+    head = client.head_object(Bucket=bucket, Key=source)
+    params = {name: head[name] for name in S3_COPY_HEADERS if head.get(name)}
+    part_size = replace(tuning, part_size=COPY_PART_SIZE).part_size_for(size)
+    upload_id = client.create_multipart_upload(
+        Bucket=bucket, Key=destination, **params
+    )["UploadId"]
+
+    def copy_part(part_number: int) -> dict:
+        first = (part_number - 1) * part_size
+        last = min(first + part_size, size) - 1
+        response = client.upload_part_copy(
+            Bucket=bucket,
+            Key=destination,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource={"Bucket": bucket, "Key": source},
+            CopySourceRange=f"bytes={first}-{last}",
+            # Fail instead of mixing parts of two versions of the source
+            CopySourceIfMatch=head["ETag"],
+        )
+        return {"PartNumber": part_number, "ETag": response["CopyPartResult"]["ETag"]}
+
+    try:
+        with ThreadPoolExecutor(
+            max_workers=tuning.concurrency, thread_name_prefix="multipart-copy"
+        ) as pool:
+            parts = list(pool.map(copy_part, range(1, -(-size // part_size) + 1)))
+        client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=destination,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except BaseException:
+        logger.warning("Multipart copy failed, aborting")
+        try:
+            client.abort_multipart_upload(
+                Bucket=bucket, Key=destination, UploadId=upload_id
+            )
+        except Exception as e:
+            logger.error(f"Error aborting multipart copy: {str(e)}")
+        raise
+
+
+def is_upload_staging(name: str) -> bool:
+    """Whether ``name`` is a temporary part object rather than user data"""
+    return name.startswith(UPLOAD_STAGING_PREFIX)
+
+
+class GCSComposeTarget(MultipartTarget):
+    """Parallel upload to GCS: parts become temporary objects that are composed.
+
+    Compose takes at most 32 sources, so larger uploads are composed in
+    rounds. Temporary objects are deleted once the final object exists.
+    """
+
+    def __init__(self, bucket, name: str):
+        self.bucket = bucket
+        self.name = name
+        # upload_from_string would otherwise store every object as text/plain
+        self.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.temp_prefix = f"{UPLOAD_STAGING_PREFIX}{secrets.token_hex(16)}/"
+        self.temp_names: List[str] = []
+        self._lock = threading.Lock()
+
+    def put_single(self, data: bytes) -> None:
+        self.bucket.blob(self.name).upload_from_string(
+            data, content_type=self.content_type
+        )
+
+    def begin(self) -> None:
+        pass
+
+    def upload_part(self, part_number: int, data: bytes) -> str:
+        name = f"{self.temp_prefix}part-{part_number:05d}"
+        self.bucket.blob(name).upload_from_string(data, content_type=self.content_type)
+        with self._lock:
+            self.temp_names.append(name)
+        return name
+
+    def complete(self, parts: List[str]) -> None:
+        sources = parts
+        round_number = 0
+        while len(sources) > GCS_MAX_COMPOSE_SOURCES:
+            round_number += 1
+            composed = []
+            for index in range(0, len(sources), GCS_MAX_COMPOSE_SOURCES):
+                name = f"{self.temp_prefix}compose-{round_number}-{index:05d}"
+                self._compose(sources[index : index + GCS_MAX_COMPOSE_SOURCES], name)
+                self.temp_names.append(name)
+                composed.append(name)
+            sources = composed
+        self._compose(sources, self.name)
+        self._delete_temp()
+
+    def abort(self) -> None:
+        self._delete_temp()
+
+    def _compose(self, sources: List[str], name: str) -> None:
+        destination = self.bucket.blob(name)
+        destination.content_type = self.content_type
+        destination.compose([self.bucket.blob(source) for source in sources])
+
+    def _delete_temp(self) -> None:
+        for name in self.temp_names:
+            try:
+                self.bucket.blob(name).delete()
+            except Exception as e:
+                logger.warning(f"Error deleting temporary part {name}: {str(e)}")
+        self.temp_names = []
+
+
+class B2LargeFileTarget(MultipartTarget):
+    """Backblaze B2 large file API"""
+
+    def __init__(self, b2_api, bucket, name: str):
+        self.session = b2_api.session
+        self.bucket = bucket
+        self.name = name
+        self.file_id = None
+
+    def put_single(self, data: bytes) -> None:
+        self.bucket.upload_bytes(data, self.name)
+
+    def begin(self) -> None:
+        response = self.session.start_large_file(
+            self.bucket.id_, self.name, "b2/x-auto", {}
+        )
+        self.file_id = response["fileId"]
+
+    def upload_part(self, part_number: int, data: bytes) -> str:
+        sha1 = hashlib.sha1(data).hexdigest()
+        self.session.upload_part(
+            self.file_id, part_number, len(data), sha1, io.BytesIO(data)
+        )
+        return sha1
+
+    def complete(self, parts: List[str]) -> None:
+        self.session.finish_large_file(self.file_id, parts)
+
+    def abort(self) -> None:
+        if self.file_id:
+            self.session.cancel_large_file(self.file_id)
+
+
+class AsyncMultipartTarget(ABC):
+    """:class:`MultipartTarget` for the async server"""
+
+    @abstractmethod
+    async def put_single(self, data: bytes) -> None:
+        pass
+
+    @abstractmethod
+    async def begin(self) -> None:
+        pass
+
+    @abstractmethod
+    async def upload_part(self, part_number: int, data: bytes) -> Any:
+        pass
+
+    @abstractmethod
+    async def complete(self, parts: List[Any]) -> None:
+        pass
+
+    @abstractmethod
+    async def abort(self) -> None:
+        pass
+
+
+class ThreadedMultipartTarget(AsyncMultipartTarget):
+    """Runs the steps of a blocking target through ``run``, an async callable
+    that executes a function on a thread pool"""
+
+    def __init__(self, target: MultipartTarget, run: Callable[..., Awaitable[Any]]):
+        self.target = target
+        self.run = run
+
+    async def put_single(self, data: bytes) -> None:
+        await self.run(self.target.put_single, data)
+
+    async def begin(self) -> None:
+        await self.run(self.target.begin)
+
+    async def upload_part(self, part_number: int, data: bytes) -> Any:
+        return await self.run(self.target.upload_part, part_number, data)
+
+    async def complete(self, parts: List[Any]) -> None:
+        await self.run(self.target.complete, parts)
+
+    async def abort(self) -> None:
+        await self.run(self.target.abort)
+
+
+class AioS3MultipartTarget(AsyncMultipartTarget):
+    """:class:`S3MultipartTarget` on an aiobotocore client"""
+
+    def __init__(self, client, bucket: str, key: str):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = None
+
+    async def put_single(self, data: bytes) -> None:
+        await self.client.put_object(Bucket=self.bucket, Key=self.key, Body=data)
+
+    async def begin(self) -> None:
+        response = await self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=self.key
+        )
+        self.upload_id = response["UploadId"]
+
+    async def upload_part(self, part_number: int, data: bytes) -> dict:
+        response = await self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    async def complete(self, parts: List[dict]) -> None:
+        await self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    async def abort(self) -> None:
+        if self.upload_id:
+            await self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+
+
+async def async_multipart_upload(
+    read: Callable[[int], Awaitable[bytes]],
+    target: AsyncMultipartTarget,
+    tuning: UploadTuning,
+    size: Optional[int] = None,
+) -> None:
+    """:func:`multipart_upload` for the async server.
+
+    ``read(n)`` returns up to ``n`` bytes of the request body, or ``b""``
+    at its end. Parts are uploaded as tasks while the next part is read,
+    with the same ``concurrency + 1`` bound on the parts held in memory.
+    """
+    part_size = tuning.part_size_for(size)
+    data = await _read_part_async(read, part_size)
+    if len(data) < part_size:
+        await target.put_single(data)
+        return
+
+    await target.begin()
+    tasks = []
+    try:
+        # Slots are taken before a part is read, as in multipart_upload
+        slots = asyncio.Semaphore(tuning.concurrency + 1)
+        await slots.acquire()
+        part_number = 1
+        while data:
+            if part_number > tuning.max_parts:
+                raise ValueError("Upload exceeds the maximum number of parts")
+            if any(_task_failed(task) for task in tasks):
+                break
+            task = asyncio.ensure_future(target.upload_part(part_number, data))
+            task.add_done_callback(lambda _: slots.release())
+            tasks.append(task)
+
+            part_number += 1
+            if size is None and part_number % PART_SIZE_GROWTH_INTERVAL == 0:
+                part_size = min(part_size * 2, tuning.max_part_size)
+            await slots.acquire()
+            data = await _read_part_async(read, part_size)
+
+        # Raises the first part failure, if any
+        parts = await asyncio.gather(*tasks)
+        await target.complete(list(parts))
+    except BaseException:
+        logger.warning("Multipart upload failed, aborting")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await target.abort()
+        except Exception as e:
+            logger.error(f"Error aborting multipart upload: {str(e)}")
+        raise
+
+
+def _task_failed(task: asyncio.Future) -> bool:
+    return task.done() and not task.cancelled() and task.exception() is not None
+
+
+async def _read_part_async(
+    read: Callable[[int], Awaitable[bytes]], part_size: int
+) -> bytes:
+    chunks = []
+    remaining = part_size
+    while remaining > 0:
+        chunk = await read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
@@ -0,0 +1,182 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from storage_providers import StorageProvider, get_storage_provider
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = int(os.environ.get("PROVIDER_POOL_MAX_SIZE", 32))
+DEFAULT_IDLE_TIMEOUT = int(os.environ.get("PROVIDER_POOL_IDLE_TIMEOUT", 900))
+
+
+def provider_cache_key(provider_type: str, provider_config: dict) -> str:
+    """Stable identity for a provider configuration.
+
+    Credentials are part of the configuration, so only a digest is ever kept.
+    """
+    payload = json.dumps([provider_type, provider_config], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _RegistryEntry:
+    __slots__ = ("provider", "last_used", "leases")
+
+    def __init__(self, provider: StorageProvider):
+        self.provider = provider
+        self.last_used = time.monotonic()
+        self.leases = 0
+
+
+class ProviderRegistry:
+    """Thread-safe pool of live storage providers shared across requests.
+
+    Building a provider is expensive (boto3 client construction, B2 account
+    authorization, GCS credential parsing), so instances are kept per
+    configuration and reused together with their HTTP connection pools.
+    Entries unused for ``idle_timeout`` seconds are closed, and the pool never
+    holds more than ``max_size`` idle providers.
+    """
+
+    def __init__(
+        self, max_size: int = DEFAULT_MAX_SIZE, idle_timeout: int = DEFAULT_IDLE_TIMEOUT
+    ):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _RegistryEntry]" = OrderedDict()
+        self._creation_locks: Dict[str, threading.Lock] = {}
+        # Providers evicted while a request still held them; closed on release
+        self._retired: Dict[int, _RegistryEntry] = {}
+
+    def acquire(self, provider_type: str, provider_config: dict) -> StorageProvider:
+        """Return a pooled provider and mark it as in use until released"""
+        key = provider_cache_key(provider_type, provider_config)
+        provider = self._checkout(key)
+        if provider is not None:
+            return provider
+
+        with self._lock:
+            creation_lock = self._creation_locks.setdefault(key, threading.Lock())
+
+        # Only one thread builds a given provider; the others wait and reuse it
+        with creation_lock:
+            provider = self._checkout(key)
+            if provider is not None:
+                return provider
+
+            logger.debug(f"Creating pooled {provider_type} provider")
+            try:
+                provider = get_storage_provider(provider_type, **provider_config)
+            except Exception:
+                with self._lock:
+                    self._creation_locks.pop(key, None)
+                raise
+            entry = _RegistryEntry(provider)
+            entry.leases = 1
+            # Publishing the entry and dropping the creation lock together
+            # leaves no gap in which another thread builds a second provider
+            with self._lock:
+                self._entries[key] = entry
+                self._creation_locks.pop(key, None)
+                evicted = self._collect_evictions()
+        self._close_all(evicted)
+        return provider
+
+    def release(self, provider: StorageProvider) -> None:
+        """Return a provider obtained from :meth:`acquire` to the pool"""
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.provider is provider:
+                    entry.leases = max(0, entry.leases - 1)
+                    entry.last_used = time.monotonic()
+                    evicted = self._collect_evictions()
+                    break
+            else:
+                entry = self._retired.get(id(provider))
+                if entry is None:
+                    return
+                entry.leases = max(0, entry.leases - 1)
+                if entry.leases:
+                    return
+                del self._retired[id(provider)]
+                evicted = [provider]
+        # Closing can wait on the network, so it is done outside the lock
+        self._close_all(evicted)
+
+    @contextmanager
+    def lease(
+        self, provider_type: str, provider_config: dict
+    ) -> Iterator[StorageProvider]:
+        provider = self.acquire(provider_type, provider_config)
+        try:
+            yield provider
+        finally:
+            self.release(provider)
+
+    def evict_idle(self) -> None:
+        """Close providers that have been idle for longer than the timeout"""
+        with self._lock:
+            evicted = self._collect_evictions()
+        self._close_all(evicted)
+
+    def close(self) -> None:
+        """Close every pooled provider; used on worker shutdown"""
+        with self._lock:
+            providers = [entry.provider for entry in self._entries.values()]
+            providers.extend(entry.provider for entry in self._retired.values())
+            self._entries.clear()
+            self._retired.clear()
+        self._close_all(providers)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _checkout(self, key: str) -> Optional[StorageProvider]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry.leases += 1
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(key)
+            return entry.provider
+
+    def _collect_evictions(self) -> List[StorageProvider]:
+        """Drop idle and over-capacity entries. Caller must hold the lock."""
+        now = time.monotonic()
+        evicted = []
+        for key in list(self._entries):
+            entry = self._entries[key]
+            idle = now - entry.last_used > self.idle_timeout
+            # Least recently used entries come first; busy ones are kept
+            over_capacity = len(self._entries) > self.max_size and not entry.leases
+            if not (over_capacity or idle):
+                continue
+            del self._entries[key]
+            if entry.leases:
+                self._retired[id(entry.provider)] = entry
+            else:
+                evicted.append(entry.provider)
+        return evicted
+
+    @staticmethod
+    def _close_all(providers: List[StorageProvider]) -> None:
+        for provider in providers:
+            try:
+                provider.close()
+            except Exception as e:
+                logger.warning(f"Error closing storage provider: {str(e)}")
+
+
+# Create a global instance
+provider_registry = ProviderRegistry()
+atexit.register(provider_registry.close)
@@ -0,0 +1,190 @@
+import importlib
+import logging
+import math
+import os
+import sys
+import tempfile
+from typing import Optional
+
+from gunicorn.app.base import BaseApplication
+
+logger = logging.getLogger(__name__)
+
+# "sync" (one request per process), "gthread" (a thread per request) or
+# "async" (the ASGI app of asgi.py on uvicorn workers)
+SERVER_WORKER_CLASS = os.environ.get("SERVER_WORKER_CLASS", "gthread").lower()
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    "async": "uvicorn.workers.UvicornWorker",
+}
+# Requests, mostly uploads and downloads, expected to be in flight at once.
+# Thread counts are derived from it.
+SERVER_CONCURRENCY = int(os.environ.get("SERVER_CONCURRENCY", 64))
+
+# Keep-alive above the usual 60 s load balancer idle timeout, so the
+# balancer closes idle connections before the server does
+SERVER_KEEPALIVE = int(os.environ.get("SERVER_KEEPALIVE", 75))
+# In-flight transfers get this long to finish when a worker is recycled or
+# the server shuts down
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", 300))
+# Workers are replaced after this many requests (with 10% jitter) so slow
+# leaks cannot accumulate; 0 disables recycling. Sync and threaded workers
+# running API transfers are only recycled once those have ended.
+SERVER_MAX_REQUESTS = int(os.environ.get("SERVER_MAX_REQUESTS", 2000))
+
+# SDKs imported once in the master process. Workers fork with them loaded,
+# which shortens their start and shares the pages between them. The app
+# itself is imported per worker, after the fork, as it opens SQLite
+# connections at import.
+PRELOAD_MODULES = (
+    "boto3",
+    "botocore",
+    "b2sdk.v2",
+    "google.cloud.storage",
+    "storage_providers",
+)
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on, which in containers can be fewer than
+    the host has"""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def server_options(
+    worker_class: str = SERVER_WORKER_CLASS, cpus: Optional[int] = None
+) -> dict:
+    """Gunicorn settings for ``worker_class``, sized for the machine.
+
+    Sync workers serve one request each, so there are ``2 * cpus + 1`` of
+    them, and a long transfer may take up the whole timeout. Threaded and
+    async workers run one process per CPU. Threaded workers split
+    SERVER_CONCURRENCY between their threads. Their timeout only detects
+    hung workers, since long requests do not block the heartbeat.
+    WEB_CONCURRENCY, SERVER_THREADS and SERVER_TIMEOUT override the
+    derived values.
+    """
+    if worker_class not in WORKER_CLASSES:
+        raise ValueError(
+            f"SERVER_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}"
+        )
+    cpus = cpus or available_cpus()
+    if worker_class == "sync":
+        workers, threads, timeout = 2 * cpus + 1, 1, 3600
+    else:
+        workers, timeout = max(2, cpus), 120
+        threads = 1
+        if worker_class == "gthread":
+            threads = max(4, math.ceil(SERVER_CONCURRENCY / workers))
+
+    options = {
+        "bind": f"0.0.0.0:{os.environ.get('PORT', 5001)}",
+        "worker_class": WORKER_CLASSES[worker_class],
+        "workers": int(os.environ.get("WEB_CONCURRENCY", workers)),
+        "threads": int(os.environ.get("SERVER_THREADS", threads)),
+        "timeout": int(os.environ.get("SERVER_TIMEOUT", timeout)),
+        "graceful_timeout": SERVER_GRACEFUL_TIMEOUT,
+        "keepalive": SERVER_KEEPALIVE,
+        "max_requests": SERVER_MAX_REQUESTS,
+        "max_requests_jitter": SERVER_MAX_REQUESTS // 10,
+        # TLS ends at the proxy; its X-Forwarded-Proto marks requests secure.
+        # Only a local proxy is trusted unless FORWARDED_ALLOW_IPS widens it,
+        # since any trusted client can claim HTTPS
+        "forwarded_allow_ips": os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        "accesslog": "-",
+        "on_starting": preload_modules,
+        "pre_request": defer_recycling,
+        "child_exit": discard_worker_metrics,
+    }
+    # Heartbeat files on tmpfs avoid stalls on slow container filesystems
+    if os.path.isdir("/dev/shm"):
+        options["worker_tmp_dir"] = "/dev/shm"
+    return options
+
+
+def preload_modules(server) -> None:
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"Could not preload {name}: {str(e)}")
+
+
+def defer_recycling(worker, req) -> None:
+    """Keep a worker that runs API transfers from being recycled, which would
+    stop them; it is recycled by its first request after they have ended.
+
+    Runs before the worker counts the request against its max_requests.
+    """
+    from transfer import transfer_manager
+
+    if not hasattr(worker, "recycle_after"):
+        worker.recycle_after = worker.max_requests
+    if transfer_manager.running():
+        worker.max_requests = sys.maxsize
+    else:
+        worker.max_requests = worker.recycle_after
+
+
+def discard_worker_metrics(server, worker) -> None:
+    """Drop the live gauges of a worker that exited; its counters are kept"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+class Server(BaseApplication):
+    """Gunicorn running the Flask app, or the ASGI app for async workers"""
+
+    def __init__(self, worker_class: str = SERVER_WORKER_CLASS):
+        self.worker_class = worker_class
+        self.options = server_options(worker_class)
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        if self.worker_class == "async":
+            from asgi import application
+
+            return application
+        from app import app
+
+        return app
+
+
+def run_server() -> None:
+    # Workers write their metrics to files here, so that /metrics reports
+    # all of them whichever worker serves it. It must be set before the
+    # first import of prometheus_client.
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="s3filesharegui-metrics-")
+    )
+    server = Server()
+    options = server.options
+    # A per-process cache would keep serving a listing that a write through
+    # another worker has made stale. Workers import cache.py after the fork,
+    # so they pick this up.
+    if options["workers"] > 1:
+        backend = os.environ.setdefault("CACHE_BACKEND", "sqlite").lower()
+        if backend == "memory":
+            logger.warning(
+                "CACHE_BACKEND=memory is private to each of the "
+                f"{options['workers']} workers; listings may be stale for up "
+                "to LIST_CACHE_TTL seconds after a change"
+            )
+    logger.info(
+        f"Starting {options['workers']} {server.worker_class} workers "
+        f"with {options['threads']} threads each on {options['bind']}"
+    )
+    server.run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_server()
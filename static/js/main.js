@@ -7,9 +7,20 @@ document.addEventListener('DOMContentLoaded', () => {
     const currentPath = document.getElementById('currentPath');
     const newFolderBtn = document.getElementById('newFolderBtn');
     const toggleVisibilityBtn = document.getElementById('toggleVisibility');
+    const searchInput = document.getElementById('searchInput');
     let currentPathValue = '';
     let showHiddenFiles = false;
     let hiddenFiles = new Set();
+    let nextCursor = null;
+    let searchTimer = null;
+
+    // Preview URLs are signed on demand for rows scrolled into view
+    const previewUrls = new Map();
+    const pendingPreviewKeys = new Set();
+    let previewFlushTimer = null;
+    const previewObserver = 'IntersectionObserver' in window
+        ? new IntersectionObserver(onRowsVisible, { rootMargin: '200px' })
+        : null;
 
     // Get CSRF token from meta tag
     const csrfToken = document.querySelector('meta[name="csrf-token"]')?.getAttribute('content');
@@ -110,15 +121,100 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Files at least this large are uploaded straight from the browser to the
+    // bucket in parallel parts, bypassing the app server
+    const DIRECT_UPLOAD_THRESHOLD = 64 * 1024 * 1024;
+    const PART_URL_BATCH = 50;
+    const PART_RETRIES = 3;
+
+    // Files at least this large are hashed first so content already in the
+    // bucket is copied server-side instead of uploaded; 0 when disabled
+    const DEDUP_MIN_SIZE = parseInt(
+        document.querySelector('meta[name="dedup-min-size"]')?.getAttribute('content') || '0', 10);
+    const CONTENT_HASH_BLOCK_SIZE = 8 * 1024 * 1024;
+
+    // Same as dedup.ContentHasher on the server: SHA-256 of the SHA-256
+    // digests of 8 MiB blocks, so large files never sit in memory whole
+    async function contentHash(file) {
+        const blockCount = Math.ceil(file.size / CONTENT_HASH_BLOCK_SIZE);
+        const digests = new Uint8Array(blockCount * 32);
+        for (let i = 0; i < blockCount; i++) {
+            const offset = i * CONTENT_HASH_BLOCK_SIZE;
+            const block = await file.slice(offset, offset + CONTENT_HASH_BLOCK_SIZE).arrayBuffer();
+            digests.set(new Uint8Array(await crypto.subtle.digest('SHA-256', block)), i * 32);
+        }
+        const digest = await crypto.subtle.digest('SHA-256', digests);
+        return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    // Whether the server stored the file as a copy of identical content
+    async function tryDeduplicate(file) {
+        if (!DEDUP_MIN_SIZE || file.size < DEDUP_MIN_SIZE || !window.crypto?.subtle) {
+            return false;
+        }
+        try {
+            const hash = await contentHash(file);
+            const { response, data } = await postJSON('/upload/dedup', {
+                filename: file.name,
+                folder: currentPathValue,
+                size: file.size,
+                content_hash: hash
+            });
+            return response.ok && data.deduplicated;
+        } catch (error) {
+            console.error('Dedup check error:', error);
+            return false;
+        }
+    }
+
+    function markUploadComplete(progressBarContainer, file) {
+        updateProgressBar(progressBarContainer, 100);
+        setTimeout(() => {
+            progressBarContainer.classList.add('opacity-0', 'transition-opacity', 'duration-500');
+            setTimeout(() => progressBarContainer.remove(), 500);
+            showMessage(`${file.name} uploaded successfully`, 'success');
+        }, 1000);
+        listFiles(currentPathValue);
+    }
+
+    function markUploadFailed(progressBarContainer) {
+        progressBarContainer.querySelector('.animate-spin').innerHTML = `
+            <svg class="w-5 h-5 text-red-500" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M6 18L18 6M6 6l12 12"></path>
+            </svg>
+        `;
+    }
+
     async function uploadFile(file) {
+        const progressBarContainer = createProgressBar(file.name);
+
+        if (await tryDeduplicate(file)) {
+            markUploadComplete(progressBarContainer, file);
+            return;
+        }
+
+        if (file.size >= DIRECT_UPLOAD_THRESHOLD) {
+            try {
+                if (await directUpload(file, progressBarContainer)) {
+                    markUploadComplete(progressBarContainer, file);
+                    return;
+                }
+            } catch (error) {
+                console.error('Direct upload error:', error);
+                showMessage(`Upload of ${file.name} interrupted. Select the file again to resume.`, 'error');
+                markUploadFailed(progressBarContainer);
+                return;
+            }
+        }
+
+        // Fields must precede the file: the server streams the file part as
+        // it arrives and only sees fields sent before it
         const formData = new FormData();
-        formData.append('file', file);
         formData.append('folder', currentPathValue);
         if (csrfToken) {
             formData.append('csrf_token', csrfToken);
         }
-
-        const progressBarContainer = createProgressBar(file.name);
+        formData.append('file', file);
 
         try {
             const response = await fetch('/upload', {
@@ -132,29 +228,131 @@ document.addEventListener('DOMContentLoaded', () => {
             const data = await response.json();
             if (!response.ok) {
                 showMessage(data.error || `Failed to upload ${file.name}`, 'error');
-                progressBarContainer.querySelector('.animate-spin').innerHTML = `
-                    <svg class="w-5 h-5 text-red-500" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                        <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M6 18L18 6M6 6l12 12"></path>
-                    </svg>
-                `;
+                markUploadFailed(progressBarContainer);
                 return;
             }
 
-            updateProgressBar(progressBarContainer, 100);
-            setTimeout(() => {
-                progressBarContainer.classList.add('opacity-0', 'transition-opacity', 'duration-500');
-                setTimeout(() => progressBarContainer.remove(), 500);
-                showMessage(`${file.name} uploaded successfully`, 'success');
-            }, 1000);
-            listFiles(currentPathValue);
+            markUploadComplete(progressBarContainer, file);
         } catch (error) {
             console.error('Upload error:', error);
             showMessage(`Failed to upload ${file.name}`, 'error');
-            progressBarContainer.querySelector('.animate-spin').innerHTML = `
-                <svg class="w-5 h-5 text-red-500" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M6 18L18 6M6 6l12 12"></path>
-                </svg>
-            `;
+            markUploadFailed(progressBarContainer);
+        }
+    }
+
+    async function postJSON(url, body) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken
+            },
+            body: JSON.stringify(body)
+        });
+        const data = await response.json();
+        return { response, data };
+    }
+
+    // Upload parts directly to the bucket with presigned URLs. The upload id
+    // is kept in localStorage so re-selecting the same file after a network
+    // drop only sends the missing parts. Returns false when the provider
+    // does not support direct uploads.
+    async function directUpload(file, progressBarContainer) {
+        const resumeKey = `multipart:${currentPathValue}:${file.name}:${file.size}:${file.lastModified}`;
+        let state = JSON.parse(localStorage.getItem(resumeKey) || 'null');
+        const completed = new Map();
+
+        if (state) {
+            const { response, data } = await postJSON('/multipart/parts', {
+                key: state.key,
+                upload_id: state.upload_id
+            });
+            if (response.ok) {
+                data.parts.forEach(part => completed.set(part.PartNumber, part.ETag));
+            } else {
+                localStorage.removeItem(resumeKey);
+                state = null;
+            }
+        }
+
+        if (!state) {
+            const { response, data } = await postJSON('/multipart/initiate', {
+                filename: file.name,
+                folder: currentPathValue,
+                size: file.size
+            });
+            if (response.status === 501) return false;
+            if (!response.ok) throw new Error(data.error || 'Failed to start upload');
+            state = {
+                key: data.key,
+                upload_id: data.upload_id,
+                part_size: data.part_size,
+                concurrency: data.concurrency
+            };
+            localStorage.setItem(resumeKey, JSON.stringify(state));
+        }
+
+        const partCount = Math.max(1, Math.ceil(file.size / state.part_size));
+        const partBytes = n => Math.min(state.part_size, file.size - (n - 1) * state.part_size);
+        const pending = [];
+        let uploadedBytes = 0;
+        for (let n = 1; n <= partCount; n++) {
+            if (completed.has(n)) {
+                uploadedBytes += partBytes(n);
+            } else {
+                pending.push(n);
+            }
+        }
+
+        for (let i = 0; i < pending.length; i += PART_URL_BATCH) {
+            const batch = pending.slice(i, i + PART_URL_BATCH);
+            const { response, data } = await postJSON('/multipart/part-urls', {
+                key: state.key,
+                upload_id: state.upload_id,
+                part_numbers: batch
+            });
+            if (!response.ok) throw new Error(data.error || 'Failed to get part URLs');
+
+            let next = 0;
+            const worker = async () => {
+                while (next < batch.length) {
+                    const partNumber = batch[next++];
+                    const etag = await uploadPart(file, data.urls[partNumber], partNumber, state.part_size);
+                    completed.set(partNumber, etag);
+                    uploadedBytes += partBytes(partNumber);
+                    updateProgressBar(progressBarContainer, Math.min(99, (uploadedBytes / file.size) * 100));
+                }
+            };
+            await Promise.all(Array.from({ length: state.concurrency }, worker));
+        }
+
+        const parts = Array.from(completed, ([PartNumber, ETag]) => ({ PartNumber, ETag }));
+        const { response, data } = await postJSON('/multipart/complete', {
+            key: state.key,
+            upload_id: state.upload_id,
+            parts
+        });
+        if (!response.ok) throw new Error(data.error || 'Failed to complete upload');
+        localStorage.removeItem(resumeKey);
+        return true;
+    }
+
+    async function uploadPart(file, url, partNumber, partSize) {
+        const blob = file.slice((partNumber - 1) * partSize, partNumber * partSize);
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const response = await fetch(url, { method: 'PUT', body: blob });
+                if (!response.ok) {
+                    throw new Error(`Part ${partNumber} failed with status ${response.status}`);
+                }
+                // Requires the bucket CORS policy to expose the ETag header
+                const etag = response.headers.get('ETag');
+                if (!etag) throw new Error('ETag header not exposed by the bucket CORS policy');
+                return etag;
+            } catch (error) {
+                if (attempt >= PART_RETRIES) throw error;
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+            }
         }
     }
 
@@ -193,9 +391,112 @@ document.addEventListener('DOMContentLoaded', () => {
         return parseFloat((bytes / Math.pow(k, i)).toFixed(2)) + ' ' + sizes[i];
     }
 
-    async function listFiles(path = '') {
+    function displayName(name) {
+        return name.startsWith(currentPathValue) ? name.slice(currentPathValue.length) : name;
+    }
+
+    function renderFolderRow(folder) {
+        return `
+            <div onclick="openFolder('${folder.name}')"
+                class="flex items-center p-3 hover:bg-gray-50 rounded-lg transition-colors cursor-pointer">
+                <svg class="w-5 h-5 mr-3 text-yellow-500" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M3 7v10a2 2 0 002 2h14a2 2 0 002-2V9a2 2 0 00-2-2h-6l-2-2H5a2 2 0 00-2 2z"/>
+                </svg>
+                <div class="text-sm font-medium text-gray-900 truncate flex-1">${displayName(folder.name)}</div>
+                <button onclick="event.stopPropagation(); moveItem('${folder.name}')"
+                    class="p-1 hover:bg-blue-100 rounded-full" title="Move or rename">
+                    <svg class="w-5 h-5 text-blue-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                        <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15.232 5.232l3.536 3.536m-2.036-5.036a2.5 2.5 0 113.536 3.536L6.5 21.036H3v-3.572L16.732 3.732z"/>
+                    </svg>
+                </button>
+                <button onclick="event.stopPropagation(); deleteFolder('${folder.name}')"
+                    class="p-1 hover:bg-red-100 rounded-full" title="Delete folder">
+                    <svg class="w-5 h-5 text-red-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                        <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M19 7l-.867 12.142A2 2 0 0116.138 21H7.862a2 2 0 01-1.995-1.858L5 7m5 4v6m4-6v6m1-10V4a1 1 0 00-1-1h-4a1 1 0 00-1 1v3M4 7h16"/>
+                    </svg>
+                </button>
+            </div>
+        `;
+    }
+
+    function renderFileRow(file) {
+        if (file.type === 'folder') return renderFolderRow(file);
+        if (!showHiddenFiles && hiddenFiles.has(file.name)) return '';
+
+        const isImage = file.mime_type && file.mime_type.startsWith('image/');
+        const isPDF = file.mime_type === 'application/pdf';
+        const isVideo = file.mime_type && file.mime_type.startsWith('video/');
+        const fileIcon = getFileIcon(file.mime_type);
+        const fileSize = formatFileSize(file.size || 0);
+        const isHidden = hiddenFiles.has(file.name);
+
+        if (file.preview_url) {
+            previewUrls.set(file.name, file.preview_url);
+        }
+
+        return `
+            <div class="flex items-center justify-between p-3 hover:bg-gray-50 rounded-lg transition-colors ${isHidden ? 'opacity-50' : ''}"
+                ${(isImage || isPDF || isVideo) ? `data-preview-key="${file.name}"` : ''}>
+                <div class="flex items-center flex-grow">
+                    ${fileIcon}
+                    <div class="min-w-0">
+                        <div class="text-sm font-medium text-gray-900 truncate">${displayName(file.name)}</div>
+                        <div class="text-sm text-gray-500">${fileSize}</div>
+                    </div>
+                </div>
+                <div class="flex items-center space-x-2">
+                    ${(isImage || isPDF || isVideo) ? 
+                        `<button onclick="showPreview('${file.name}', '${file.mime_type}')" 
+                            class="p-1 hover:bg-blue-100 rounded-full" title="Preview">
+                            <svg class="w-5 h-5 text-blue-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                                <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15 12a3 3 0 11-6 0 3 3 0 016 0z"/>
+                                <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M2.458 12C3.732 7.943 7.523 5 12 5c4.478 0 8.268 2.943 9.542 7-1.274 4.057-5.064 7-9.542 7-4.477 0-8.268-2.943-9.542-7z"/>
+                            </svg>
+                        </button>` : ''}
+                    <button onclick="shareFile('${file.name}')"
+                        class="p-1 hover:bg-purple-100 rounded-full" title="Share">
+                        <svg class="w-5 h-5 text-purple-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                            <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M8.684 13.342C8.886 12.938 9 12.482 9 12c0-.482-.114-.938-.316-1.342m0 2.684a3 3 0 110-2.684m0 2.684l6.632 3.316m-6.632-6l6.632-3.316m0 0a3 3 0 105.367-2.684 3 3 0 00-5.367 2.684zm0 9.316a3 3 0 105.368 2.684 3 3 0 00-5.368-2.684z"/>
+                        </svg>
+                    </button>
+                    <a href="/download/${encodeURIComponent(file.name)}" 
+                        class="p-1 hover:bg-green-100 rounded-full" title="Download">
+                        <svg class="w-5 h-5 text-green-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                            <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1m-4-4l-4 4m0 0l-4-4m4 4V4"/>
+                        </svg>
+                    </a>
+                    <button onclick="moveItem('${file.name}')"
+                        class="p-1 hover:bg-blue-100 rounded-full" title="Move or rename">
+                        <svg class="w-5 h-5 text-blue-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                            <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15.232 5.232l3.536 3.536m-2.036-5.036a2.5 2.5 0 113.536 3.536L6.5 21.036H3v-3.572L16.732 3.732z"/>
+                        </svg>
+                    </button>
+                    <button onclick="deleteFile('${file.name}')"
+                        class="p-1 hover:bg-red-100 rounded-full" title="Delete">
+                        <svg class="w-5 h-5 text-red-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                            <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M19 7l-.867 12.142A2 2 0 0116.138 21H7.862a2 2 0 01-1.995-1.858L5 7m5 4v6m4-6v6m1-10V4a1 1 0 00-1-1h-4a1 1 0 00-1 1v3M4 7h16"/>
+                        </svg>
+                    </button>
+                    <button onclick="toggleFileVisibility('${file.name}')"
+                        class="p-1 hover:bg-gray-100 rounded-full" title="Toggle visibility">
+                        <svg class="w-5 h-5 text-gray-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                            <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="${isHidden ? 
+                                'M13.875 18.825A10.05 10.05 0 0112 19c-4.478 0-8.268-2.943-9.543-7a9.97 9.97 0 011.563-3.029m5.858.908a3 3 0 114.243 4.243M9.878 9.878l4.242 4.242M9.88 9.88l-3.29-3.29m7.532 7.532l3.29 3.29M3 3l3.59 3.59m0 0A9.953 9.953 0 0112 5c4.478 0 8.268 2.943 9.543 7a10.025 10.025 0 01-4.132 5.411m0 0L21 21' :
+                                'M15 12a3 3 0 11-6 0 3 3 0 016 0z M2.458 12C3.732 7.943 7.523 5 12 5c4.478 0 8.268 2.943 9.542 7-1.274 4.057-5.064 7-9.542 7-4.477 0-8.268-2.943-9.542-7z'}"/>
+                        </svg>
+                    </button>
+                </div>
+            </div>
+        `;
+    }
+
+    async function listFiles(path = '', cursor = null) {
         try {
-            const response = await fetch(`/list?prefix=${encodeURIComponent(path)}`);
+            const params = new URLSearchParams({ prefix: path, previews: 'false' });
+            if (cursor) {
+                params.set('cursor', cursor);
+            }
+            const response = await fetch(`/list?${params}`);
             const data = await response.json();
 
             if (!fileList) {
@@ -208,71 +509,39 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
 
-            if (!data.files || data.files.length === 0) {
-                fileList.innerHTML = '<div class="text-gray-500 p-4">No files found</div>';
+            // Parent folder entry when browsing below the bucket root
+            const parentRow = path && !cursor ? `
+                <div onclick="openParentFolder()"
+                    class="flex items-center p-3 hover:bg-gray-50 rounded-lg transition-colors cursor-pointer text-sm text-gray-600">
+                    ..
+                </div>
+            ` : '';
+
+            if (!cursor && (!data.files || data.files.length === 0)) {
+                fileList.innerHTML = parentRow + '<div class="text-gray-500 p-4">No files found</div>';
                 return;
             }
 
-            const files = data.files.map(file => {
-                if (!showHiddenFiles && hiddenFiles.has(file.name)) return '';
-
-                const isImage = file.mime_type && file.mime_type.startsWith('image/');
-                const isPDF = file.mime_type === 'application/pdf';
-                const isVideo = file.mime_type && file.mime_type.startsWith('video/');
-                const fileIcon = getFileIcon(file.mime_type);
-                const fileSize = formatFileSize(file.size || 0);
-                const isHidden = hiddenFiles.has(file.name);
-
-                return `
-                    <div class="flex items-center justify-between p-3 hover:bg-gray-50 rounded-lg transition-colors ${isHidden ? 'opacity-50' : ''}">
-                        <div class="flex items-center flex-grow">
-                            ${fileIcon}
-                            <div class="min-w-0">
-                                <div class="text-sm font-medium text-gray-900 truncate">${file.name}</div>
-                                <div class="text-sm text-gray-500">${fileSize}</div>
-                            </div>
-                        </div>
-                        <div class="flex items-center space-x-2">
-                            ${(isImage || isPDF || isVideo) ? 
-                                `<button onclick="showPreview('${file.preview_url}', '${file.mime_type}')" 
-                                    class="p-1 hover:bg-blue-100 rounded-full" title="Preview">
-                                    <svg class="w-5 h-5 text-blue-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                                        <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15 12a3 3 0 11-6 0 3 3 0 016 0z"/>
-                                        <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M2.458 12C3.732 7.943 7.523 5 12 5c4.478 0 8.268 2.943 9.542 7-1.274 4.057-5.064 7-9.542 7-4.477 0-8.268-2.943-9.542-7z"/>
-                                    </svg>
-                                </button>` : ''}
-                            <button onclick="shareFile('${file.name}')"
-                                class="p-1 hover:bg-purple-100 rounded-full" title="Share">
-                                <svg class="w-5 h-5 text-purple-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M8.684 13.342C8.886 12.938 9 12.482 9 12c0-.482-.114-.938-.316-1.342m0 2.684a3 3 0 110-2.684m0 2.684l6.632 3.316m-6.632-6l6.632-3.316m0 0a3 3 0 105.367-2.684 3 3 0 00-5.367 2.684zm0 9.316a3 3 0 105.368 2.684 3 3 0 00-5.368-2.684z"/>
-                                </svg>
-                            </button>
-                            <a href="/download/${encodeURIComponent(file.name)}" 
-                                class="p-1 hover:bg-green-100 rounded-full" title="Download">
-                                <svg class="w-5 h-5 text-green-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1m-4-4l-4 4m0 0l-4-4m4 4V4"/>
-                                </svg>
-                            </a>
-                            <button onclick="deleteFile('${file.name}')"
-                                class="p-1 hover:bg-red-100 rounded-full" title="Delete">
-                                <svg class="w-5 h-5 text-red-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M19 7l-.867 12.142A2 2 0 0116.138 21H7.862a2 2 0 01-1.995-1.858L5 7m5 4v6m4-6v6m1-10V4a1 1 0 00-1-1h-4a1 1 0 00-1 1v3M4 7h16"/>
-                                </svg>
-                            </button>
-                            <button onclick="toggleFileVisibility('${file.name}')"
-                                class="p-1 hover:bg-gray-100 rounded-full" title="Toggle visibility">
-                                <svg class="w-5 h-5 text-gray-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="${isHidden ? 
-                                        'M13.875 18.825A10.05 10.05 0 0112 19c-4.478 0-8.268-2.943-9.543-7a9.97 9.97 0 011.563-3.029m5.858.908a3 3 0 114.243 4.243M9.878 9.878l4.242 4.242M9.88 9.88l-3.29-3.29m7.532 7.532l3.29 3.29M3 3l3.59 3.59m0 0A9.953 9.953 0 0112 5c4.478 0 8.268 2.943 9.543 7a10.025 10.025 0 01-4.132 5.411m0 0L21 21' :
-                                        'M15 12a3 3 0 11-6 0 3 3 0 016 0z M2.458 12C3.732 7.943 7.523 5 12 5c4.478 0 8.268 2.943 9.542 7-1.274 4.057-5.064 7-9.542 7-4.477 0-8.268-2.943-9.542-7z'}"/>
-                                </svg>
-                            </button>
-                        </div>
-                    </div>
-                `;
-            }).join('');
+            const files = parentRow + data.files.map(renderFileRow).join('');
+
+            // Subsequent pages are appended below the rows already shown
+            document.getElementById('loadMoreFiles')?.remove();
+            if (cursor) {
+                fileList.insertAdjacentHTML('beforeend', files);
+            } else {
+                fileList.innerHTML = files;
+            }
 
-            fileList.innerHTML = files;
+            observePreviewRows();
+
+            nextCursor = data.next_cursor || null;
+            if (nextCursor) {
+                fileList.insertAdjacentHTML('beforeend', `
+                    <div id="loadMoreFiles" class="p-3 text-center">
+                        <button onclick="loadMoreFiles()" class="text-blue-600 hover:underline">Load more</button>
+                    </div>
+                `);
+            }
         } catch (error) {
             console.error('Error listing files:', error);
             if (fileList) {
@@ -281,6 +550,67 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Searches the server-side metadata index of the whole bucket
+    async function searchFiles(query) {
+        try {
+            const response = await fetch(`/search?${new URLSearchParams({ q: query })}`);
+            const data = await response.json();
+            if (searchInput.value.trim() !== query) return;  // superseded
+
+            if (data.error) {
+                fileList.innerHTML = `<div class="text-red-600 p-4">${data.error}</div>`;
+                return;
+            }
+
+            const notice = data.index && data.index.building
+                ? '<div class="text-gray-500 text-sm p-3">Indexing bucket, results may be incomplete</div>'
+                : '';
+            const rows = data.files.length
+                ? data.files.map(file => renderFileRow({ ...file, type: 'file' })).join('')
+                : '<div class="text-gray-500 p-4">No matching files</div>';
+            fileList.innerHTML = notice + rows;
+            observePreviewRows();
+        } catch (error) {
+            console.error('Error searching files:', error);
+            fileList.innerHTML = '<div class="text-red-600 p-4">Error searching files</div>';
+        }
+    }
+
+    searchInput?.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            const query = searchInput.value.trim();
+            if (query) {
+                searchFiles(query);
+            } else {
+                listFiles(currentPathValue);
+            }
+        }, 300);
+    });
+
+    window.openFolder = function(path) {
+        currentPathValue = path;
+        if (searchInput) {
+            searchInput.value = '';
+        }
+        if (currentPath) {
+            currentPath.textContent = path || 'Root';
+        }
+        listFiles(currentPathValue);
+    };
+
+    window.openParentFolder = function() {
+        const trimmed = currentPathValue.replace(/\/$/, '');
+        const index = trimmed.lastIndexOf('/');
+        openFolder(index === -1 ? '' : trimmed.slice(0, index + 1));
+    };
+
+    window.loadMoreFiles = function() {
+        if (nextCursor) {
+            listFiles(currentPathValue, nextCursor);
+        }
+    };
+
     window.toggleFileVisibility = function(filename) {
         if (hiddenFiles.has(filename)) {
             hiddenFiles.delete(filename);
@@ -300,9 +630,60 @@ document.addEventListener('DOMContentLoaded', () => {
         setTimeout(() => messageDiv.remove(), 3000);
     }
 
-    window.showPreview = function(url, mimeType) {
+    function observePreviewRows() {
+        if (!previewObserver) return;
+        fileList.querySelectorAll('[data-preview-key]').forEach(row => previewObserver.observe(row));
+    }
+
+    function onRowsVisible(entries) {
+        entries.forEach(entry => {
+            if (!entry.isIntersecting) return;
+            const key = entry.target.dataset.previewKey;
+            previewObserver.unobserve(entry.target);
+            if (!previewUrls.has(key)) {
+                pendingPreviewKeys.add(key);
+            }
+        });
+        // Batch rows that become visible together into a single request
+        if (pendingPreviewKeys.size && !previewFlushTimer) {
+            previewFlushTimer = setTimeout(() => {
+                previewFlushTimer = null;
+                const keys = Array.from(pendingPreviewKeys);
+                pendingPreviewKeys.clear();
+                resolvePreviewUrls(keys);
+            }, 100);
+        }
+    }
+
+    async function resolvePreviewUrls(keys) {
+        try {
+            const response = await fetch('/preview-urls', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': csrfToken
+                },
+                body: JSON.stringify({ keys })
+            });
+            const data = await response.json();
+            if (!response.ok) {
+                console.error('Error resolving preview URLs:', data.error);
+                return;
+            }
+            Object.entries(data.urls).forEach(([key, url]) => previewUrls.set(key, url));
+        } catch (error) {
+            console.error('Error resolving preview URLs:', error);
+        }
+    }
+
+    window.showPreview = async function(filename, mimeType) {
         if (!preview) return;
 
+        if (!previewUrls.has(filename)) {
+            await resolvePreviewUrls([filename]);
+        }
+        const url = previewUrls.get(filename);
+
         if (mimeType.startsWith('image/')) {
             preview.innerHTML = `<img src="${url}" class="max-w-full h-auto" alt="Preview">`;
         } else if (mimeType === 'application/pdf') {
@@ -339,6 +720,79 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
+    window.deleteFolder = async function(folder) {
+        if (!confirm(`Delete ${folder} and everything in it?`)) return;
+        await runFolderOperation('/delete_folder', { folder }, 'Deleted');
+    };
+
+    window.moveItem = async function(name) {
+        const isFolder = name.endsWith('/');
+        const current = isFolder ? name.slice(0, -1) : name;
+        const target = prompt('Move or rename to:', current);
+        if (!target || target === current) return;
+        const destination = isFolder ? target.replace(/\/*$/, '/') : target;
+
+        if (isFolder) {
+            await runFolderOperation('/move', { source: name, destination }, 'Moved');
+            return;
+        }
+        try {
+            const { response, data } = await postJSON('/move', { source: name, destination });
+            showMessage(response.ok ? data.message : data.error || 'Move failed',
+                response.ok ? 'success' : 'error');
+        } catch (error) {
+            console.error('Move error:', error);
+            showMessage('Move failed', 'error');
+        }
+        listFiles(currentPathValue);
+    };
+
+    // Folder deletes, copies and moves stream one JSON progress object per line
+    async function runFolderOperation(url, body, verb) {
+        try {
+            const response = await fetch(url, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': csrfToken
+                },
+                body: JSON.stringify(body)
+            });
+
+            if (!response.ok) {
+                const data = await response.json();
+                showMessage(data.error || `${verb} failed`, 'error');
+                return;
+            }
+
+            const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+            let buffer = '';
+            let progress = null;
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += value;
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines.filter(Boolean)) {
+                    progress = JSON.parse(line);
+                    if (!progress.finished) showMessage(`${verb} ${progress.done} files...`);
+                }
+            }
+
+            if (!progress || progress.error || progress.failed) {
+                const failed = progress ? progress.failed : 0;
+                showMessage(progress && progress.error ? progress.error : `${failed} files failed`, 'error');
+            } else {
+                showMessage(`${verb} ${progress.done} files`, 'success');
+            }
+        } catch (error) {
+            console.error(`${url} error:`, error);
+            showMessage(`${verb} failed`, 'error');
+        }
+        listFiles(currentPathValue);
+    }
+
     newFolderBtn.addEventListener('click', () => {
         const folderName = prompt('Enter folder name:');
         if (folderName) {
@@ -4,42 +4,638 @@ import json
 import logging
 import os
 from abc import ABC, abstractmethod
-from typing import BinaryIO, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
 
 import b2sdk.v2 as b2
 import boto3
 import requests
+from botocore.config import Config as BotoConfig
 from google.cloud import storage
+from google.cloud.storage.batch import Batch
 from google.oauth2 import service_account
 
+from metrics import instrument_provider
+from multipart import (
+    B2LargeFileTarget,
+    GCSComposeTarget,
+    MultipartTarget,
+    S3MultipartTarget,
+    UploadTuning,
+    get_upload_tuning,
+    is_upload_staging,
+    multipart_upload,
+    s3_multipart_copy,
+)
+from streaming import (
+    DOWNLOAD_CHUNK_SIZE,
+    DownloadStream,
+    content_disposition,
+    read_chunks,
+)
+
 logger = logging.getLogger(__name__)
 
+# Pooled providers share one client across worker threads, so the connection
+# pool must be large enough for concurrent requests against the same bucket
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 50))
+
+# GCS blob readers issue one ranged request per chunk, so they read in
+# larger chunks than the other backends stream in
+GCS_DOWNLOAD_CHUNK_SIZE = 8 * DOWNLOAD_CHUNK_SIZE
+
+# Maximum page size accepted by b2_list_file_names
+B2_LIST_PAGE_SIZE = 10000
+
+# Hidden file marking an empty B2 folder, as created by the B2 web UI
+B2_FOLDER_PLACEHOLDER = ".bzEmpty"
+
+# Batch deletes: chunks of keys are deleted by this many threads at once
+DELETE_CONCURRENCY = int(os.environ.get("DELETE_CONCURRENCY", 8))
+# Server-side copies of a folder copy or move run in this many threads
+COPY_CONCURRENCY = int(os.environ.get("COPY_CONCURRENCY", 16))
+# Largest object a single CopyObject / b2_copy_file call accepts; larger
+# objects are copied in ranged parts
+MAX_SINGLE_COPY_SIZE = 5 * 1024**3
+# Maximum keys per S3 DeleteObjects request
+S3_DELETE_BATCH_SIZE = 1000
+# Maximum calls per GCS JSON API batch request
+GCS_BATCH_SIZE = 100
+
+# Folders are virtual: "a/b/" groups every key starting with it
+FOLDER_DELIMITER = "/"
+
+
+def _listing_resume_key(start_after: Optional[str]) -> Optional[str]:
+    """Key to resume a delimited listing from.
+
+    Resuming after a folder must skip every key below it, otherwise the
+    backend would roll them up into the same folder entry again.
+    """
+    if start_after and start_after.endswith(FOLDER_DELIMITER):
+        return start_after + "\U0010ffff"
+    return start_after
+
+
+def _merge_directory_page(
+    files: List[dict], folders: List[str], prefix: str, start_after: Optional[str]
+) -> List[dict]:
+    """Combine one page of files and folder prefixes in key order"""
+    entries = [
+        dict(file, type="file")
+        for file in files
+        if file["name"] != prefix  # folder placeholder object
+    ]
+    entries.extend({"name": folder, "type": "folder"} for folder in folders)
+    entries.sort(key=lambda entry: entry["name"])
+    if start_after:
+        entries = [entry for entry in entries if entry["name"] > start_after]
+    return entries
+
+
+def _folder_key(folder: str) -> str:
+    return folder if folder.endswith(FOLDER_DELIMITER) else folder + FOLDER_DELIMITER
+
+
+def _entry_name(entry: dict) -> str:
+    return entry["name"]
+
+
+def _run_in_chunks(
+    action: Callable[[list], Dict[str, str]],
+    items: Iterable,
+    chunk_size: int,
+    concurrency: int,
+    key: Callable = lambda item: item,
+) -> Iterator[Tuple[list, Dict[str, str]]]:
+    """Run ``action`` over chunks of ``items`` in a thread pool.
+
+    Yields each chunk with the error messages ``action`` returned for the
+    keys it failed on, as chunks finish; a chunk that raises fails all of
+    its keys. ``key`` maps an item to its object name.
+
+    ``items`` is consumed lazily with at most two chunks per thread in
+    flight, so a listing feeding it overlaps with the work and memory
+    stays bounded however many keys there are.
+    """
+    items = iter(items)
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bulk") as pool:
+        while True:
+            while len(in_flight) < 2 * concurrency:
+                chunk = list(islice(items, chunk_size))
+                if not chunk:
+                    break
+                in_flight[pool.submit(action, chunk)] = chunk
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = in_flight.pop(future)
+                try:
+                    errors = future.result()
+                except Exception as e:
+                    errors = {key(item): str(e) for item in chunk}
+                yield chunk, errors
+
+
+def _chunk_results(
+    chunk: list, errors: Dict[str, str], key: Callable = lambda item: item
+) -> Dict[str, Optional[str]]:
+    return {key(item): errors.get(key(item)) for item in chunk}
+
+
+def _folder_pair(source: str, destination: str) -> Tuple[str, str]:
+    """Folder keys of a folder copy or move, rejecting overlapping folders.
+
+    A destination inside the source would be picked up again by the
+    listing that drives the copy.
+    """
+    source, destination = _folder_key(source), _folder_key(destination)
+    if destination.startswith(source) or source.startswith(destination):
+        raise ValueError("Source and destination folders must not overlap")
+    return source, destination
+
+
+def _is_b2_placeholder(name: str) -> bool:
+    return name.rsplit(FOLDER_DELIMITER, 1)[-1] == B2_FOLDER_PLACEHOLDER
+
+
+def _b2_timestamp(milliseconds: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(
+        milliseconds / 1000, tz=datetime.timezone.utc
+    )
+
 
 class StorageProvider(ABC):
     """Abstract base class for storage providers"""
 
+    # Key into PROVIDER_UPLOAD_TUNING and get_storage_provider's registry
+    provider_type: str = ""
+
     @abstractmethod
-    def upload_file(self, file_obj: BinaryIO, filename: str) -> None:
+    def upload_file(
+        self, file_obj: BinaryIO, filename: str, size: Optional[int] = None
+    ) -> None:
+        """Upload a stream; ``size`` is an optional hint used to size parts"""
         pass
 
+    @property
+    def upload_tuning(self) -> UploadTuning:
+        return get_upload_tuning(self.provider_type)
+
+    def multipart_target(self, filename: str) -> MultipartTarget:
+        """Steps of a parallel multipart upload to ``filename``, used by
+        :meth:`upload_file` and by the async server"""
+        raise NotImplementedError("Multipart uploads are not supported")
+
     @abstractmethod
-    def download_file(self, filename: str) -> BinaryIO:
+    def download_file(
+        self, filename: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> DownloadStream:
+        """Open an object for streaming; the caller must close the stream.
+
+        ``byte_range`` is an inclusive ``(first, last)`` byte offset pair, as
+        in an HTTP Range header, and limits the download to that slice.
+        """
+        pass
+
+    @abstractmethod
+    def get_file_info(self, filename: str) -> dict:
+        """Metadata of one object without downloading it.
+
+        Returns ``{"name", "size", "content_type", "etag", "last_modified"}``
+        where ``etag`` is in quoted HTTP form.
+        """
         pass
 
     @abstractmethod
     def delete_file(self, filename: str) -> None:
         pass
 
+    # Keys removed per _delete_batch call
+    delete_batch_size = 1
+
+    def delete_files(self, filenames: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Delete many objects at once.
+
+        Returns every key mapped to ``None`` when it was deleted, or to an
+        error message. Keys that do not exist count as deleted.
+        """
+        results: Dict[str, Optional[str]] = {}
+        for chunk, errors in _run_in_chunks(
+            self._delete_batch,
+            dict.fromkeys(filenames),
+            self.delete_batch_size,
+            DELETE_CONCURRENCY,
+        ):
+            results.update(_chunk_results(chunk, errors))
+        return results
+
+    def _delete_batch(self, filenames: List[str]) -> Dict[str, str]:
+        """Delete up to ``delete_batch_size`` keys and return an error message
+        per key that failed. Providers override this with their batch APIs.
+        """
+        for filename in filenames:
+            self.delete_file(filename)
+        return {}
+
+    def create_folder(self, folder: str) -> None:
+        """Create an empty folder as a zero-byte placeholder object at its key"""
+        self.upload_file(io.BytesIO(), _folder_key(folder), size=0)
+
+    def delete_folder(self, folder: str) -> Iterator[Dict[str, Optional[str]]]:
+        """Delete a folder and everything below it.
+
+        Lazily yields the result of each batch of deletes, in the form
+        returned by :meth:`delete_files`, so callers can report progress.
+        The listing is consumed while earlier batches are being deleted.
+        """
+        for chunk, errors in _run_in_chunks(
+            self._delete_entries,
+            self._list_folder_objects(_folder_key(folder)),
+            self.delete_batch_size,
+            DELETE_CONCURRENCY,
+            key=_entry_name,
+        ):
+            yield _chunk_results(chunk, errors, _entry_name)
+
+    def _list_folder_objects(self, folder: str) -> Iterator[dict]:
+        """Every object that makes up ``folder``, including placeholders,
+        as entries accepted by :meth:`_delete_entries` and :meth:`_copy_entry`
+        """
+        return self.list_files(folder)
+
+    def _delete_entries(self, entries: List[dict]) -> Dict[str, str]:
+        return self._delete_batch([entry["name"] for entry in entries])
+
+    def copy_file(
+        self, source: str, destination: str, size: Optional[int] = None
+    ) -> None:
+        """Server-side copy of one object; ``size`` is an optional hint that
+        saves a metadata lookup on backends with a size limit per copy call"""
+        raise NotImplementedError("Server-side copy is not supported")
+
+    def move_file(self, source: str, destination: str) -> None:
+        """Copy, then delete the source. Object stores have no rename."""
+        if source == destination:
+            raise ValueError("Source and destination are the same")
+        self.copy_file(source, destination)
+        self.delete_file(source)
+
+    def _copy_entry(self, entry: dict, destination: str) -> None:
+        self.copy_file(entry["name"], destination, size=entry.get("size"))
+
+    def copy_folder(
+        self, source: str, destination: str
+    ) -> Iterator[Dict[str, Optional[str]]]:
+        """Copy everything below ``source`` to ``destination``.
+
+        Objects are copied server-side by COPY_CONCURRENCY threads while the
+        listing continues. Yields ``{source key: error or None}`` per object.
+        """
+        for chunk, errors in self._copy_chunks(*_folder_pair(source, destination)):
+            yield _chunk_results(chunk, errors, _entry_name)
+
+    def move_folder(
+        self, source: str, destination: str
+    ) -> Iterator[Dict[str, Optional[str]]]:
+        """Copy a folder, deleting each source object once it has been copied.
+
+        Yields results like :meth:`copy_folder`. A key that was copied but
+        could not be deleted is reported as failed and remains at the source.
+        """
+        source, destination = _folder_pair(source, destination)
+        copy_errors: Dict[str, str] = {}
+
+        def copied() -> Iterator[dict]:
+            for chunk, errors in self._copy_chunks(source, destination):
+                copy_errors.update(errors)
+                yield from (entry for entry in chunk if entry["name"] not in errors)
+
+        # Copies feed batched deletes, so both pools stay busy
+        for chunk, errors in _run_in_chunks(
+            self._delete_entries,
+            copied(),
+            self.delete_batch_size,
+            DELETE_CONCURRENCY,
+            key=_entry_name,
+        ):
+            results = _chunk_results(chunk, errors, _entry_name)
+            results.update(copy_errors)
+            copy_errors.clear()
+            yield results
+        if copy_errors:
+            yield copy_errors
+
+    def _copy_chunks(
+        self, source: str, destination: str
+    ) -> Iterator[Tuple[List[dict], Dict[str, str]]]:
+        def copy_one(chunk: List[dict]) -> Dict[str, str]:
+            entry = chunk[0]
+            self._copy_entry(entry, destination + entry["name"][len(source) :])
+            return {}
+
+        return _run_in_chunks(
+            copy_one,
+            self._list_folder_objects(source),
+            1,
+            COPY_CONCURRENCY,
+            key=_entry_name,
+        )
+
     @abstractmethod
-    def list_files(self, prefix: str = "") -> List[dict]:
+    def list_files(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
+        """Lazily yield ``{"name", "size", "etag", "last_modified"}`` for every
+        key under ``prefix``.
+
+        Keys are yielded in lexicographic order, starting strictly after
+        ``start_after`` when given, so callers can resume a listing from the
+        last key they saw. Pages are fetched from the backend on demand.
+        """
         pass
 
     @abstractmethod
-    def get_file_url(self, filename: str, expires_in: int = 3600) -> str:
+    def list_directory(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
+        """Lazily yield the immediate children of ``prefix``.
+
+        Files are yielded as ``{"name", "size", "etag", "last_modified",
+        "type": "file"}`` and
+        subfolders as ``{"name": "<prefix><folder>/", "type": "folder"}``, in
+        lexicographic order. The backend's delimiter support is used, so the
+        cost depends on the number of children rather than the subtree size.
+        """
         pass
 
+    @abstractmethod
+    def get_file_url(
+        self, filename: str, expires_in: int = 3600, download_name: Optional[str] = None
+    ) -> str:
+        """Signed URL for reading an object.
+
+        With ``download_name`` the URL serves the object as an attachment
+        under that filename.
+        """
+        pass
+
+    def get_file_urls(
+        self, filenames: Iterable[str], expires_in: int = 3600
+    ) -> Dict[str, str]:
+        """Signed URLs for many files at once, keyed by filename.
+
+        Providers override this when signing can share work between files.
+        """
+        return {name: self.get_file_url(name, expires_in) for name in filenames}
+
+    # Browser-direct multipart uploads. Only backends that can presign
+    # individual part uploads support these; the rest raise
+    # NotImplementedError and clients fall back to /upload.
+
+    def create_multipart_upload(self, filename: str) -> str:
+        """Start a multipart upload and return its upload id"""
+        raise NotImplementedError("Direct multipart uploads are not supported")
+
+    def get_upload_part_urls(
+        self,
+        filename: str,
+        upload_id: str,
+        part_numbers: Iterable[int],
+        expires_in: int = 3600,
+    ) -> Dict[int, str]:
+        """Presigned PUT URLs for the given part numbers"""
+        raise NotImplementedError("Direct multipart uploads are not supported")
 
-class AWSS3Provider(StorageProvider):
+    def list_uploaded_parts(self, filename: str, upload_id: str) -> List[dict]:
+        """Parts already stored for an upload, as ``{"PartNumber", "ETag", "Size"}``"""
+        raise NotImplementedError("Direct multipart uploads are not supported")
+
+    def complete_multipart_upload(
+        self, filename: str, upload_id: str, parts: List[dict]
+    ) -> None:
+        raise NotImplementedError("Direct multipart uploads are not supported")
+
+    def abort_multipart_upload(self, filename: str, upload_id: str) -> None:
+        raise NotImplementedError("Direct multipart uploads are not supported")
+
+    def close(self) -> None:
+        """Release network resources (HTTP connection pools) held by the provider"""
+        client = getattr(self, "client", None)
+        if client is not None and hasattr(client, "close"):
+            client.close()
+
+
+class S3CompatibleProvider(StorageProvider):
+    """Shared behaviour for providers accessed through a boto3 S3 client.
+
+    Subclasses set ``self.client`` and ``self.bucket`` in their constructor.
+    """
+
+    client = None
+    bucket: str = ""
+
+    def multipart_target(self, filename: str) -> MultipartTarget:
+        return S3MultipartTarget(self.client, self.bucket, filename)
+
+    def upload_file(
+        self, file_obj: BinaryIO, filename: str, size: Optional[int] = None
+    ) -> None:
+        target = self.multipart_target(filename)
+        multipart_upload(file_obj, target, self.upload_tuning, size)
+
+    def download_file(
+        self, filename: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> DownloadStream:
+        params = {"Bucket": self.bucket, "Key": filename}
+        if byte_range:
+            params["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        response = self.client.get_object(**params)
+        body = response["Body"]
+        total_length = None
+        if response.get("ContentRange"):
+            total_length = int(response["ContentRange"].rsplit("/", 1)[1])
+        return DownloadStream(
+            body.iter_chunks(DOWNLOAD_CHUNK_SIZE),
+            content_length=response.get("ContentLength"),
+            total_length=total_length,
+            content_type=response.get("ContentType"),
+            etag=response.get("ETag"),
+            last_modified=response.get("LastModified"),
+            on_close=body.close,
+        )
+
+    def get_file_info(self, filename: str) -> dict:
+        response = self.client.head_object(Bucket=self.bucket, Key=filename)
+        return {
+            "name": filename,
+            "size": response["ContentLength"],
+            "content_type": response.get("ContentType"),
+            "etag": response.get("ETag"),
+            "last_modified": response.get("LastModified"),
+        }
+
+    delete_batch_size = S3_DELETE_BATCH_SIZE
+
+    def copy_file(
+        self, source: str, destination: str, size: Optional[int] = None
+    ) -> None:
+        if size is None:
+            size = self.client.head_object(Bucket=self.bucket, Key=source)[
+                "ContentLength"
+            ]
+        if size > MAX_SINGLE_COPY_SIZE:
+            s3_multipart_copy(
+                self.client, self.bucket, source, destination, size, self.upload_tuning
+            )
+            return
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=destination,
+            CopySource={"Bucket": self.bucket, "Key": source},
+        )
+
+    def _delete_batch(self, filenames: List[str]) -> Dict[str, str]:
+        response = self.client.delete_objects(
+            Bucket=self.bucket,
+            Delete={"Objects": [{"Key": name} for name in filenames], "Quiet": True},
+        )
+        return {
+            error["Key"]: f"{error.get('Code')}: {error.get('Message')}"
+            for error in response.get("Errors", [])
+        }
+
+    def list_files(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        params = {"Bucket": self.bucket, "Prefix": prefix}
+        if start_after:
+            params["StartAfter"] = start_after
+        for page in paginator.paginate(**params):
+            for obj in page.get("Contents", []):
+                yield {
+                    "name": obj["Key"],
+                    "size": obj["Size"],
+                    "etag": obj.get("ETag"),
+                    "last_modified": obj.get("LastModified"),
+                }
+
+    def list_directory(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        params = {
+            "Bucket": self.bucket,
+            "Prefix": prefix,
+            "Delimiter": FOLDER_DELIMITER,
+        }
+        resume_key = _listing_resume_key(start_after)
+        if resume_key:
+            params["StartAfter"] = resume_key
+        for page in paginator.paginate(**params):
+            files = [
+                {
+                    "name": obj["Key"],
+                    "size": obj["Size"],
+                    "etag": obj.get("ETag"),
+                    "last_modified": obj.get("LastModified"),
+                }
+                for obj in page.get("Contents", [])
+            ]
+            folders = [p["Prefix"] for p in page.get("CommonPrefixes", [])]
+            yield from _merge_directory_page(files, folders, prefix, start_after)
+
+    def get_file_url(
+        self, filename: str, expires_in: int = 3600, download_name: Optional[str] = None
+    ) -> str:
+        params = {"Bucket": self.bucket, "Key": filename}
+        if download_name:
+            params["ResponseContentDisposition"] = content_disposition(download_name)
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=expires_in
+        )
+
+    def get_file_urls(
+        self, filenames: Iterable[str], expires_in: int = 3600
+    ) -> Dict[str, str]:
+        # Presigning is local HMAC work, so sign directly without per-call logging
+        sign = self.client.generate_presigned_url
+        return {
+            name: sign(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": name},
+                ExpiresIn=expires_in,
+            )
+            for name in filenames
+        }
+
+    def create_multipart_upload(self, filename: str) -> str:
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=filename)
+        return response["UploadId"]
+
+    def get_upload_part_urls(
+        self,
+        filename: str,
+        upload_id: str,
+        part_numbers: Iterable[int],
+        expires_in: int = 3600,
+    ) -> Dict[int, str]:
+        return {
+            part_number: self.client.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": self.bucket,
+                    "Key": filename,
+                    "UploadId": upload_id,
+                    "PartNumber": part_number,
+                },
+                ExpiresIn=expires_in,
+            )
+            for part_number in part_numbers
+        }
+
+    def list_uploaded_parts(self, filename: str, upload_id: str) -> List[dict]:
+        paginator = self.client.get_paginator("list_parts")
+        parts = []
+        for page in paginator.paginate(
+            Bucket=self.bucket, Key=filename, UploadId=upload_id
+        ):
+            parts.extend(
+                {
+                    "PartNumber": part["PartNumber"],
+                    "ETag": part["ETag"],
+                    "Size": part["Size"],
+                }
+                for part in page.get("Parts", [])
+            )
+        return parts
+
+    def complete_multipart_upload(
+        self, filename: str, upload_id: str, parts: List[dict]
+    ) -> None:
+        parts = sorted(
+            ({"PartNumber": p["PartNumber"], "ETag": p["ETag"]} for p in parts),
+            key=lambda part: part["PartNumber"],
+        )
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=filename,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort_multipart_upload(self, filename: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=filename, UploadId=upload_id
+        )
+
+
+class AWSS3Provider(S3CompatibleProvider):
     """Amazon S3 storage provider
     Authentication:
     - AWS Access Key ID
@@ -48,39 +644,21 @@ class AWSS3Provider(StorageProvider):
     - Region
     """
 
+    provider_type = "aws"
+
     def __init__(self, access_key: str, secret_key: str, bucket: str, region: str):
         self.client = boto3.client(
             "s3",
             aws_access_key_id=access_key,
             aws_secret_access_key=secret_key,
             region_name=region,
+            config=BotoConfig(max_pool_connections=S3_MAX_POOL_CONNECTIONS),
         )
         self.bucket = bucket
 
-    def upload_file(self, file_obj: BinaryIO, filename: str) -> None:
-        self.client.upload_fileobj(file_obj, self.bucket, filename)
-
-    def download_file(self, filename: str) -> BinaryIO:
-        response = self.client.get_object(Bucket=self.bucket, Key=filename)
-        return response["Body"]
-
     def delete_file(self, filename: str) -> None:
         self.client.delete_object(Bucket=self.bucket, Key=filename)
 
-    def list_files(self, prefix: str = "") -> List[dict]:
-        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
-        return [
-            {"name": obj["Key"], "size": obj["Size"]}
-            for obj in response.get("Contents", [])
-        ]
-
-    def get_file_url(self, filename: str, expires_in: int = 3600) -> str:
-        return self.client.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": self.bucket, "Key": filename},
-            ExpiresIn=expires_in,
-        )
-
 
 class BackblazeB2Provider(StorageProvider):
     """Backblaze B2 storage provider
@@ -91,37 +669,260 @@ class BackblazeB2Provider(StorageProvider):
     No region needed
     """
 
+    provider_type = "backblaze"
+
     def __init__(self, application_key_id: str, application_key: str, bucket_name: str):
         self.info = b2.InMemoryAccountInfo()
         self.b2_api = b2.B2Api(self.info)
         self.b2_api.authorize_account("production", application_key_id, application_key)
         self.bucket = self.b2_api.get_bucket_by_name(bucket_name)
 
-    def upload_file(self, file_obj: BinaryIO, filename: str) -> None:
-        self.bucket.upload_stream(file_obj, filename)
+    def multipart_target(self, filename: str) -> MultipartTarget:
+        return B2LargeFileTarget(self.b2_api, self.bucket, filename)
+
+    def upload_file(
+        self, file_obj: BinaryIO, filename: str, size: Optional[int] = None
+    ) -> None:
+        target = self.multipart_target(filename)
+        multipart_upload(file_obj, target, self.upload_tuning, size)
+
+    def download_file(
+        self, filename: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> DownloadStream:
+        downloaded = self.bucket.download_file_by_name(filename, range_=byte_range)
+        info = self._version_info(downloaded.download_version)
+        response = downloaded.response
+        return DownloadStream(
+            response.iter_content(DOWNLOAD_CHUNK_SIZE),
+            content_length=downloaded.download_version.content_length,
+            total_length=info["size"],
+            content_type=info["content_type"],
+            etag=info["etag"],
+            last_modified=info["last_modified"],
+            on_close=response.close,
+        )
 
-    def download_file(self, filename: str) -> BinaryIO:
-        download_dest = b2.DownloadDestBytes()
-        self.bucket.download_file_by_name(filename, download_dest)
-        return io.BytesIO(download_dest.get_bytes_written())
+    def get_file_info(self, filename: str) -> dict:
+        return self._version_info(self.bucket.get_file_info_by_name(filename))
+
+    @staticmethod
+    def _version_info(version) -> dict:
+        # File IDs change on every upload, which makes them a strong ETag
+        return {
+            "name": version.file_name,
+            "size": version.size,
+            "content_type": version.content_type,
+            "etag": f'"{version.id_}"',
+            "last_modified": _b2_timestamp(version.upload_timestamp),
+        }
 
     def delete_file(self, filename: str) -> None:
         file_version = self.bucket.get_file_info_by_name(filename)
         self.bucket.delete_file_version(file_version.id_, filename)
 
-    def list_files(self, prefix: str = "") -> List[dict]:
-        return [
-            {"name": f.file_name, "size": f.size}
-            for f in self.bucket.list_file_names(prefix)
-        ]
+    def _delete_batch(self, filenames: List[str]) -> Dict[str, str]:
+        # B2 has no batch delete; each key costs a lookup and a delete, so
+        # single keys are spread over the thread pool instead
+        for filename in filenames:
+            try:
+                self.delete_file(filename)
+            except b2.exception.FileNotPresent:
+                pass
+        return {}
+
+    def create_folder(self, folder: str) -> None:
+        # B2 rejects names ending in "/"; like its web UI, mark the folder
+        # with a hidden placeholder file instead
+        self.bucket.upload_bytes(b"", _folder_key(folder) + B2_FOLDER_PLACEHOLDER)
+
+    def _list_folder_objects(self, folder: str) -> Iterator[dict]:
+        # The raw listing includes .bzEmpty placeholders and carries file
+        # ids, so folder operations need no lookup per file
+        for f in self._list_file_names(folder):
+            yield {
+                "name": f["fileName"],
+                "size": f["contentLength"],
+                "file_id": f["fileId"],
+                "content_type": f["contentType"],
+                "file_info": f.get("fileInfo") or {},
+            }
+
+    def _delete_entries(self, entries: List[dict]) -> Dict[str, str]:
+        for entry in entries:
+            self.bucket.delete_file_version(entry["file_id"], entry["name"])
+        return {}
+
+    def copy_file(
+        self, source: str, destination: str, size: Optional[int] = None
+    ) -> None:
+        version = self.bucket.get_file_info_by_name(source)
+        self._copy_version(
+            version.id_,
+            destination,
+            version.size,
+            version.content_type,
+            version.file_info,
+        )
+
+    def _copy_entry(self, entry: dict, destination: str) -> None:
+        self._copy_version(
+            entry["file_id"],
+            destination,
+            entry["size"],
+            entry["content_type"],
+            entry["file_info"],
+        )
+
+    def _copy_version(
+        self,
+        file_id: str,
+        destination: str,
+        size: int,
+        content_type: str,
+        file_info: dict,
+    ) -> None:
+        if size <= MAX_SINGLE_COPY_SIZE:
+            # b2_copy_file keeps the source's content type and file info
+            self.bucket.copy(file_id, destination)
+            return
+        # Larger files are copied as a large file, part by part
+        self.bucket.copy(
+            file_id,
+            destination,
+            content_type=content_type,
+            file_info=file_info,
+            length=size,
+            max_part_size=MAX_SINGLE_COPY_SIZE,
+        )
 
-    def get_file_url(self, filename: str, expires_in: int = 3600) -> str:
-        return self.bucket.get_download_authorization(
+    def list_files(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
+        for f in self._list_file_names(prefix, start_after):
+            if _is_b2_placeholder(f["fileName"]):
+                continue
+            yield {
+                "name": f["fileName"],
+                "size": f["contentLength"],
+                "etag": f'"{f["fileId"]}"',
+                "last_modified": _b2_timestamp(f["uploadTimestamp"]),
+            }
+
+    def _list_file_names(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
+        """Raw b2_list_file_names entries of every uploaded file under ``prefix``"""
+        # Pages are resumed from nextFileName, which is inclusive, so the
+        # resume key itself is skipped
+        start_file_name = start_after
+        while True:
+            response = self.b2_api.session.list_file_names(
+                self.bucket.id_, start_file_name, B2_LIST_PAGE_SIZE, prefix or None
+            )
+            for f in response["files"]:
+                if f["action"] != "upload" or f["fileName"] == start_after:
+                    continue
+                yield f
+            start_file_name = response.get("nextFileName")
+            if not start_file_name:
+                break
+
+    def list_directory(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
+        # With a "/" delimiter B2 reports each subfolder once instead of its
+        # contents, and startFileName resumes a page at the cursor server-side
+        start_file_name = start_after
+        if start_after and start_after.endswith("/"):
+            # Names inside the cursor folder sort before this one
+            start_file_name = start_after[:-1] + "0"
+        while True:
+            response = self._list_file_names_page(start_file_name, prefix, "/")
+            for f in response["files"]:
+                name = f["fileName"]
+                if start_after and name <= start_after:
+                    continue
+                if f["action"] == "folder":
+                    yield {"name": name, "type": "folder"}
+                elif (
+                    f["action"] == "upload"
+                    and name != prefix
+                    and not _is_b2_placeholder(name)
+                ):
+                    yield {
+                        "name": name,
+                        "size": f["contentLength"],
+                        "etag": f'"{f["fileId"]}"',
+                        "last_modified": _b2_timestamp(f["uploadTimestamp"]),
+                        "type": "file",
+                    }
+            start_file_name = response.get("nextFileName")
+            if not start_file_name:
+                break
+
+    def _list_file_names_page(
+        self, start_file_name: Optional[str], prefix: str, delimiter: str
+    ) -> dict:
+        """One b2_list_file_names page with a delimiter, which b2sdk's session
+        does not pass on, so the API is called with the session's token"""
+        for attempt in range(2):
+            response = requests.post(
+                f"{self.info.get_api_url()}/b2api/v3/b2_list_file_names",
+                headers={"Authorization": self.info.get_account_auth_token()},
+                json={
+                    "bucketId": self.bucket.id_,
+                    "startFileName": start_file_name,
+                    "maxFileCount": B2_LIST_PAGE_SIZE,
+                    "prefix": prefix,
+                    "delimiter": delimiter,
+                },
+                timeout=60,
+            )
+            if response.status_code == 401 and attempt == 0:
+                # Account tokens expire after 24 hours
+                self.b2_api.session.authorize_automatically()
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def get_file_url(
+        self, filename: str, expires_in: int = 3600, download_name: Optional[str] = None
+    ) -> str:
+        token = self.bucket.get_download_authorization(
             filename, valid_duration_in_seconds=expires_in
         )
+        return self._authorized_url(filename, token, download_name)
+
+    def get_file_urls(
+        self, filenames: Iterable[str], expires_in: int = 3600
+    ) -> Dict[str, str]:
+        # One authorization for the files' common folder instead of a round
+        # trip per file. The token grants read access to that whole folder,
+        # so files without one (in the bucket root, or in unrelated folders)
+        # are authorized one by one rather than with a bucket-wide token.
+        filenames = list(filenames)
+        if not filenames:
+            return {}
+        common = os.path.commonprefix(filenames)
+        folder = common[: common.rfind("/") + 1]
+        if not folder:
+            return {name: self.get_file_url(name, expires_in) for name in filenames}
+        token = self.bucket.get_download_authorization(
+            folder, valid_duration_in_seconds=expires_in
+        )
+        return {name: self._authorized_url(name, token) for name in filenames}
+
+    def _authorized_url(
+        self, filename: str, token: str, download_name: Optional[str] = None
+    ) -> str:
+        query = {"Authorization": token}
+        if download_name:
+            # Header overrides are honoured for download authorization tokens
+            query["b2ContentDisposition"] = content_disposition(download_name)
+        return f"{self.bucket.get_download_url(filename)}?{urlencode(query)}"
 
 
-class WasabiProvider(StorageProvider):
+class WasabiProvider(S3CompatibleProvider):
     """Wasabi storage provider (S3 compatible)
     Authentication:
     - Access Key
@@ -130,6 +931,8 @@ class WasabiProvider(StorageProvider):
     - Region (Wasabi specific regions)
     """
 
+    provider_type = "wasabi"
+
     def __init__(self, access_key: str, secret_key: str, bucket: str, region: str):
         self.client = boto3.client(
             "s3",
@@ -137,32 +940,22 @@ class WasabiProvider(StorageProvider):
             aws_secret_access_key=secret_key,
             region_name=region,
             endpoint_url=f"https://s3.{region}.wasabisys.com",
+            config=BotoConfig(max_pool_connections=S3_MAX_POOL_CONNECTIONS),
         )
         self.bucket = bucket
 
-    def upload_file(self, file_obj: BinaryIO, filename: str) -> None:
-        self.client.upload_fileobj(file_obj, self.bucket, filename)
-
-    def download_file(self, filename: str) -> BinaryIO:
-        response = self.client.get_object(Bucket=self.bucket, Key=filename)
-        return response["Body"]
-
     def delete_file(self, filename: str) -> None:
         self.client.delete_object(Bucket=self.bucket, Key=filename)
 
-    def list_files(self, prefix: str = "") -> List[dict]:
-        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
-        return [
-            {"name": obj["Key"], "size": obj["Size"]}
-            for obj in response.get("Contents", [])
-        ]
 
-    def get_file_url(self, filename: str, expires_in: int = 3600) -> str:
-        return self.client.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": self.bucket, "Key": filename},
-            ExpiresIn=expires_in,
-        )
+class _ResponseBatch(Batch):
+    """GCS batch that keeps the response of each request, in request order"""
+
+    responses: list = []
+
+    def finish(self, raise_exception: bool = True) -> list:
+        self.responses = super().finish(raise_exception=raise_exception)
+        return self.responses
 
 
 class GoogleCloudStorageProvider(StorageProvider):
@@ -174,17 +967,19 @@ class GoogleCloudStorageProvider(StorageProvider):
     No region needed - handled by GCS
     """
 
+    provider_type = "gcs"
+
     def __init__(self, project_id: str, bucket_name: str, credentials_json: str):
         try:
             # Parse the credentials JSON string into a dictionary
             if isinstance(credentials_json, str):
                 try:
                     credentials_dict = json.loads(credentials_json)
-                    print(
+                    logger.debug(
                         f"Successfully parsed credentials JSON for project: {credentials_dict.get('project_id')}"
                     )
                 except json.JSONDecodeError as e:
-                    print(f"JSON parsing error: {str(e)}")
+                    logger.error(f"JSON parsing error: {str(e)}")
                     raise ValueError(f"Invalid service account JSON format: {str(e)}")
             else:
                 credentials_dict = credentials_json
@@ -193,11 +988,11 @@ class GoogleCloudStorageProvider(StorageProvider):
                 credentials = service_account.Credentials.from_service_account_info(
                     credentials_dict
                 )
-                print(
+                logger.debug(
                     f"Successfully created credentials for service account: {credentials_dict.get('client_email')}"
                 )
             except Exception as e:
-                print(f"Error creating credentials: {str(e)}")
+                logger.error(f"Error creating credentials: {str(e)}")
                 raise ValueError(
                     f"Error creating service account credentials: {str(e)}"
                 )
@@ -206,69 +1001,204 @@ class GoogleCloudStorageProvider(StorageProvider):
                 self.client = storage.Client(
                     project=project_id, credentials=credentials
                 )
-                print(f"Successfully created storage client for project: {project_id}")
+                self.credentials = credentials
+                logger.debug(
+                    f"Successfully created storage client for project: {project_id}"
+                )
             except Exception as e:
-                print(f"Error creating storage client: {str(e)}")
+                logger.error(f"Error creating storage client: {str(e)}")
                 raise ValueError(f"Error creating storage client: {str(e)}")
 
             try:
                 self.bucket = self.client.bucket(bucket_name)
-                print(f"Successfully got bucket reference: {bucket_name}")
+                logger.debug(f"Successfully got bucket reference: {bucket_name}")
             except Exception as e:
-                print(f"Error getting bucket: {str(e)}")
+                logger.error(f"Error getting bucket: {str(e)}")
                 raise ValueError(f"Error accessing bucket {bucket_name}: {str(e)}")
 
         except Exception as e:
-            print(f"Unexpected error in GCS initialization: {str(e)}")
+            logger.error(f"Unexpected error in GCS initialization: {str(e)}")
             raise ValueError(f"Error initializing Google Cloud Storage: {str(e)}")
 
-    def list_files(self, prefix: str = "") -> List[dict]:
+    def list_files(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
         try:
-            blobs = self.bucket.list_blobs(prefix=prefix)
-            return [{"name": blob.name, "size": blob.size} for blob in blobs]
+            # start_offset is inclusive; the HTTP iterator fetches pages lazily
+            blobs = self.bucket.list_blobs(prefix=prefix, start_offset=start_after)
+            for blob in blobs:
+                if blob.name == start_after or is_upload_staging(blob.name):
+                    continue
+                yield {
+                    "name": blob.name,
+                    "size": blob.size,
+                    "etag": f'"{blob.etag}"',
+                    "last_modified": blob.updated,
+                }
         except Exception as e:
-            print(f"Error listing files: {str(e)}")
+            logger.error(f"Error listing files: {str(e)}")
             raise ValueError(f"Error listing files: {str(e)}")
 
-    def upload_file(self, file_obj: BinaryIO, filename: str) -> None:
+    def list_directory(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
         try:
-            blob = self.bucket.blob(filename)
-            blob.upload_from_file(file_obj)
+            iterator = self.bucket.list_blobs(
+                prefix=prefix,
+                delimiter=FOLDER_DELIMITER,
+                start_offset=_listing_resume_key(start_after),
+            )
+            for page in iterator.pages:
+                files = [
+                    {
+                        "name": blob.name,
+                        "size": blob.size,
+                        "etag": f'"{blob.etag}"',
+                        "last_modified": blob.updated,
+                    }
+                    for blob in page
+                    if not is_upload_staging(blob.name)
+                ]
+                folders = sorted(
+                    folder for folder in page.prefixes if not is_upload_staging(folder)
+                )
+                yield from _merge_directory_page(files, folders, prefix, start_after)
         except Exception as e:
-            print(f"Error uploading file: {str(e)}")
+            logger.error(f"Error listing directory: {str(e)}")
+            raise ValueError(f"Error listing directory: {str(e)}")
+
+    def multipart_target(self, filename: str) -> MultipartTarget:
+        return GCSComposeTarget(self.bucket, filename)
+
+    def upload_file(
+        self, file_obj: BinaryIO, filename: str, size: Optional[int] = None
+    ) -> None:
+        try:
+            target = self.multipart_target(filename)
+            multipart_upload(file_obj, target, self.upload_tuning, size)
+        except Exception as e:
+            logger.error(f"Error uploading file: {str(e)}")
             raise ValueError(f"Error uploading file: {str(e)}")
 
-    def download_file(self, filename: str) -> BinaryIO:
+    def download_file(
+        self, filename: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> DownloadStream:
         try:
-            blob = self.bucket.blob(filename)
-            file_obj = io.BytesIO()
-            blob.download_to_file(file_obj)
-            file_obj.seek(0)
-            return file_obj
+            blob = self._get_blob(filename)
+            info = self._blob_info(blob)
+            start, length = 0, blob.size
+            if byte_range:
+                start = byte_range[0]
+                length = min(byte_range[1] + 1, blob.size) - start
+            # get_blob loads the generation, so every ranged chunk read by the
+            # reader comes from the same object version
+            reader = blob.open("rb", chunk_size=GCS_DOWNLOAD_CHUNK_SIZE)
+            if start:
+                reader.seek(start)
+            return DownloadStream(
+                read_chunks(reader, GCS_DOWNLOAD_CHUNK_SIZE, length),
+                content_length=length,
+                total_length=info["size"],
+                content_type=info["content_type"],
+                etag=info["etag"],
+                last_modified=info["last_modified"],
+                on_close=reader.close,
+            )
         except Exception as e:
-            print(f"Error downloading file: {str(e)}")
+            logger.error(f"Error downloading file: {str(e)}")
             raise ValueError(f"Error downloading file: {str(e)}")
 
+    def get_file_info(self, filename: str) -> dict:
+        try:
+            return self._blob_info(self._get_blob(filename))
+        except Exception as e:
+            logger.error(f"Error getting file info: {str(e)}")
+            raise ValueError(f"Error getting file info: {str(e)}")
+
+    def _get_blob(self, filename: str):
+        blob = self.bucket.get_blob(filename)
+        if blob is None:
+            raise FileNotFoundError(filename)
+        return blob
+
+    @staticmethod
+    def _blob_info(blob) -> dict:
+        return {
+            "name": blob.name,
+            "size": blob.size,
+            "content_type": blob.content_type,
+            "etag": f'"{blob.etag}"',
+            "last_modified": blob.updated,
+        }
+
     def delete_file(self, filename: str) -> None:
         try:
             blob = self.bucket.blob(filename)
             blob.delete()
         except Exception as e:
-            print(f"Error deleting file: {str(e)}")
+            logger.error(f"Error deleting file: {str(e)}")
             raise ValueError(f"Error deleting file: {str(e)}")
 
-    def get_file_url(self, filename: str, expires_in: int = 3600) -> str:
+    delete_batch_size = GCS_BATCH_SIZE
+
+    def copy_file(
+        self, source: str, destination: str, size: Optional[int] = None
+    ) -> None:
+        try:
+            source_blob = self.bucket.blob(source)
+            destination_blob = self.bucket.blob(destination)
+            # Rewrites that cross locations or storage classes take several
+            # calls; within a bucket they usually finish in the first one
+            token, _, _ = destination_blob.rewrite(source_blob)
+            while token is not None:
+                token, _, _ = destination_blob.rewrite(source_blob, token=token)
+        except Exception as e:
+            logger.error(f"Error copying file: {str(e)}")
+            raise ValueError(f"Error copying file: {str(e)}")
+
+    def _delete_batch(self, filenames: List[str]) -> Dict[str, str]:
+        # All deletes of the chunk go out in one multipart batch request
+        with _ResponseBatch(self.client, raise_exception=False) as batch:
+            for name in filenames:
+                self.bucket.delete_blob(name)
+        return {
+            name: f"HTTP {response.status_code}: {response.text}"
+            for name, response in zip(filenames, batch.responses)
+            if response.status_code >= 300 and response.status_code != 404
+        }
+
+    def get_file_url(
+        self, filename: str, expires_in: int = 3600, download_name: Optional[str] = None
+    ) -> str:
         try:
             blob = self.bucket.blob(filename)
+            disposition = content_disposition(download_name) if download_name else None
             return blob.generate_signed_url(
-                expiration=datetime.timedelta(seconds=expires_in)
+                expiration=datetime.timedelta(seconds=expires_in),
+                response_disposition=disposition,
             )
         except Exception as e:
-            print(f"Error generating signed URL: {str(e)}")
+            logger.error(f"Error generating signed URL: {str(e)}")
             raise ValueError(f"Error generating signed URL: {str(e)}")
 
+    def get_file_urls(
+        self, filenames: Iterable[str], expires_in: int = 3600
+    ) -> Dict[str, str]:
+        try:
+            # Every URL shares the same signing credentials and expiry
+            expiration = datetime.timedelta(seconds=expires_in)
+            return {
+                name: self.bucket.blob(name).generate_signed_url(
+                    expiration=expiration, credentials=self.credentials
+                )
+                for name in filenames
+            }
+        except Exception as e:
+            logger.error(f"Error generating signed URLs: {str(e)}")
+            raise ValueError(f"Error generating signed URLs: {str(e)}")
+
 
-class DigitalOceanSpacesProvider(StorageProvider):
+class DigitalOceanSpacesProvider(S3CompatibleProvider):
     """DigitalOcean Spaces provider (S3 compatible)
     Authentication:
     - Spaces Access Key
@@ -277,6 +1207,8 @@ class DigitalOceanSpacesProvider(StorageProvider):
     - Region (DO specific: nyc3, ams3, sgp1, etc.)
     """
 
+    provider_type = "digitalocean"
+
     def __init__(self, access_key: str, secret_key: str, bucket: str, region: str):
         try:
             logger.debug(
@@ -290,7 +1222,9 @@ class DigitalOceanSpacesProvider(StorageProvider):
                 endpoint_url=endpoint_url,
                 region_name=region,
                 config=boto3.session.Config(
-                    signature_version="s3v4", s3={"addressing_style": "virtual"}
+                    signature_version="s3v4",
+                    s3={"addressing_style": "virtual"},
+                    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
                 ),
             )
             self.bucket = bucket
@@ -302,41 +1236,68 @@ class DigitalOceanSpacesProvider(StorageProvider):
                 f"Failed to initialize DigitalOcean Spaces client: {str(e)}"
             )
 
-    def list_files(self, prefix: str = "") -> List[dict]:
+    def list_files(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
         try:
             logger.debug(f"Listing files in bucket {self.bucket} with prefix: {prefix}")
-            response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
-            files = [
-                {"name": obj["Key"], "size": obj["Size"]}
-                for obj in response.get("Contents", [])
-            ]
-            logger.debug(f"Successfully listed {len(files)} files")
-            return files
+            count = 0
+            for file in super().list_files(prefix, start_after):
+                count += 1
+                yield file
+            logger.debug(f"Successfully listed {count} files")
         except Exception as e:
             logger.error(
                 f"Error listing files in bucket {self.bucket}: {str(e)}", exc_info=True
             )
             raise ValueError(f"Failed to list files: {str(e)}")
 
-    def upload_file(self, file_obj: BinaryIO, filename: str) -> None:
+    def list_directory(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
+        try:
+            logger.debug(
+                f"Listing directory in bucket {self.bucket} with prefix: {prefix}"
+            )
+            yield from super().list_directory(prefix, start_after)
+        except Exception as e:
+            logger.error(
+                f"Error listing directory in bucket {self.bucket}: {str(e)}",
+                exc_info=True,
+            )
+            raise ValueError(f"Failed to list directory: {str(e)}")
+
+    def upload_file(
+        self, file_obj: BinaryIO, filename: str, size: Optional[int] = None
+    ) -> None:
         try:
             logger.debug(f"Uploading file {filename} to bucket {self.bucket}")
-            self.client.upload_fileobj(file_obj, self.bucket, filename)
+            super().upload_file(file_obj, filename, size)
             logger.debug(f"Successfully uploaded file {filename}")
         except Exception as e:
             logger.error(f"Error uploading file {filename}: {str(e)}", exc_info=True)
             raise ValueError(f"Failed to upload file: {str(e)}")
 
-    def download_file(self, filename: str) -> BinaryIO:
+    def download_file(
+        self, filename: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> DownloadStream:
         try:
             logger.debug(f"Downloading file {filename} from bucket {self.bucket}")
-            response = self.client.get_object(Bucket=self.bucket, Key=filename)
-            logger.debug(f"Successfully downloaded file {filename}")
-            return response["Body"]
+            stream = super().download_file(filename, byte_range)
+            logger.debug(f"Opened download stream for {filename}")
+            return stream
         except Exception as e:
             logger.error(f"Error downloading file {filename}: {str(e)}", exc_info=True)
             raise ValueError(f"Failed to download file: {str(e)}")
 
+    def get_file_info(self, filename: str) -> dict:
+        try:
+            logger.debug(f"Getting info for {filename} in bucket {self.bucket}")
+            return super().get_file_info(filename)
+        except Exception as e:
+            logger.error(f"Error getting info for {filename}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to get file info: {str(e)}")
+
     def delete_file(self, filename: str) -> None:
         try:
             logger.debug(f"Deleting file {filename} from bucket {self.bucket}")
@@ -346,16 +1307,72 @@ class DigitalOceanSpacesProvider(StorageProvider):
             logger.error(f"Error deleting file {filename}: {str(e)}", exc_info=True)
             raise ValueError(f"Failed to delete file: {str(e)}")
 
-    def get_file_url(self, filename: str, expires_in: int = 3600) -> str:
+    def delete_files(self, filenames: Iterable[str]) -> Dict[str, Optional[str]]:
+        try:
+            logger.debug(f"Deleting files in batches from bucket {self.bucket}")
+            results = super().delete_files(filenames)
+            failed = sum(1 for error in results.values() if error)
+            if failed:
+                logger.warning(f"Failed to delete {failed} of {len(results)} files")
+            return results
+        except Exception as e:
+            logger.error(f"Error deleting files: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to delete files: {str(e)}")
+
+    def create_folder(self, folder: str) -> None:
+        try:
+            logger.debug(f"Creating folder {folder} in bucket {self.bucket}")
+            super().create_folder(folder)
+        except Exception as e:
+            logger.error(f"Error creating folder {folder}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to create folder: {str(e)}")
+
+    def delete_folder(self, folder: str) -> Iterator[Dict[str, Optional[str]]]:
+        try:
+            logger.debug(f"Deleting folder {folder} from bucket {self.bucket}")
+            yield from super().delete_folder(folder)
+        except Exception as e:
+            logger.error(f"Error deleting folder {folder}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to delete folder: {str(e)}")
+
+    def copy_file(
+        self, source: str, destination: str, size: Optional[int] = None
+    ) -> None:
+        try:
+            logger.debug(f"Copying {source} to {destination} in bucket {self.bucket}")
+            super().copy_file(source, destination, size)
+        except Exception as e:
+            logger.error(f"Error copying file {source}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to copy file: {str(e)}")
+
+    def copy_folder(
+        self, source: str, destination: str
+    ) -> Iterator[Dict[str, Optional[str]]]:
+        try:
+            logger.debug(f"Copying folder {source} to {destination}")
+            yield from super().copy_folder(source, destination)
+        except Exception as e:
+            logger.error(f"Error copying folder {source}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to copy folder: {str(e)}")
+
+    def move_folder(
+        self, source: str, destination: str
+    ) -> Iterator[Dict[str, Optional[str]]]:
+        try:
+            logger.debug(f"Moving folder {source} to {destination}")
+            yield from super().move_folder(source, destination)
+        except Exception as e:
+            logger.error(f"Error moving folder {source}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to move folder: {str(e)}")
+
+    def get_file_url(
+        self, filename: str, expires_in: int = 3600, download_name: Optional[str] = None
+    ) -> str:
         try:
             logger.debug(
                 f"Generating presigned URL for file {filename} with expiration {expires_in} seconds"
             )
-            url = self.client.generate_presigned_url(
-                "get_object",
-                Params={"Bucket": self.bucket, "Key": filename},
-                ExpiresIn=expires_in,
-            )
+            url = super().get_file_url(filename, expires_in, download_name)
             logger.debug(f"Successfully generated presigned URL for file {filename}")
             return url
         except Exception as e:
@@ -366,7 +1383,7 @@ class DigitalOceanSpacesProvider(StorageProvider):
             raise ValueError(f"Failed to generate presigned URL: {str(e)}")
 
 
-class CloudflareR2Provider(StorageProvider):
+class CloudflareR2Provider(S3CompatibleProvider):
     """Cloudflare R2 provider (S3 compatible)
     Authentication:
     - Account ID (Cloudflare specific)
@@ -376,6 +1393,8 @@ class CloudflareR2Provider(StorageProvider):
     No region needed - uses 'auto'
     """
 
+    provider_type = "cloudflare"
+
     def __init__(self, account_id: str, access_key: str, secret_key: str, bucket: str):
         self.client = boto3.client(
             "s3",
@@ -383,35 +1402,15 @@ class CloudflareR2Provider(StorageProvider):
             aws_secret_access_key=secret_key,
             endpoint_url=f"https://{account_id}.r2.cloudflarestorage.com",
             region_name="auto",
+            config=BotoConfig(max_pool_connections=S3_MAX_POOL_CONNECTIONS),
         )
         self.bucket = bucket
 
-    def upload_file(self, file_obj: BinaryIO, filename: str) -> None:
-        self.client.upload_fileobj(file_obj, self.bucket, filename)
-
-    def download_file(self, filename: str) -> BinaryIO:
-        response = self.client.get_object(Bucket=self.bucket, Key=filename)
-        return response["Body"]
-
     def delete_file(self, filename: str) -> None:
         self.client.delete_object(Bucket=self.bucket, Key=filename)
 
-    def list_files(self, prefix: str = "") -> List[dict]:
-        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
-        return [
-            {"name": obj["Key"], "size": obj["Size"]}
-            for obj in response.get("Contents", [])
-        ]
 
-    def get_file_url(self, filename: str, expires_in: int = 3600) -> str:
-        return self.client.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": self.bucket, "Key": filename},
-            ExpiresIn=expires_in,
-        )
-
-
-class HetznerStorageProvider(StorageProvider):
+class HetznerStorageProvider(S3CompatibleProvider):
     """Hetzner Storage Box provider (S3 compatible)
     Authentication:
     - Access Key
@@ -420,6 +1419,8 @@ class HetznerStorageProvider(StorageProvider):
     - Region (eu-central: fsn1/nbg1, eu-north: hel1, us-east: ash, us-west: hil, ap-southeast: sin)
     """
 
+    provider_type = "hetzner"
+
     def __init__(
         self, access_key: str, secret_key: str, bucket: str, region: str = "nbg1"
     ):
@@ -445,7 +1446,9 @@ class HetznerStorageProvider(StorageProvider):
                 endpoint_url=endpoint_url,
                 region_name=region,
                 config=boto3.session.Config(
-                    signature_version="s3v4", s3={"addressing_style": "path"}
+                    signature_version="s3v4",
+                    s3={"addressing_style": "path"},
+                    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
                 ),
             )
             self.bucket = bucket
@@ -455,25 +1458,37 @@ class HetznerStorageProvider(StorageProvider):
             logger.error(f"Error initializing Hetzner Storage client: {str(e)}")
             raise ValueError(f"Failed to initialize Hetzner Storage client: {str(e)}")
 
-    def upload_file(self, file_obj: BinaryIO, filename: str) -> None:
+    def upload_file(
+        self, file_obj: BinaryIO, filename: str, size: Optional[int] = None
+    ) -> None:
         try:
             logger.debug(f"Uploading file {filename} to bucket {self.bucket}")
-            self.client.upload_fileobj(file_obj, self.bucket, filename)
+            super().upload_file(file_obj, filename, size)
             logger.debug(f"Successfully uploaded file {filename}")
         except Exception as e:
             logger.error(f"Error uploading file {filename}: {str(e)}", exc_info=True)
             raise ValueError(f"Failed to upload file: {str(e)}")
 
-    def download_file(self, filename: str) -> BinaryIO:
+    def download_file(
+        self, filename: str, byte_range: Optional[Tuple[int, int]] = None
+    ) -> DownloadStream:
         try:
             logger.debug(f"Downloading file {filename} from bucket {self.bucket}")
-            response = self.client.get_object(Bucket=self.bucket, Key=filename)
-            logger.debug(f"Successfully downloaded file {filename}")
-            return response["Body"]
+            stream = super().download_file(filename, byte_range)
+            logger.debug(f"Opened download stream for {filename}")
+            return stream
         except Exception as e:
             logger.error(f"Error downloading file {filename}: {str(e)}", exc_info=True)
             raise ValueError(f"Failed to download file: {str(e)}")
 
+    def get_file_info(self, filename: str) -> dict:
+        try:
+            logger.debug(f"Getting info for {filename} in bucket {self.bucket}")
+            return super().get_file_info(filename)
+        except Exception as e:
+            logger.error(f"Error getting info for {filename}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to get file info: {str(e)}")
+
     def delete_file(self, filename: str) -> None:
         try:
             logger.debug(f"Deleting file {filename} from bucket {self.bucket}")
@@ -483,32 +1498,103 @@ class HetznerStorageProvider(StorageProvider):
             logger.error(f"Error deleting file {filename}: {str(e)}", exc_info=True)
             raise ValueError(f"Failed to delete file: {str(e)}")
 
-    def list_files(self, prefix: str = "") -> List[dict]:
+    def delete_files(self, filenames: Iterable[str]) -> Dict[str, Optional[str]]:
+        try:
+            logger.debug(f"Deleting files in batches from bucket {self.bucket}")
+            results = super().delete_files(filenames)
+            failed = sum(1 for error in results.values() if error)
+            if failed:
+                logger.warning(f"Failed to delete {failed} of {len(results)} files")
+            return results
+        except Exception as e:
+            logger.error(f"Error deleting files: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to delete files: {str(e)}")
+
+    def create_folder(self, folder: str) -> None:
+        try:
+            logger.debug(f"Creating folder {folder} in bucket {self.bucket}")
+            super().create_folder(folder)
+        except Exception as e:
+            logger.error(f"Error creating folder {folder}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to create folder: {str(e)}")
+
+    def delete_folder(self, folder: str) -> Iterator[Dict[str, Optional[str]]]:
+        try:
+            logger.debug(f"Deleting folder {folder} from bucket {self.bucket}")
+            yield from super().delete_folder(folder)
+        except Exception as e:
+            logger.error(f"Error deleting folder {folder}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to delete folder: {str(e)}")
+
+    def copy_file(
+        self, source: str, destination: str, size: Optional[int] = None
+    ) -> None:
+        try:
+            logger.debug(f"Copying {source} to {destination} in bucket {self.bucket}")
+            super().copy_file(source, destination, size)
+        except Exception as e:
+            logger.error(f"Error copying file {source}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to copy file: {str(e)}")
+
+    def copy_folder(
+        self, source: str, destination: str
+    ) -> Iterator[Dict[str, Optional[str]]]:
+        try:
+            logger.debug(f"Copying folder {source} to {destination}")
+            yield from super().copy_folder(source, destination)
+        except Exception as e:
+            logger.error(f"Error copying folder {source}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to copy folder: {str(e)}")
+
+    def move_folder(
+        self, source: str, destination: str
+    ) -> Iterator[Dict[str, Optional[str]]]:
+        try:
+            logger.debug(f"Moving folder {source} to {destination}")
+            yield from super().move_folder(source, destination)
+        except Exception as e:
+            logger.error(f"Error moving folder {source}: {str(e)}", exc_info=True)
+            raise ValueError(f"Failed to move folder: {str(e)}")
+
+    def list_files(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
         try:
             logger.debug(f"Listing files in bucket {self.bucket} with prefix: {prefix}")
-            response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
-            files = [
-                {"name": obj["Key"], "size": obj["Size"]}
-                for obj in response.get("Contents", [])
-            ]
-            logger.debug(f"Successfully listed {len(files)} files")
-            return files
+            count = 0
+            for file in super().list_files(prefix, start_after):
+                count += 1
+                yield file
+            logger.debug(f"Successfully listed {count} files")
         except Exception as e:
             logger.error(
                 f"Error listing files in bucket {self.bucket}: {str(e)}", exc_info=True
             )
             raise ValueError(f"Failed to list files: {str(e)}")
 
-    def get_file_url(self, filename: str, expires_in: int = 3600) -> str:
+    def list_directory(
+        self, prefix: str = "", start_after: Optional[str] = None
+    ) -> Iterator[dict]:
         try:
             logger.debug(
-                f"Generating presigned URL for file {filename} with expiration {expires_in} seconds"
+                f"Listing directory in bucket {self.bucket} with prefix: {prefix}"
             )
-            url = self.client.generate_presigned_url(
-                "get_object",
-                Params={"Bucket": self.bucket, "Key": filename},
-                ExpiresIn=expires_in,
+            yield from super().list_directory(prefix, start_after)
+        except Exception as e:
+            logger.error(
+                f"Error listing directory in bucket {self.bucket}: {str(e)}",
+                exc_info=True,
+            )
+            raise ValueError(f"Failed to list directory: {str(e)}")
+
+    def get_file_url(
+        self, filename: str, expires_in: int = 3600, download_name: Optional[str] = None
+    ) -> str:
+        try:
+            logger.debug(
+                f"Generating presigned URL for file {filename} with expiration {expires_in} seconds"
             )
+            url = super().get_file_url(filename, expires_in, download_name)
             logger.debug(f"Successfully generated presigned URL for file {filename}")
             return url
         except Exception as e:
@@ -544,4 +1630,4 @@ def get_storage_provider(provider_type: str, **credentials) -> StorageProvider:
     if provider_type not in providers:
         raise ValueError(f"Unsupported storage provider: {provider_type}")
 
-    return providers[provider_type](**credentials)
+    return instrument_provider(providers[provider_type](**credentials))
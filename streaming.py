@@ -0,0 +1,344 @@
+import io
+import logging
+import unicodedata
+from datetime import datetime
+from typing import (
+    AsyncIterator,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+)
+
+from urllib.parse import quote
+
+from werkzeug.http import dump_options_header
+from werkzeug.sansio.multipart import (
+    NEED_DATA,
+    Data,
+    Epilogue,
+    Field,
+    File,
+    MultipartDecoder,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bytes pulled from the request body per parser step
+UPLOAD_READ_SIZE = 256 * 1024
+
+# Largest regular form field accepted ahead of the file part
+MAX_FORM_FIELD_SIZE = 64 * 1024
+
+
+class MultipartUploadStream(io.RawIOBase):
+    """Read-only stream over the file part of a multipart/form-data body.
+
+    The request body is parsed incrementally, so bytes can be handed to the
+    storage provider as they arrive instead of spooling the whole upload to a
+    temporary file first. Only form fields sent *before* the file part are
+    available in :attr:`fields`.
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        boundary: bytes,
+        field_name: str = "file",
+        read_size: int = UPLOAD_READ_SIZE,
+    ):
+        super().__init__()
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary)
+        self._field_name = field_name
+        self._read_size = read_size
+        self._buffer = bytearray()
+        self._position = 0
+        self._file_done = False
+        self._input_done = False
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+
+    def next_file(self) -> bool:
+        """Advance to the file part, collecting preceding form fields.
+
+        Returns False if the body contains no part named ``field_name``.
+        """
+        while True:
+            event = self._next_event()
+            if isinstance(event, Field):
+                self.fields[event.name] = self._read_field()
+            elif isinstance(event, File):
+                if event.name == self._field_name:
+                    self.filename = event.filename
+                    return True
+                self._skip_part()
+            elif isinstance(event, Epilogue):
+                return False
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._file_done and (size < 0 or len(self._buffer) < size):
+            event = self._next_event()
+            if not isinstance(event, Data):
+                raise ValueError("Malformed multipart body")
+            self._buffer.extend(event.data)
+            self._file_done = not event.more_data
+
+        if size < 0 or size >= len(self._buffer):
+            chunk = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            chunk = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        self._position += len(chunk)
+        return chunk
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+    def _next_event(self):
+        while True:
+            event = self._decoder.next_event()
+            if event is not NEED_DATA:
+                return event
+            if self._input_done:
+                raise ValueError("Unexpected end of multipart body")
+            data = self._stream.read(self._read_size)
+            if data:
+                self._decoder.receive_data(data)
+            else:
+                self._input_done = True
+                self._decoder.receive_data(None)
+
+    def _read_field(self) -> str:
+        value = bytearray()
+        while True:
+            event = self._next_event()
+            value.extend(event.data)
+            if len(value) > MAX_FORM_FIELD_SIZE:
+                raise ValueError("Form field too large")
+            if not event.more_data:
+                return value.decode("utf-8", "replace")
+
+    def _skip_part(self) -> None:
+        while self._next_event().more_data:
+            pass
+
+
+class AsyncMultipartUploadStream:
+    """:class:`MultipartUploadStream` over the body of an ASGI request.
+
+    ``chunks`` yields the body as it is received, so reading the file part
+    suspends the request instead of blocking a thread.
+    """
+
+    def __init__(
+        self,
+        chunks: AsyncIterator[bytes],
+        boundary: bytes,
+        field_name: str = "file",
+    ):
+        self._chunks = chunks
+        self._decoder = MultipartDecoder(boundary)
+        self._field_name = field_name
+        self._buffer = bytearray()
+        self._file_done = False
+        self._input_done = False
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+
+    async def next_file(self) -> bool:
+        while True:
+            event = await self._next_event()
+            if isinstance(event, Field):
+                self.fields[event.name] = await self._read_field()
+            elif isinstance(event, File):
+                if event.name == self._field_name:
+                    self.filename = event.filename
+                    return True
+                await self._skip_part()
+            elif isinstance(event, Epilogue):
+                return False
+
+    async def read(self, size: int = -1) -> bytes:
+        while not self._file_done and (size < 0 or len(self._buffer) < size):
+            event = await self._next_event()
+            if not isinstance(event, Data):
+                raise ValueError("Malformed multipart body")
+            self._buffer.extend(event.data)
+            self._file_done = not event.more_data
+
+        if size < 0 or size >= len(self._buffer):
+            chunk = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            chunk = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return chunk
+
+    async def _next_event(self):
+        while True:
+            event = self._decoder.next_event()
+            if event is not NEED_DATA:
+                return event
+            if self._input_done:
+                raise ValueError("Unexpected end of multipart body")
+            data = await anext(self._chunks, b"")
+            if data:
+                self._decoder.receive_data(data)
+            else:
+                self._input_done = True
+                self._decoder.receive_data(None)
+
+    async def _read_field(self) -> str:
+        value = bytearray()
+        while True:
+            event = await self._next_event()
+            value.extend(event.data)
+            if len(value) > MAX_FORM_FIELD_SIZE:
+                raise ValueError("Form field too large")
+            if not event.more_data:
+                return value.decode("utf-8", "replace")
+
+    async def _skip_part(self) -> None:
+        while (await self._next_event()).more_data:
+            pass
+
+
+# Bytes pulled from the provider per chunk when streaming a download
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadStream(io.RawIOBase):
+    """Streaming body of a downloaded object.
+
+    Wraps an iterator of chunks from the provider so a download is relayed
+    with a bounded buffer instead of being read into memory first. Iterating
+    the stream yields those chunks directly.
+    """
+
+    def __init__(
+        self,
+        chunks: Iterable[bytes],
+        content_length: Optional[int] = None,
+        total_length: Optional[int] = None,
+        content_type: Optional[str] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[datetime] = None,
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self._on_close = on_close
+        self.content_length = content_length
+        # Size of the whole object; differs from content_length for ranges
+        self.total_length = content_length if total_length is None else total_length
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def readable(self) -> bool:
+        return True
+
+    def observe(
+        self,
+        on_chunk: Callable[[int], None],
+        on_close: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """Report the size of every chunk pulled from the provider and,
+        optionally, the closing of the stream"""
+        chunks = self._chunks
+
+        def observed():
+            for chunk in chunks:
+                on_chunk(len(chunk))
+                yield chunk
+
+        self._chunks = observed()
+        if on_close is not None:
+            close = self._on_close
+
+            def closed():
+                try:
+                    if close is not None:
+                        close()
+                finally:
+                    on_close()
+
+            self._on_close = closed
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self.iter_chunks()
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        if self._buffer:
+            chunk, self._buffer = self._buffer, b""
+            yield chunk
+        for chunk in self._chunks:
+            if chunk:
+                yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return b"".join(self.iter_chunks())
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+    def close(self) -> None:
+        if not self.closed and self._on_close is not None:
+            try:
+                self._on_close()
+            except Exception as e:
+                logger.warning(f"Error closing download stream: {str(e)}")
+        super().close()
+
+
+def read_chunks(
+    file_obj, chunk_size: int = DOWNLOAD_CHUNK_SIZE, length: Optional[int] = None
+) -> Iterator[bytes]:
+    """Iterate a file-like object in fixed-size chunks, up to ``length`` bytes"""
+    remaining = length
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        chunk = file_obj.read(size)
+        if not chunk:
+            return
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+def content_disposition(filename: str) -> str:
+    """``Content-Disposition`` value that downloads ``filename`` as an attachment"""
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        # RFC 6266: ASCII fallback plus the UTF-8 name for clients that support it
+        simple = unicodedata.normalize("NFKD", filename)
+        simple = simple.encode("ascii", "ignore").decode("ascii")
+        quoted = quote(filename, safe="!#$&+^`|~")
+        options = {"filename": simple, "filename*": f"UTF-8''{quoted}"}
+    else:
+        options = {"filename": filename}
+    return dump_options_header("attachment", options)
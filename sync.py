@@ -0,0 +1,478 @@
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from provider_registry import provider_cache_key
+from storage_providers import StorageProvider, get_storage_provider
+from transfer import plain_md5
+
+logger = logging.getLogger(__name__)
+
+# Files transferred in parallel; large files additionally upload their
+# parts in parallel through the provider's multipart settings
+SYNC_WORKERS = int(os.environ.get("SYNC_WORKERS", 8))
+# Manifest of the last synced state of every file, per sync root
+SYNC_STATE_PATH = os.environ.get(
+    "SYNC_STATE_PATH", os.path.join(os.path.expanduser("~"), ".s3filesharegui-sync.db")
+)
+SYNC_DIRECTIONS = ("upload", "download", "both")
+
+# Downloads are written next to their target under this prefix and renamed
+# into place, so an interrupted sync never leaves a truncated file
+TEMP_PREFIX = ".s3sync-"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class LocalFile(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+
+
+class SyncRecord(NamedTuple):
+    """Both sides of a file as of the last time it was synced"""
+
+    local_size: Optional[int]
+    local_mtime_ns: Optional[int]
+    remote_size: Optional[int]
+    remote_etag: Optional[str]
+
+
+class SyncAction(NamedTuple):
+    # upload, download, delete_remote, delete_local, compare, conflict or forget
+    kind: str
+    key: str
+    local: Optional[LocalFile] = None
+    remote: Optional[dict] = None
+
+
+class SyncState:
+    """SQLite manifest of synced files, keyed by sync root and object key"""
+
+    def __init__(self, path: str = SYNC_STATE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS sync_files (
+                    root TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    local_size INTEGER,
+                    local_mtime_ns INTEGER,
+                    remote_size INTEGER,
+                    remote_etag TEXT,
+                    synced_at REAL NOT NULL,
+                    PRIMARY KEY (root, key)
+                )
+                """)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, root: str) -> Dict[str, SyncRecord]:
+        rows = self._connection().execute(
+            "SELECT key, local_size, local_mtime_ns, remote_size, remote_etag "
+            "FROM sync_files WHERE root = ?",
+            (root,),
+        )
+        return {row[0]: SyncRecord(*row[1:]) for row in rows}
+
+    def save(self, root: str, records: Dict[str, Optional[SyncRecord]]) -> None:
+        """Store records; ``None`` removes a key from the manifest"""
+        now = time.time()
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO sync_files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (root, key, *record, now)
+                    for key, record in records.items()
+                    if record is not None
+                ],
+            )
+            connection.executemany(
+                "DELETE FROM sync_files WHERE root = ? AND key = ?",
+                [(root, key) for key, record in records.items() if record is None],
+            )
+
+
+def sync_root_id(
+    provider_type: str, provider_config: dict, local_dir: str, prefix: str
+):
+    payload = json.dumps(
+        [
+            provider_cache_key(provider_type, provider_config),
+            os.path.abspath(local_dir),
+            prefix,
+        ]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def scan_local(local_dir: str, prefix: str = "") -> Dict[str, LocalFile]:
+    """Every regular file below ``local_dir``, keyed by its object key"""
+    files = {}
+    stack = [local_dir]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file() and not entry.name.startswith(TEMP_PREFIX):
+                    stat = entry.stat()
+                    relative = os.path.relpath(entry.path, local_dir)
+                    key = prefix + relative.replace(os.sep, "/")
+                    files[key] = LocalFile(entry.path, stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def plan_sync(
+    local: Dict[str, LocalFile],
+    remote: Optional[Dict[str, dict]],
+    state: Dict[str, SyncRecord],
+    direction: str,
+    delete: bool = False,
+) -> Iterator[SyncAction]:
+    """Decide what to do with every key seen on either side or in the manifest.
+
+    A side counts as changed when it differs from the manifest: size and
+    mtime locally, ETag remotely. With ``remote`` set to None the bucket was
+    not listed, and every remote object is taken to be as last synced.
+    Keys present on both sides but not in the manifest are compared by
+    content (``compare``).
+    """
+    keys = set(local) | set(state) | set(remote or ())
+    for key in sorted(keys):
+        here = local.get(key)
+        record = state.get(key)
+        if remote is not None:
+            there = remote.get(key)
+        elif record is not None:
+            there = {
+                "name": key,
+                "size": record.remote_size,
+                "etag": record.remote_etag,
+            }
+        else:
+            there = None
+
+        if here is None and there is None:
+            if record is not None:
+                yield SyncAction("forget", key)
+            continue
+        if record is None and here is not None and there is not None:
+            yield SyncAction("compare", key, here, there)
+            continue
+        local_changed = here is not None and (
+            record is None
+            or (here.size, here.mtime_ns) != (record.local_size, record.local_mtime_ns)
+        )
+        remote_changed = there is not None and (
+            record is None or there.get("etag") != record.remote_etag
+        )
+
+        if direction == "upload":
+            if here is None:
+                if delete:
+                    yield SyncAction("delete_remote", key, remote=there)
+            elif local_changed or remote_changed or there is None:
+                yield SyncAction("upload", key, here, there)
+        elif direction == "download":
+            if there is None:
+                if delete:
+                    yield SyncAction("delete_local", key, local=here)
+            elif local_changed or remote_changed or here is None:
+                yield SyncAction("download", key, here, there)
+        elif local_changed and remote_changed:
+            yield SyncAction("conflict", key, here, there)
+        elif here is None:
+            # Without ``delete`` a deleted copy is restored from the other side
+            if remote_changed or not delete:
+                yield SyncAction("download", key, remote=there)
+            else:
+                yield SyncAction("delete_remote", key, remote=there)
+        elif there is None:
+            if local_changed or not delete:
+                yield SyncAction("upload", key, local=here)
+            else:
+                yield SyncAction("delete_local", key, local=here)
+        elif local_changed:
+            yield SyncAction("upload", key, here, there)
+        elif remote_changed:
+            yield SyncAction("download", key, here, there)
+
+
+def _file_md5(path: str) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _timestamp_ns(value) -> Optional[int]:
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp() * 1e9)
+    return None
+
+
+class Sync:
+    """Synchronises a local directory with a bucket prefix.
+
+    Differences are found from the manifest in :class:`SyncState`, so
+    unchanged files are neither hashed nor transferred. One-way uploads
+    after the first sync do not even list the bucket unless ``full`` is
+    set. Transfers run in a pool of ``workers`` threads; large uploads use
+    the provider's parallel multipart upload.
+    """
+
+    def __init__(
+        self,
+        provider: StorageProvider,
+        provider_config: dict,
+        local_dir: str,
+        prefix: str = "",
+        direction: str = "both",
+        delete: bool = False,
+        dry_run: bool = False,
+        full: bool = False,
+        workers: int = SYNC_WORKERS,
+        state: Optional[SyncState] = None,
+    ):
+        if direction not in SYNC_DIRECTIONS:
+            raise ValueError(f"direction must be one of {', '.join(SYNC_DIRECTIONS)}")
+        self.provider = provider
+        self.local_dir = os.path.abspath(local_dir)
+        self.prefix = prefix
+        self.direction = direction
+        self.delete = delete
+        self.dry_run = dry_run
+        self.full = full
+        self.workers = max(1, workers)
+        self.state = state or SyncState()
+        self.root = sync_root_id(
+            provider.provider_type, provider_config, self.local_dir, prefix
+        )
+        self.stats: Dict[str, int] = {}
+        self.errors: Dict[str, str] = {}
+        self.conflicts: List[str] = []
+
+    def run(self) -> Dict[str, int]:
+        state = self.state.load(self.root)
+        local = scan_local(self.local_dir, self.prefix)
+        remote = None
+        if self.full or not state or self.direction != "upload":
+            remote = {
+                entry["name"]: entry
+                for entry in self.provider.list_files(self.prefix)
+                if not entry["name"].endswith("/")
+            }
+        actions = plan_sync(local, remote, state, self.direction, self.delete)
+        self._execute(actions)
+        logger.info(
+            "Sync finished: "
+            + ", ".join(f"{count} {kind}" for kind, count in sorted(self.stats.items()))
+        )
+        return self.stats
+
+    def _execute(self, actions: Iterator[SyncAction]) -> None:
+        updates: Dict[str, Optional[SyncRecord]] = {}
+        in_flight = {}
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="sync"
+        ) as pool:
+            actions = iter(actions)
+            while True:
+                while len(in_flight) < 2 * self.workers:
+                    action = next(actions, None)
+                    if action is None:
+                        break
+                    if action.kind == "conflict":
+                        self.conflicts.append(action.key)
+                        self._count("conflict")
+                        continue
+                    if self.dry_run:
+                        print(f"{action.kind}: {action.key}")
+                        self._count(action.kind)
+                        continue
+                    in_flight[pool.submit(self._apply, action)] = action
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    action = in_flight.pop(future)
+                    try:
+                        kind, record = future.result()
+                    except Exception as e:
+                        logger.warning(f"Error syncing {action.key}: {str(e)}")
+                        self.errors[action.key] = str(e)
+                        self._count("failed")
+                        continue
+                    self._count(kind)
+                    if kind == "conflict":
+                        self.conflicts.append(action.key)
+                        continue
+                    updates[action.key] = record
+                # The manifest is written in batches from this thread only
+                if len(updates) >= 500:
+                    self.state.save(self.root, updates)
+                    updates = {}
+        self.state.save(self.root, updates)
+
+    def _apply(self, action: SyncAction):
+        """Carry out one action; returns what was done and the new manifest
+        record (None to drop the key)"""
+        kind = action.kind
+        if kind == "compare":
+            kind = self._resolve(action)
+            if kind == "conflict":
+                return kind, None
+            if kind == "same":
+                return kind, self._record(action.local, action.remote)
+        if kind == "upload":
+            return kind, self._upload(action)
+        if kind == "download":
+            return kind, self._download(action)
+        if kind == "delete_remote":
+            self.provider.delete_file(action.key)
+        elif kind == "delete_local":
+            os.remove(action.local.path)
+        return kind, None
+
+    def _resolve(self, action: SyncAction) -> str:
+        """Settle a key found on both sides without a manifest entry"""
+        remote_md5 = plain_md5(action.remote.get("etag"))
+        if action.local.size == action.remote.get("size") and (
+            remote_md5 is None or _file_md5(action.local.path) == remote_md5
+        ):
+            return "same"
+        if self.direction == "both":
+            return "conflict"
+        return self.direction
+
+    def _upload(self, action: SyncAction) -> SyncRecord:
+        local = action.local
+        with open(local.path, "rb") as f:
+            self.provider.upload_file(f, action.key, size=local.size)
+        # The new ETag goes into the manifest so the next sync does not take
+        # this upload for a remote change
+        return self._record(local, self.provider.get_file_info(action.key))
+
+    def _download(self, action: SyncAction) -> SyncRecord:
+        path = self._local_path(action.key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = os.path.join(
+            os.path.dirname(path), f"{TEMP_PREFIX}{os.path.basename(path)}"
+        )
+        stream = self.provider.download_file(action.key)
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in stream.iter_chunks():
+                    f.write(chunk)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            stream.close()
+        os.replace(temp_path, path)
+        mtime_ns = _timestamp_ns(action.remote.get("last_modified"))
+        if mtime_ns:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        stat = os.stat(path)
+        return self._record(
+            LocalFile(path, stat.st_size, stat.st_mtime_ns), action.remote
+        )
+
+    def _local_path(self, key: str) -> str:
+        relative = key[len(self.prefix) :]
+        path = os.path.normpath(os.path.join(self.local_dir, *relative.split("/")))
+        # Keys such as "../x" must not escape the sync directory
+        if os.path.commonpath([path, self.local_dir]) != self.local_dir:
+            raise ValueError(f"Key {key} maps outside the sync directory")
+        return path
+
+    @staticmethod
+    def _record(local: LocalFile, remote: dict) -> SyncRecord:
+        return SyncRecord(local.size, local.mtime_ns, remote["size"], remote["etag"])
+
+    def _count(self, kind: str) -> None:
+        self.stats[kind] = self.stats.get(kind, 0) + 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Synchronise a local directory with a bucket prefix."
+    )
+    parser.add_argument("local_dir")
+    parser.add_argument("--provider-type", required=True)
+    parser.add_argument(
+        "--provider-config", required=True, help="JSON credentials or a JSON file"
+    )
+    parser.add_argument("--prefix", default="")
+    parser.add_argument("--direction", choices=SYNC_DIRECTIONS, default="both")
+    parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="propagate deletions instead of restoring deleted files",
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--full", action="store_true", help="always list the bucket when uploading"
+    )
+    parser.add_argument("--workers", type=int, default=SYNC_WORKERS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if os.path.exists(args.provider_config):
+        with open(args.provider_config) as f:
+            provider_config = json.load(f)
+    else:
+        provider_config = json.loads(args.provider_config)
+    prefix = args.prefix
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    os.makedirs(args.local_dir, exist_ok=True)
+
+    provider = get_storage_provider(args.provider_type, **provider_config)
+    try:
+        sync = Sync(
+            provider,
+            provider_config,
+            args.local_dir,
+            prefix,
+            args.direction,
+            args.delete,
+            args.dry_run,
+            args.full,
+            args.workers,
+        )
+        sync.run()
+    finally:
+        provider.close()
+    for key in sync.conflicts:
+        print(f"conflict: {key} changed on both sides", file=sys.stderr)
+    for key, error in sync.errors.items():
+        print(f"failed: {key}: {error}", file=sys.stderr)
+    summary = ", ".join(f"{n} {kind}" for kind, n in sorted(sync.stats.items()))
+    print(summary or "Already in sync", file=sys.stderr)
+    return 1 if sync.errors or sync.conflicts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# Module-level state (SQLite indexes, checkpoints, caches) is created at
+# import, so it is pointed at a scratch directory before any app import
+_state_dir = tempfile.mkdtemp(prefix="s3filesharegui-tests-")
+os.environ.setdefault("INDEX_PATH", os.path.join(_state_dir, "index.db"))
+os.environ.setdefault("DEDUP_INDEX_PATH", os.path.join(_state_dir, "dedup.db"))
+os.environ.setdefault("TRANSFER_STATE_DIR", os.path.join(_state_dir, "transfers"))
+os.environ.setdefault("CACHE_BACKEND", "memory")
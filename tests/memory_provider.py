@@ -0,0 +1,75 @@
+import hashlib
+from datetime import datetime, timezone
+
+from storage_providers import StorageProvider
+from streaming import DownloadStream
+
+LAST_MODIFIED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class MemoryProvider(StorageProvider):
+    """Objects held in a dict, listed in key order like a bucket"""
+
+    provider_type = "aws"
+
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+        self.downloads = []
+        self.listings = 0
+
+    def upload_file(self, file_obj, filename, size=None):
+        self.objects[filename] = file_obj.read()
+
+    def download_file(self, filename, byte_range=None):
+        self.downloads.append(filename)
+        data = self.objects[filename]
+        info = self.get_file_info(filename)
+        body = data[byte_range[0] : byte_range[1] + 1] if byte_range else data
+        return DownloadStream(
+            [body],
+            len(body),
+            len(data),
+            etag=info["etag"],
+            last_modified=info["last_modified"],
+        )
+
+    def get_file_info(self, filename):
+        data = self.objects[filename]
+        return {
+            "name": filename,
+            "size": len(data),
+            "etag": f'"{hashlib.md5(data).hexdigest()}"',
+            "last_modified": LAST_MODIFIED,
+        }
+
+    def delete_file(self, filename):
+        del self.objects[filename]
+
+    def copy_file(self, source, destination, size=None):
+        self.objects[destination] = self.objects[source]
+
+    def list_files(self, prefix="", start_after=None):
+        self.listings += 1
+        for name in sorted(self.objects):
+            if name.startswith(prefix) and (start_after is None or name > start_after):
+                yield self.get_file_info(name)
+
+    def list_directory(self, prefix="", start_after=None):
+        self.listings += 1
+        folders = set()
+        for name in sorted(self.objects):
+            if not name.startswith(prefix) or name == prefix:
+                continue
+            child = name[len(prefix) :]
+            if "/" in child:
+                folder = prefix + child.split("/", 1)[0] + "/"
+                if folder not in folders and (
+                    start_after is None or folder > start_after
+                ):
+                    folders.add(folder)
+                    yield {"name": folder, "type": "folder"}
+            elif start_after is None or name > start_after:
+                yield dict(self.get_file_info(name), type="file")
+
+    def get_file_url(self, filename, expires_in=3600, download_name=None):
+        return f"https://storage.example/{filename}?expires={expires_in}"
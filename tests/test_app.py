@@ -0,0 +1,432 @@
+import base64
+import json
+from unittest import mock
+
+import pytest
+
+import app as app_module
+import cache
+from memory_provider import MemoryProvider
+from provider_registry import provider_cache_key
+from transfer import TRANSFER_MAX_WORKERS, TransferCheckpoint, TransferManager
+
+SESSION_CONFIG = {
+    "access_key": "key",
+    "secret_key": "secret",
+    "bucket": "files",
+    "region": "us-east-1",
+}
+DESTINATION = {
+    "provider_type": "wasabi",
+    "config": {
+        "access_key": "key",
+        "secret_key": "secret",
+        "bucket": "backup",
+        "region": "eu-central-1",
+    },
+}
+
+
+@pytest.fixture
+def client():
+    app_module.app.config["WTF_CSRF_ENABLED"] = False
+    cache.cache_backend.clear()
+    # Skips the HTTPS redirect
+    app_module.app.debug = True
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["authenticated"] = True
+        session["provider_type"] = "aws"
+        session["provider_config"] = SESSION_CONFIG
+    return client
+
+
+@pytest.fixture
+def provider():
+    provider = MemoryProvider()
+    with mock.patch.object(app_module, "get_current_provider", return_value=provider):
+        yield provider
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = TransferManager(str(tmp_path))
+    with mock.patch.object(app_module, "transfer_manager", manager):
+        yield manager
+
+
+@pytest.mark.parametrize(
+    "provider_type,config,error",
+    [
+        (
+            "wasabi",
+            dict(DESTINATION["config"], region="evil.example/x"),
+            "Invalid region",
+        ),
+        (
+            "cloudflare",
+            {
+                "account_id": "attacker.example#",
+                "access_key": "key",
+                "secret_key": "secret",
+                "bucket": "backup",
+            },
+            "Invalid Cloudflare account ID",
+        ),
+        ("aws", {"access_key": "key"}, "Secret Key is required"),
+        ("ftp", {}, "Invalid storage provider selected"),
+    ],
+)
+def test_transfer_configs_are_validated(client, manager, provider_type, config, error):
+    response = client.post(
+        "/transfers",
+        json={"destination": {"provider_type": provider_type, "config": config}},
+    )
+    assert response.status_code == 400
+    assert response.json["error"] == error
+    assert manager.list(provider_cache_key("aws", SESSION_CONFIG)) == []
+
+
+def test_transfer_workers_are_clamped(client, manager):
+    with mock.patch.object(manager, "start", return_value="0123456789abcdef") as start:
+        response = client.post(
+            "/transfers", json={"destination": DESTINATION, "workers": 10000}
+        )
+    assert response.status_code == 202
+    assert start.call_args.kwargs["workers"] == TRANSFER_MAX_WORKERS
+    assert start.call_args.args[0] == provider_cache_key("aws", SESSION_CONFIG)
+
+
+def test_transfers_of_other_owners_are_not_found(client, manager, tmp_path):
+    checkpoint = TransferCheckpoint(str(tmp_path / "0123456789abcdef.json"))
+    checkpoint.job = {"owner": "someone else", "state": "running"}
+    checkpoint.save()
+
+    assert client.get("/transfers").json == {"transfers": []}
+    assert client.get("/transfers/0123456789abcdef").status_code == 404
+    assert client.post("/transfers/0123456789abcdef/cancel").status_code == 404
+    assert client.post("/transfers/0123456789abcdef/resume").status_code == 404
+    assert not checkpoint.cancel_requested()
+
+
+def test_multipart_complete_does_not_index_client_hashes(client):
+    provider = mock.Mock()
+    with mock.patch.object(
+        app_module, "get_current_provider", return_value=provider
+    ), mock.patch.object(app_module, "DEDUP_UPLOADS", True), mock.patch.object(
+        app_module, "dedup_index"
+    ) as dedup_index:
+        response = client.post(
+            "/multipart/complete",
+            json={
+                "key": "big.bin",
+                "upload_id": "upload",
+                "parts": [{"PartNumber": 1, "ETag": '"etag"'}],
+                "size": 10,
+                "content_hash": "0" * 64,
+            },
+        )
+    assert response.status_code == 200
+    provider.complete_multipart_upload.assert_called_once()
+    dedup_index.record_upload.assert_not_called()
+    dedup_index.record.assert_not_called()
+
+
+def test_list_pages_follow_the_cursor(client, provider):
+    provider.objects = {f"docs/{n}.txt": b"x" for n in "abcde"}
+    names, cursor, pages = [], None, 0
+    while True:
+        query = {"prefix": "docs/", "limit": 2, "previews": "false"}
+        if cursor:
+            query["cursor"] = cursor
+        page = client.get("/list", query_string=query).json
+        names += [entry["name"] for entry in page["files"]]
+        cursor = page["next_cursor"]
+        pages += 1
+        if cursor is None:
+            break
+    assert names == [f"docs/{n}.txt" for n in "abcde"]
+    assert pages == 3
+
+
+def test_list_directory_returns_folders_and_files(client, provider):
+    provider.objects = {"a.txt": b"1", "photos/b.png": b"2", "photos/c/d.png": b"3"}
+    response = client.get("/list", query_string={"previews": "false"})
+    assert [(e["name"], e["type"]) for e in response.json["files"]] == [
+        ("a.txt", "file"),
+        ("photos/", "folder"),
+    ]
+    recursive = client.get(
+        "/list", query_string={"prefix": "photos/", "recursive": "true"}
+    )
+    assert [e["name"] for e in recursive.json["files"]] == [
+        "photos/b.png",
+        "photos/c/d.png",
+    ]
+
+
+def tampered_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"cursor": "not base64!"},
+        {"cursor": app_module.encode_list_cursor("other/", "other/a"), "prefix": ""},
+        {"cursor": tampered_cursor({"p": ""})},
+        {"cursor": tampered_cursor({"p": "", "k": 1})},
+        {"cursor": tampered_cursor(["", "a"])},
+        {"limit": 0},
+        {"limit": app_module.LIST_MAX_LIMIT + 1},
+    ],
+)
+def test_list_rejects_bad_cursors_and_limits(client, provider, query):
+    assert client.get("/list", query_string=query).status_code == 400
+
+
+@pytest.fixture
+def proxied(provider):
+    provider.objects = {"a.bin": b"0123456789"}
+    with mock.patch.dict("os.environ", {"DOWNLOAD_MODE_AWS": "proxy"}):
+        yield provider
+
+
+def test_download_serves_byte_ranges(client, proxied):
+    response = client.get("/download/a.bin", headers={"Range": "bytes=2-4"})
+    assert response.status_code == 206
+    assert response.data == b"234"
+    assert response.headers["Content-Range"] == "bytes 2-4/10"
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+    suffix = client.get("/download/a.bin", headers={"Range": "bytes=-3"})
+    assert suffix.data == b"789"
+
+
+def test_download_rejects_unsatisfiable_ranges(client, proxied):
+    response = client.get("/download/a.bin", headers={"Range": "bytes=20-30"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */10"
+
+
+def test_download_answers_conditional_requests(client, proxied):
+    etag = proxied.get_file_info("a.bin")["etag"]
+    response = client.get("/download/a.bin", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    # A stale If-Range falls back to the whole object
+    response = client.get(
+        "/download/a.bin", headers={"Range": "bytes=0-1", "If-Range": '"stale"'}
+    )
+    assert response.status_code == 200
+    assert response.data == b"0123456789"
+
+
+def test_download_redirects_large_objects_in_auto_mode(client, provider):
+    provider.objects = {"small.bin": b"1", "large.bin": b"1" * 100}
+    with mock.patch.dict(
+        "os.environ", {"DOWNLOAD_MODE_AWS": "auto"}
+    ), mock.patch.object(app_module, "DOWNLOAD_REDIRECT_THRESHOLD", 50):
+        small = client.get("/download/small.bin")
+        large = client.get("/download/large.bin")
+    assert small.status_code == 200
+    assert small.data == b"1"
+    assert large.status_code == 302
+    assert large.headers["Location"].startswith("https://storage.example/large.bin")
+    assert large.headers["Cache-Control"] == "no-store"
+    assert provider.downloads == ["small.bin"]
+
+
+def test_download_always_redirects_in_redirect_mode(client, provider):
+    provider.objects = {"a.bin": b"1"}
+    with mock.patch.dict("os.environ", {"DOWNLOAD_MODE_AWS": "redirect"}):
+        response = client.get("/download/a.bin")
+    assert response.status_code == 302
+    assert provider.downloads == []
+
+
+def test_writes_invalidate_cached_listings(client, provider):
+    provider.objects = {"docs/a.txt": b"1"}
+    query = {"prefix": "docs/", "previews": "false"}
+    assert len(client.get("/list", query_string=query).json["files"]) == 1
+    assert len(client.get("/list", query_string=query).json["files"]) == 1
+    assert provider.listings == 1
+
+    assert client.delete("/delete/docs/a.txt").status_code == 200
+    assert client.get("/list", query_string=query).json["files"] == []
+    assert provider.listings == 2
+
+
+def folder_result(response):
+    lines = [json.loads(line) for line in response.data.splitlines()]
+    assert lines[-1]["finished"]
+    return lines[-1]
+
+
+def test_move_renames_a_file(client, provider):
+    provider.objects = {"a.txt": b"1"}
+    response = client.post("/move", json={"source": "a.txt", "destination": "b.txt"})
+    assert response.status_code == 200
+    assert provider.objects == {"b.txt": b"1"}
+
+
+def test_copy_and_move_folders(client, provider):
+    provider.objects = {"src/a.txt": b"1", "src/sub/b.txt": b"2", "srcx.txt": b"3"}
+    result = folder_result(
+        client.post("/copy", json={"source": "src/", "destination": "dst/"})
+    )
+    assert (result["done"], result["failed"]) == (2, 0)
+    assert provider.objects["dst/sub/b.txt"] == b"2"
+
+    folder_result(
+        client.post("/move", json={"source": "dst/", "destination": "moved/"})
+    )
+    assert sorted(provider.objects) == [
+        "moved/a.txt",
+        "moved/sub/b.txt",
+        "src/a.txt",
+        "src/sub/b.txt",
+        "srcx.txt",
+    ]
+
+
+@pytest.mark.parametrize(
+    "source,destination",
+    [("src/", "src/sub/"), ("src/sub/", "src/"), ("/", "dst/"), ("a.txt", "a.txt")],
+)
+def test_copy_rejects_overlapping_or_empty_paths(client, provider, source, destination):
+    response = client.post("/copy", json={"source": source, "destination": destination})
+    assert response.status_code == 400
+
+
+def test_copy_without_server_side_support(client, provider):
+    provider.objects = {"a.txt": b"1"}
+    with mock.patch.object(
+        provider, "copy_file", side_effect=NotImplementedError("no")
+    ):
+        response = client.post("/copy", json={"source": "a.txt", "destination": "b"})
+    assert response.status_code == 501
+
+
+def test_preview_urls_sign_only_previewable_files(client, provider):
+    response = client.post("/preview-urls", json={"keys": ["a.png", "notes.txt"]})
+    assert response.status_code == 200
+    assert list(response.json["urls"]) == ["a.png"]
+    assert response.json["urls"]["a.png"].startswith("https://storage.example/a.png")
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {},
+        {"keys": "a.png"},
+        {"keys": [1]},
+        {"keys": ["a.png"] * (app_module.PREVIEW_URLS_MAX_KEYS + 1)},
+    ],
+)
+def test_preview_urls_reject_bad_keys(client, provider, body):
+    assert client.post("/preview-urls", json=body).status_code == 400
+
+
+def test_multipart_initiate_returns_part_size(client):
+    provider = mock.Mock()
+    provider.create_multipart_upload.return_value = "upload"
+    provider.upload_tuning.part_size_for.return_value = 8 * 1024 * 1024
+    provider.upload_tuning.concurrency = 4
+    with mock.patch.object(app_module, "get_current_provider", return_value=provider):
+        response = client.post(
+            "/multipart/initiate",
+            json={"filename": "big.bin", "folder": "docs", "size": 1 << 30},
+        )
+    assert response.status_code == 200
+    assert response.json == {
+        "key": "docs/big.bin",
+        "upload_id": "upload",
+        "part_size": 8 * 1024 * 1024,
+        "concurrency": 4,
+    }
+    provider.upload_tuning.part_size_for.assert_called_once_with(1 << 30)
+
+
+@pytest.mark.parametrize(
+    "path,body",
+    [
+        ("/multipart/initiate", {}),
+        ("/multipart/initiate", {"filename": "a", "size": "big"}),
+        ("/multipart/part-urls", {"key": "a", "upload_id": "u"}),
+        ("/multipart/part-urls", {"key": "a", "upload_id": "u", "part_numbers": [0]}),
+        (
+            "/multipart/part-urls",
+            {
+                "key": "a",
+                "upload_id": "u",
+                "part_numbers": list(
+                    range(1, app_module.MULTIPART_MAX_URLS_PER_REQUEST + 2)
+                ),
+            },
+        ),
+        ("/multipart/complete", {"key": "a", "upload_id": "u", "parts": [{}]}),
+        ("/multipart/abort", {"key": "a"}),
+    ],
+)
+def test_multipart_requests_are_validated(client, path, body):
+    provider = mock.Mock()
+    with mock.patch.object(app_module, "get_current_provider", return_value=provider):
+        assert client.post(path, json=body).status_code == 400
+    assert provider.method_calls == []
+
+
+def test_multipart_is_unavailable_without_presigned_parts(client, provider):
+    response = client.post("/multipart/initiate", json={"filename": "a.bin"})
+    assert response.status_code == 501
+
+
+def test_delete_batch_reports_each_key(client, provider):
+    provider.objects = {"docs/a.txt": b"1", "docs/b.txt": b"2", "docs/c.txt": b"3"}
+    query = {"prefix": "docs/", "previews": "false"}
+    client.get("/list", query_string=query)
+    delete_file = provider.delete_file
+
+    def locked(filename):
+        if filename == "docs/c.txt":
+            raise PermissionError("locked")
+        delete_file(filename)
+
+    with mock.patch.object(provider, "delete_file", locked):
+        response = client.post(
+            "/delete-batch", json={"keys": ["docs/a.txt", "docs/b.txt", "docs/c.txt"]}
+        )
+    assert response.status_code == 200
+    assert sorted(response.json["deleted"]) == ["docs/a.txt", "docs/b.txt"]
+    assert response.json["errors"] == {"docs/c.txt": "locked"}
+    listed = client.get("/list", query_string=query).json["files"]
+    assert [entry["name"] for entry in listed] == ["docs/c.txt"]
+
+
+@pytest.mark.parametrize(
+    "body", [{}, {"keys": "a.txt"}, {"keys": [""]}, {"keys": ["a.txt", None]}]
+)
+def test_delete_batch_rejects_bad_keys(client, provider, body):
+    assert client.post("/delete-batch", json=body).status_code == 400
+
+
+def test_create_and_delete_folder(client, provider):
+    provider.objects = {"photos/a.png": b"1", "photos/b/c.png": b"2", "photosx": b"3"}
+    response = client.post("/create_folder", json={"folder_name": "/empty//"})
+    assert response.json["folder"] == "empty/"
+    assert provider.objects["empty/"] == b""
+
+    result = folder_result(client.post("/delete_folder", json={"folder": "photos"}))
+    assert (result["done"], result["failed"]) == (2, 0)
+    assert sorted(provider.objects) == ["empty/", "photosx"]
+
+
+@pytest.mark.parametrize("folder", [None, "", "/", "a/../b", 3])
+def test_folder_routes_reject_unusable_names(client, provider, folder):
+    provider.objects = {"a.txt": b"1"}
+    assert (
+        client.post("/create_folder", json={"folder_name": folder}).status_code == 400
+    )
+    assert client.post("/delete_folder", json={"folder": folder}).status_code == 400
+    assert provider.objects == {"a.txt": b"1"}
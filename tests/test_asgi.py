@@ -0,0 +1,157 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from unittest import mock
+
+import boto3
+
+import app as app_module
+import asgi
+import async_providers
+from storage_providers import WasabiProvider
+
+
+def session_cookie(data):
+    serializer = app_module.app.session_interface.get_signing_serializer(app_module.app)
+    return f"{app_module.app.config['SESSION_COOKIE_NAME']}={serializer.dumps(data)}"
+
+
+async def call(application, path, cookie):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+        "server": ("testserver", 443),
+        "client": ("127.0.0.1", 1234),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]["status"]
+
+
+def test_flask_routes_run_concurrently():
+    cookie = session_cookie(
+        {"authenticated": True, "provider_type": "aws", "provider_config": {}}
+    )
+    # Each request waits for the other; serialized requests would time out
+    barrier = threading.Barrier(2, timeout=5)
+
+    def list_transfers(owner):
+        barrier.wait()
+        return []
+
+    async def both():
+        return await asyncio.gather(
+            call(asgi.application, "/transfers", cookie),
+            call(asgi.application, "/transfers", cookie),
+        )
+
+    with mock.patch.object(app_module.transfer_manager, "list", list_transfers):
+        assert asyncio.run(both()) == [200, 200]
+
+
+def wasabi_provider():
+    provider = object.__new__(WasabiProvider)
+    provider.provider_type = "wasabi"
+    provider.client = boto3.client(
+        "s3",
+        region_name="eu-central-1",
+        endpoint_url="https://s3.eu-central-1.wasabisys.com",
+        aws_access_key_id="key",
+        aws_secret_access_key="secret",
+    )
+    return provider
+
+
+@contextmanager
+def fake_aiobotocore():
+    """Records the arguments and the closing of every aiobotocore client"""
+    created, closed = [], []
+
+    @asynccontextmanager
+    async def create_client(service, **kwargs):
+        client = mock.Mock()
+        created.append(kwargs)
+        yield client
+        closed.append(kwargs["aws_access_key_id"])
+
+    session = mock.Mock(create_client=create_client)
+    with mock.patch.object(
+        async_providers, "get_session", return_value=session
+    ), mock.patch.object(async_providers, "AioConfig", mock.Mock()):
+        yield created, closed
+
+
+def test_aiobotocore_client_uses_registry_credentials():
+    provider = wasabi_provider()
+    pool = async_providers.AioS3ClientPool()
+    config = {"access_key": "key", "secret_key": "secret"}
+
+    async def lease_twice():
+        async with pool.lease(provider, config) as first:
+            async with pool.lease(provider, config) as second:
+                return first, second
+
+    with fake_aiobotocore() as (created, closed):
+        first, second = asyncio.run(lease_twice())
+
+    assert first is second
+    assert len(created) == 1
+    assert created[0]["aws_access_key_id"] == "key"
+    assert created[0]["aws_secret_access_key"] == "secret"
+    assert created[0]["endpoint_url"] == "https://s3.eu-central-1.wasabisys.com"
+    assert closed == []
+
+
+def aio_config(tenant):
+    return {"access_key": tenant, "secret_key": "secret"}
+
+
+def test_aiobotocore_pool_keeps_a_bounded_number_of_idle_clients():
+    provider = wasabi_provider()
+    pool = async_providers.AioS3ClientPool(max_size=1)
+
+    async def tenants(closed):
+        async with pool.lease(provider, aio_config("alice")):
+            async with pool.lease(provider, aio_config("bob")):
+                pass
+            # Bob's idle client made room; Alice's is in use
+            assert closed == ["bob"]
+        assert len(pool) == 1
+        await pool.close()
+
+    with fake_aiobotocore() as (created, closed):
+        asyncio.run(tenants(closed))
+    assert closed == ["bob", "alice"]
+
+
+def test_aiobotocore_pool_closes_expired_clients_after_their_leases():
+    provider = wasabi_provider()
+    pool = async_providers.AioS3ClientPool()
+
+    async def tenants(closed):
+        async with pool.lease(provider, aio_config("alice")):
+            # Every client is now past the idle timeout
+            pool.idle_timeout = -1
+            async with pool.lease(provider, aio_config("bob")):
+                assert len(pool) == 0
+                assert closed == []
+            assert closed == ["bob"]
+        assert closed == ["bob", "alice"]
+
+    with fake_aiobotocore() as (created, closed):
+        asyncio.run(tenants(closed))
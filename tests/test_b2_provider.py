@@ -0,0 +1,145 @@
+from unittest import mock
+
+import storage_providers
+from storage_providers import BackblazeB2Provider
+
+NAMES = [
+    "a.txt",
+    "docs/one.txt",
+    "docs/two.txt",
+    "m.txt",
+    "photos/1.jpg",
+    "photos/2.jpg",
+    "z.txt",
+]
+
+
+class FakeB2Api:
+    """b2_list_file_names over NAMES, honouring prefix, delimiter and
+    startFileName like the B2 service"""
+
+    def __init__(self, names):
+        self.names = sorted(names)
+        self.requests = []
+
+    def post(self, url, headers, json, timeout):
+        self.requests.append(json)
+        prefix = json["prefix"]
+        start = json["startFileName"] or ""
+        files = []
+        next_file_name = None
+        for name in self.names:
+            if name < start or not name.startswith(prefix):
+                continue
+            rest = name[len(prefix) :]
+            entry_name = name
+            action = "upload"
+            if json["delimiter"] and json["delimiter"] in rest:
+                entry_name = prefix + rest.split("/")[0] + "/"
+                action = "folder"
+                if files and files[-1]["fileName"] == entry_name:
+                    continue
+            if len(files) == json["maxFileCount"]:
+                next_file_name = name
+                break
+            files.append(
+                {
+                    "fileName": entry_name,
+                    "action": action,
+                    "contentLength": 1,
+                    "fileId": f"id-{entry_name}",
+                    "uploadTimestamp": 0,
+                }
+            )
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"files": files, "nextFileName": next_file_name}
+        return response
+
+
+def b2_provider():
+    provider = object.__new__(BackblazeB2Provider)
+    provider.info = mock.Mock()
+    provider.info.get_api_url.return_value = "https://api.example"
+    provider.bucket = mock.Mock(id_="bucket-id")
+    provider.b2_api = mock.Mock()
+    return provider
+
+
+def list_names(provider, api, prefix="", start_after=None):
+    with mock.patch.object(storage_providers.requests, "post", api.post):
+        return [entry["name"] for entry in provider.list_directory(prefix, start_after)]
+
+
+def test_list_directory_reports_folders_once():
+    api = FakeB2Api(NAMES)
+    assert list_names(b2_provider(), api) == [
+        "a.txt",
+        "docs/",
+        "m.txt",
+        "photos/",
+        "z.txt",
+    ]
+    assert all(request["delimiter"] == "/" for request in api.requests)
+
+
+def test_list_directory_resumes_server_side_from_cursor():
+    api = FakeB2Api(NAMES)
+    with mock.patch.object(storage_providers, "B2_LIST_PAGE_SIZE", 2):
+        names = list_names(b2_provider(), api, start_after="m.txt")
+    assert names == ["photos/", "z.txt"]
+    assert api.requests[0]["startFileName"] == "m.txt"
+
+
+def test_list_directory_skips_cursor_folder_contents():
+    api = FakeB2Api(NAMES)
+    names = list_names(b2_provider(), api, start_after="docs/")
+    assert names == ["m.txt", "photos/", "z.txt"]
+    assert api.requests[0]["startFileName"] == "docs0"
+
+
+def test_list_directory_of_subfolder():
+    api = FakeB2Api(NAMES)
+    assert list_names(b2_provider(), api, prefix="photos/") == [
+        "photos/1.jpg",
+        "photos/2.jpg",
+    ]
+
+
+def authorizing_provider():
+    provider = b2_provider()
+    provider.bucket.get_download_authorization.side_effect = (
+        lambda prefix, valid_duration_in_seconds: f"token:{prefix}"
+    )
+    provider.bucket.get_download_url.side_effect = lambda name: f"https://f/{name}"
+    return provider
+
+
+def test_file_urls_share_a_token_scoped_to_their_folder():
+    provider = authorizing_provider()
+    urls = provider.get_file_urls(["photos/1.jpg", "photos/2.jpg"])
+    provider.bucket.get_download_authorization.assert_called_once_with(
+        "photos/", valid_duration_in_seconds=3600
+    )
+    assert (
+        urls["photos/1.jpg"] == "https://f/photos/1.jpg?Authorization=token%3Aphotos%2F"
+    )
+
+
+def test_file_urls_without_common_folder_are_authorized_per_file():
+    provider = authorizing_provider()
+    urls = provider.get_file_urls(["a.png", "b.png"])
+    prefixes = [
+        call.args[0]
+        for call in provider.bucket.get_download_authorization.call_args_list
+    ]
+    assert prefixes == ["a.png", "b.png"]
+    assert "" not in prefixes
+    assert urls["b.png"].endswith("Authorization=token%3Ab.png")
+
+
+def test_file_urls_in_sibling_folders_use_their_parent():
+    provider = authorizing_provider()
+    provider.get_file_urls(["photos/2023/a.jpg", "photos/2024/b.jpg"])
+    provider.bucket.get_download_authorization.assert_called_once_with(
+        "photos/", valid_duration_in_seconds=3600
+    )
@@ -0,0 +1,136 @@
+from unittest import mock
+
+from cache import (
+    ListingCache,
+    SQLiteCache,
+    TTLCache,
+    UrlCache,
+    create_cache_backend,
+    parent_directories,
+)
+
+PAGE = ("recursive", None, 100)
+
+
+def cached(listing, prefix, owner="owner"):
+    return listing.get(listing.page_key(owner, prefix, PAGE))
+
+
+def store(listing, prefix):
+    listing.set(listing.page_key("owner", prefix, PAGE), {"prefix": prefix})
+
+
+def test_parent_directories():
+    assert parent_directories("a.txt") == [""]
+    assert parent_directories("a/b/c.txt") == ["", "a/", "a/b/"]
+
+
+def test_write_invalidates_the_folder_and_its_parents():
+    listing = ListingCache(TTLCache(1024 * 1024))
+    for prefix in ("", "a/", "a/b/", "other/"):
+        store(listing, prefix)
+
+    listing.invalidate("owner", "a/b/c.txt")
+
+    assert cached(listing, "") is None
+    assert cached(listing, "a/") is None
+    assert cached(listing, "a/b/") is None
+    assert cached(listing, "other/") == {"prefix": "other/"}
+
+
+def test_subtree_write_invalidates_nested_folders():
+    listing = ListingCache(TTLCache(1024 * 1024))
+    for prefix in ("a/b/", "a/b/c/", "a/bc/"):
+        store(listing, prefix)
+
+    listing.invalidate("owner", "a/b", subtree=True)
+
+    assert cached(listing, "a/b/") is None
+    assert cached(listing, "a/b/c/") is None
+    assert cached(listing, "a/bc/") == {"prefix": "a/bc/"}
+
+
+def test_partial_prefix_belongs_to_its_folder():
+    listing = ListingCache(TTLCache(1024 * 1024))
+    store(listing, "a/re")
+    listing.invalidate("owner", "a/report.txt")
+    assert cached(listing, "a/re") is None
+
+
+def test_configurations_are_cached_separately():
+    listing = ListingCache(TTLCache(1024 * 1024))
+    store(listing, "")
+    listing.invalidate("other", "a.txt")
+    assert cached(listing, "") == {"prefix": ""}
+    assert cached(listing, "", owner="other") is None
+
+
+def test_listing_racing_a_write_is_not_cached():
+    listing = ListingCache(TTLCache(1024 * 1024))
+    page_key = listing.page_key("owner", "a/", PAGE)
+    assert listing.get(page_key) is None
+    # A write lands while the provider is being listed
+    listing.invalidate("owner", "a/b.txt")
+    listing.set(page_key, {"prefix": "a/"})
+    assert cached(listing, "a/") is None
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    backend = TTLCache(max_bytes=30)
+    backend.set("a", "x", size=10)
+    backend.set("b", "x", size=10)
+    backend.set("c", "x", size=10)
+    backend.get("a")
+    backend.set("d", "x", size=10)
+    assert backend.get("b") is None
+    assert backend.get_many(["a", "c", "d"]) == {"a": "x", "c": "x", "d": "x"}
+
+
+def test_sqlite_cache_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    # Two workers open the same database
+    first, second = SQLiteCache(path), SQLiteCache(path)
+    first.set("key", {"value": 1}, ttl=60)
+    assert second.get("key") == {"value": 1}
+    second.delete("key")
+    assert first.get("key") is None
+
+    store(ListingCache(first), "a/")
+    ListingCache(second).invalidate("owner", "a/b.txt")
+    assert cached(ListingCache(first), "a/") is None
+
+
+def test_sqlite_cache_expires_entries(tmp_path):
+    backend = SQLiteCache(str(tmp_path / "cache.db"))
+    backend.set("key", "value", ttl=-1)
+    assert backend.get("key") is None
+
+
+def test_unavailable_backend_falls_back_to_memory(tmp_path):
+    backend = create_cache_backend("sqlite", str(tmp_path / "missing" / "cache.db"))
+    assert isinstance(backend, TTLCache)
+    assert isinstance(create_cache_backend("unknown"), TTLCache)
+
+
+def test_signed_urls_are_reused_while_enough_lifetime_remains():
+    urls = UrlCache(TTLCache(1024 * 1024), min_remaining=0.5)
+    urls.set_many("owner", {"a.png": "https://signed/a"}, expires_in=3600)
+
+    assert urls.get_many("owner", ["a.png", "b.png"], 3600) == {
+        "a.png": "https://signed/a"
+    }
+    # Keyed by lifetime and download name
+    assert urls.get_many("owner", ["a.png"], 60) == {}
+    assert urls.get_many("owner", ["a.png"], 3600, download_name="a.png") == {}
+    assert urls.get_many("other", ["a.png"], 3600) == {}
+
+
+def test_signed_urls_expire_before_the_url_does():
+    backend = mock.Mock(wraps=TTLCache(1024 * 1024))
+    urls = UrlCache(backend, min_remaining=0.25)
+    urls.set_many("owner", {"a.png": "https://signed/a"}, expires_in=400)
+    assert backend.set.call_args.kwargs["ttl"] == 300
+
+    urls = UrlCache(backend, min_remaining=1)
+    urls.set_many("owner", {"b.png": "https://signed/b"}, expires_in=400)
+    assert urls.get_many("owner", ["b.png"], 400) == {}
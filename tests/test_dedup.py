@@ -0,0 +1,71 @@
+import hashlib
+import io
+from unittest import mock
+
+import dedup
+from dedup import ContentHasher, DedupIndex, HashingUploadStream
+
+
+def test_content_hash_is_sha256_of_block_digests():
+    data = b"x" * 10
+    with mock.patch.object(dedup, "CONTENT_HASH_BLOCK_SIZE", 4):
+        hasher = ContentHasher()
+        hasher.update(data[:3])
+        hasher.update(data[3:])
+        digest = hasher.hexdigest()
+    blocks = [data[0:4], data[4:8], data[8:10]]
+    expected = hashlib.sha256(
+        b"".join(hashlib.sha256(block).digest() for block in blocks)
+    ).hexdigest()
+    assert digest == expected
+    assert hasher.size == 10
+
+
+def test_hashing_stream_hashes_what_the_provider_reads():
+    stream = HashingUploadStream(io.BytesIO(b"content"))
+    assert stream.read() == b"content"
+    expected = ContentHasher()
+    expected.update(b"content")
+    assert stream.hasher.hexdigest() == expected.hexdigest()
+
+
+def make_provider(objects):
+    """Provider whose objects are ``{name: (size, etag)}``"""
+    provider = mock.Mock()
+
+    def get_file_info(name):
+        if name not in objects:
+            raise FileNotFoundError(name)
+        size, etag = objects[name]
+        return {"name": name, "size": size, "etag": etag}
+
+    def copy_file(source, destination, size=None):
+        objects[destination] = objects[source]
+
+    provider.get_file_info.side_effect = get_file_info
+    provider.copy_file.side_effect = copy_file
+    return provider
+
+
+def test_deduplicate_copies_current_object(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.db"))
+    objects = {"a.bin": (10, '"e1"')}
+    provider = make_provider(objects)
+    index.record_upload(provider, "owner", "a.bin", "h" * 64, 10)
+
+    assert index.deduplicate(provider, "owner", "h" * 64, 10, "b.bin") == "a.bin"
+    assert objects["b.bin"] == (10, '"e1"')
+    # Other configurations never see the entry
+    assert index.deduplicate(provider, "other", "h" * 64, 10, "c.bin") is None
+
+
+def test_deduplicate_skips_and_forgets_overwritten_objects(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.db"))
+    objects = {"a.bin": (10, '"e1"')}
+    provider = make_provider(objects)
+    index.record_upload(provider, "owner", "a.bin", "h" * 64, 10)
+    objects["a.bin"] = (10, '"e2"')
+
+    assert index.deduplicate(provider, "owner", "h" * 64, 10, "b.bin") is None
+    provider.copy_file.assert_not_called()
+    assert index.lookup("owner", "h" * 64, 10) == []
@@ -0,0 +1,38 @@
+from unittest import mock
+
+from google.cloud import storage
+
+import storage_providers
+from storage_providers import GoogleCloudStorageProvider
+
+
+def gcs_provider():
+    provider = object.__new__(GoogleCloudStorageProvider)
+    provider.client = storage.Client.create_anonymous_client()
+    provider.bucket = mock.Mock()
+    return provider
+
+
+def test_delete_batch_reports_failures_per_key():
+    responses = [
+        mock.Mock(status_code=204, text=""),
+        mock.Mock(status_code=403, text="forbidden"),
+        mock.Mock(status_code=404, text="not found"),
+    ]
+    provider = gcs_provider()
+    with mock.patch.object(
+        storage_providers.Batch, "finish", autospec=True, return_value=responses
+    ):
+        errors = provider._delete_batch(["a", "b", "c"])
+    assert errors == {"b": "HTTP 403: forbidden"}
+    assert provider.bucket.delete_blob.call_count == 3
+
+
+def test_listing_hides_staged_upload_parts():
+    provider = gcs_provider()
+    blob = mock.Mock(size=1, etag="e", updated=None)
+    blob.name = "a.txt"
+    staged = mock.Mock(size=1, etag="e", updated=None)
+    staged.name = ".s3filesharegui-uploads/0123/part-00001"
+    provider.bucket.list_blobs.return_value = [staged, blob]
+    assert [entry["name"] for entry in provider.list_files()] == ["a.txt"]
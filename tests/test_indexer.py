@@ -0,0 +1,149 @@
+import json
+from unittest import mock
+
+import pytest
+
+import indexer
+from index_events import ChangeEvent, EventSource, FileDropEventSource
+from indexer import BucketIndexer, MetadataIndex
+from memory_provider import MemoryProvider
+
+
+class FakeSource(EventSource):
+    def __init__(self, batches):
+        self.batches = batches
+        self.acked = []
+
+    def poll(self):
+        batches, self.batches = self.batches, []
+        return batches
+
+    def ack(self, receipts):
+        self.acked.extend(receipts)
+
+
+class RecordingIndex:
+    def __init__(self, fail_on=None):
+        self.applied = []
+        self.fail_on = fail_on
+
+    def apply_change(self, provider_key, event, subtree=False):
+        if event.name == self.fail_on:
+            raise RuntimeError("database is locked")
+        self.applied.append((provider_key, event.name))
+
+
+def subscribed_indexer(index, source, subscribers):
+    bucket_indexer = BucketIndexer(index)
+    with mock.patch.object(indexer, "create_event_source", return_value=source):
+        with mock.patch.object(indexer.threading, "Thread"):
+            for provider_key, config in subscribers:
+                bucket_indexer._start_events(provider_key, "aws", config)
+    return bucket_indexer
+
+
+def test_events_reach_every_configuration_of_their_bucket():
+    source = FakeSource(
+        [
+            ([ChangeEvent("a.txt", bucket="photos")], "m1"),
+            ([ChangeEvent("b.txt", bucket="logs")], "m2"),
+        ]
+    )
+    index = RecordingIndex()
+    bucket_indexer = subscribed_indexer(
+        index,
+        source,
+        [
+            ("key-1", {"bucket": "photos"}),
+            ("key-2", {"bucket": "photos", "region": "eu-west-1"}),
+            ("key-3", {"bucket": "backups"}),
+        ],
+    )
+    bucket_indexer._consume_batch(source)
+    assert sorted(index.applied) == [("key-1", "a.txt"), ("key-2", "a.txt")]
+    assert source.acked == ["m1", "m2"]
+
+
+def test_one_consumer_serves_all_configurations():
+    source = FakeSource([])
+    with mock.patch.object(
+        indexer, "create_event_source", return_value=source
+    ) as create, mock.patch.object(indexer.threading, "Thread") as thread:
+        bucket_indexer = BucketIndexer(RecordingIndex())
+        bucket_indexer._start_events("key-1", "aws", {"bucket": "a"})
+        bucket_indexer._start_events("key-2", "aws", {"bucket": "b"})
+    assert create.call_count == 1
+    assert thread.call_count == 1
+
+
+def test_messages_that_fail_to_apply_are_not_acknowledged():
+    source = FakeSource(
+        [
+            ([ChangeEvent("ok.txt", bucket="photos")], "m1"),
+            ([ChangeEvent("bad.txt", bucket="photos")], "m2"),
+        ]
+    )
+    index = RecordingIndex(fail_on="bad.txt")
+    bucket_indexer = subscribed_indexer(index, source, [("key", {"bucket": "photos"})])
+    bucket_indexer._consume_batch(source)
+    assert source.acked == ["m1"]
+
+
+def walked_index(tmp_path, provider):
+    index = MetadataIndex(str(tmp_path / "index.db"))
+    BucketIndexer(index)._walk("key", provider)
+    return index
+
+
+def names(results):
+    return [entry["name"] for entry in results]
+
+
+def test_search_filters(tmp_path):
+    provider = MemoryProvider(
+        {
+            "photos/beach.JPG": b"x" * 10,
+            "photos/beach-notes.txt": b"x",
+            "docs/report.pdf": b"x" * 100,
+            "docs/old/report-2019.pdf": b"x" * 5,
+        }
+    )
+    index = walked_index(tmp_path, provider)
+
+    assert names(index.search("key", "beach")) == [
+        "photos/beach-notes.txt",
+        "photos/beach.JPG",
+    ]
+    # Shorter than a trigram falls back to a LIKE scan
+    assert names(index.search("key", "ol")) == ["docs/old/report-2019.pdf"]
+    assert names(index.search("key", extensions=[".jpg"])) == ["photos/beach.JPG"]
+    assert names(index.search("key", "report", min_size=50)) == ["docs/report.pdf"]
+    assert names(index.search("key", prefix="docs/old/")) == [
+        "docs/old/report-2019.pdf"
+    ]
+    assert names(index.search("key", "100%_")) == []
+    assert index.search("other", "beach") == []
+
+
+def test_new_walk_removes_deleted_objects(tmp_path):
+    provider = MemoryProvider({"a.txt": b"1", "b.txt": b"2"})
+    index = walked_index(tmp_path, provider)
+    del provider.objects["a.txt"]
+    BucketIndexer(index)._walk("key", provider)
+    assert names(index.search("key")) == ["b.txt"]
+    assert index.status("key")["object_count"] == 1
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [[{"deleted": True}], ["a.txt"], [{"name": 1}], {"Records": [{}]}, 3],
+)
+def test_malformed_event_files_are_skipped(tmp_path, payload):
+    source = FileDropEventSource(str(tmp_path))
+    (tmp_path / "0-bad.json").write_text(json.dumps(payload))
+    (tmp_path / "1-good.json").write_text(json.dumps([{"name": "a.txt"}]))
+
+    batches = source.poll()
+    assert [events for events, _ in batches] == [[], [ChangeEvent(name="a.txt")]]
+    source.ack([receipt for _, receipt in batches])
+    assert list(tmp_path.iterdir()) == []
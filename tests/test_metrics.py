@@ -0,0 +1,133 @@
+import io
+import os
+from unittest import mock
+
+import pytest
+from prometheus_client import REGISTRY
+from werkzeug.routing import Map, Rule
+from werkzeug.test import Client, EnvironBuilder
+from werkzeug.wrappers import Response
+
+import app as app_module
+import metrics
+from streaming import DownloadStream
+
+
+def requests_total(route, method="GET", status="200"):
+    value = REGISTRY.get_sample_value(
+        "http_requests_total", {"route": route, "method": method, "status": status}
+    )
+    return value or 0
+
+
+def test_streamed_response_is_recorded_when_closed():
+    sent = []
+
+    def streaming_app(environ, start_response):
+        def body():
+            yield b"chunk"
+            sent.append(True)
+
+        return Response(body(), direct_passthrough=True)(environ, start_response)
+
+    middleware = metrics.RequestMetricsMiddleware(
+        streaming_app, Map([Rule("/stream/<name>")])
+    )
+    before = requests_total("/stream/<name>")
+    response = Client(middleware).get("/stream/a", buffered=False)
+    assert requests_total("/stream/<name>") == before
+    assert response.get_data() == b"chunk"
+    response.close()
+    assert sent
+    assert requests_total("/stream/<name>") == before + 1
+
+
+def test_unknown_paths_share_one_route_label():
+    middleware = metrics.RequestMetricsMiddleware(
+        lambda environ, start_response: Response("", 404)(environ, start_response),
+        Map([Rule("/known")]),
+    )
+    before = requests_total("unmatched", status="404")
+    Client(middleware).get("/secret-file-name").close()
+    assert requests_total("unmatched", status="404") == before + 1
+
+
+def test_download_is_counted():
+    app_module.app.debug = True
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["authenticated"] = True
+        session["provider_type"] = "aws"
+        session["provider_config"] = {"bucket": "files"}
+    provider = mock.Mock(provider_type="aws")
+    provider.download_file.return_value = DownloadStream([b"data"], 4)
+
+    before = requests_total("/download/<path:filename>")
+    with mock.patch.object(
+        app_module, "get_current_provider", return_value=provider
+    ), mock.patch.dict(os.environ, {"DOWNLOAD_MODE_AWS": "proxy"}):
+        response = client.get("/download/a.txt")
+        assert response.get_data() == b"data"
+        response.close()
+    assert requests_total("/download/<path:filename>") == before + 1
+
+
+def test_metrics_require_a_token():
+    client = app_module.app.test_client()
+    with mock.patch.object(metrics, "METRICS_TOKEN", ""):
+        assert client.get("/metrics").status_code == 404
+    with mock.patch.object(metrics, "METRICS_TOKEN", "token"):
+        assert client.get("/metrics").status_code == 401
+        response = client.get("/metrics", headers={"Authorization": "Bearer token"})
+        assert response.status_code == 200
+        assert b"http_requests_total" in response.data
+
+
+class FileWrapper:
+    """Stand-in for a server's sendfile-capable ``wsgi.file_wrapper``"""
+
+    def __init__(self, file, block_size=8192):
+        self.file = file
+
+    def __iter__(self):
+        return iter([self.file.read()])
+
+    def close(self):
+        self.file.close()
+
+
+def test_file_wrapper_bodies_are_returned_unwrapped():
+    def file_app(environ, start_response):
+        start_response("200 OK", [])
+        return environ["wsgi.file_wrapper"](io.BytesIO(b"data"))
+
+    middleware = metrics.RequestMetricsMiddleware(file_app, Map([Rule("/file")]))
+    environ = EnvironBuilder("/file").get_environ()
+    environ["wsgi.file_wrapper"] = FileWrapper
+    before = requests_total("/file")
+
+    body = middleware(environ, lambda status, headers, exc_info=None: None)
+    assert isinstance(body, FileWrapper)
+    assert requests_total("/file") == before
+    body.close()
+    assert body.file.closed
+    assert requests_total("/file") == before + 1
+
+
+def storage_errors(exception):
+    value = REGISTRY.get_sample_value(
+        "storage_operation_errors_total",
+        {"provider": "test", "operation": "download_file", "exception": exception},
+    )
+    return value or 0
+
+
+def test_storage_errors_are_labelled_with_their_cause():
+    before = storage_errors("FileNotFoundError")
+    with pytest.raises(ValueError):
+        with metrics.timed_operation("test", "download_file"):
+            try:
+                raise FileNotFoundError("a.txt")
+            except FileNotFoundError as e:
+                raise ValueError(f"Error downloading file: {str(e)}")
+    assert storage_errors("FileNotFoundError") == before + 1
@@ -0,0 +1,161 @@
+import io
+import threading
+import time
+
+import pytest
+
+from multipart import (
+    UPLOAD_STAGING_PREFIX,
+    GCSComposeTarget,
+    MultipartTarget,
+    UploadTuning,
+    multipart_upload,
+)
+
+PART = 4
+
+
+class RecordingTarget(MultipartTarget):
+    def __init__(self, delay=0.0, fail_part=None):
+        self.delay = delay
+        self.fail_part = fail_part
+        self.parts = {}
+        self.single = None
+        self.completed = None
+        self.aborted = False
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def put_single(self, data):
+        self.single = data
+
+    def begin(self):
+        pass
+
+    def upload_part(self, part_number, data):
+        time.sleep(self.delay)
+        if part_number == self.fail_part:
+            raise IOError("part failed")
+        with self._lock:
+            self.parts[part_number] = data
+            self.done += 1
+        return part_number
+
+    def complete(self, parts):
+        self.completed = b"".join(self.parts[number] for number in parts)
+
+    def abort(self):
+        self.aborted = True
+
+
+class PartReader(io.RawIOBase):
+    """Returns one part per read and records the parts held in memory"""
+
+    def __init__(self, data, target):
+        self.data = data
+        self.target = target
+        self.reads = 0
+        self.max_held = 0
+
+    def read(self, size=-1):
+        chunk, self.data = self.data[:size], self.data[size:]
+        if chunk:
+            self.reads += 1
+            # Parts read and not yet uploaded, including this one
+            self.max_held = max(self.max_held, self.reads - self.target.done)
+        return chunk
+
+
+def tuning(concurrency=2):
+    return UploadTuning(part_size=PART, concurrency=concurrency, min_part_size=1)
+
+
+def test_small_upload_is_sent_in_one_request():
+    target = RecordingTarget()
+    multipart_upload(io.BytesIO(b"abc"), target, tuning())
+    assert target.single == b"abc"
+    assert target.completed is None
+
+
+def test_parts_are_assembled_in_order():
+    data = bytes(range(50))
+    target = RecordingTarget(delay=0.001)
+    multipart_upload(io.BytesIO(data), target, tuning())
+    assert target.completed == data
+
+
+def test_parts_in_memory_are_bounded_by_concurrency_plus_one():
+    target = RecordingTarget(delay=0.01)
+    reader = PartReader(b"x" * PART * 20, target)
+    multipart_upload(reader, target, tuning(concurrency=2))
+    assert target.completed == b"x" * PART * 20
+    assert reader.max_held <= 3
+
+
+def test_failed_part_aborts_upload():
+    target = RecordingTarget(fail_part=2)
+    with pytest.raises(IOError):
+        multipart_upload(io.BytesIO(b"y" * PART * 6), target, tuning())
+    assert target.aborted
+    assert target.completed is None
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+
+    def upload_from_string(self, data, content_type="text/plain"):
+        self.bucket.objects[self.name] = data
+        self.bucket.content_types[self.name] = content_type
+
+    def compose(self, sources):
+        self.bucket.objects[self.name] = b"".join(
+            self.bucket.objects[source.name] for source in sources
+        )
+        self.bucket.content_types[self.name] = self.content_type
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.content_types = {}
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+def test_gcs_parts_are_staged_under_reserved_prefix_and_removed():
+    bucket = FakeBucket()
+    target = GCSComposeTarget(bucket, "videos/film.mp4")
+    staged = []
+    upload_part = target.upload_part
+
+    def record(part_number, data):
+        name = upload_part(part_number, data)
+        staged.append(name)
+        return name
+
+    target.upload_part = record
+    data = b"z" * PART * 40
+    multipart_upload(io.BytesIO(data), target, tuning())
+    assert staged and all(name.startswith(UPLOAD_STAGING_PREFIX) for name in staged)
+    assert bucket.objects == {"videos/film.mp4": data}
+
+
+@pytest.mark.parametrize(
+    "name,size,content_type",
+    [
+        ("videos/film.mp4", PART * 40, "video/mp4"),
+        ("notes.txt", 10, "text/plain"),
+        ("data.unknownext", PART * 3, "application/octet-stream"),
+    ],
+)
+def test_gcs_uploads_keep_their_content_type(name, size, content_type):
+    bucket = FakeBucket()
+    multipart_upload(io.BytesIO(b"z" * size), GCSComposeTarget(bucket, name), tuning())
+    assert bucket.content_types[name] == content_type
@@ -0,0 +1,98 @@
+import threading
+import time
+from unittest import mock
+
+import provider_registry
+from provider_registry import ProviderRegistry
+
+
+class FakeProvider:
+    def __init__(self, provider_type="aws", **config):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_acquire_reuses_pooled_provider():
+    registry = ProviderRegistry()
+    with mock.patch.object(provider_registry, "get_storage_provider", FakeProvider):
+        first = registry.acquire("aws", {"bucket": "b"})
+        registry.release(first)
+        second = registry.acquire("aws", {"bucket": "b"})
+    assert first is second
+    assert len(registry) == 1
+
+
+def test_concurrent_acquire_builds_one_provider():
+    registry = ProviderRegistry()
+    built = []
+
+    def slow_provider(provider_type, **config):
+        time.sleep(0.05)
+        provider = FakeProvider()
+        built.append(provider)
+        return provider
+
+    acquired = []
+    with mock.patch.object(provider_registry, "get_storage_provider", slow_provider):
+        threads = [
+            threading.Thread(
+                target=lambda: acquired.append(registry.acquire("aws", {"b": 1}))
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert len(built) == 1
+    assert all(provider is built[0] for provider in acquired)
+
+
+def test_failed_creation_does_not_block_retries():
+    registry = ProviderRegistry()
+    with mock.patch.object(
+        provider_registry, "get_storage_provider", side_effect=ValueError("bad")
+    ):
+        try:
+            registry.acquire("aws", {})
+        except ValueError:
+            pass
+    with mock.patch.object(provider_registry, "get_storage_provider", FakeProvider):
+        assert registry.acquire("aws", {}) is not None
+    assert not registry._creation_locks
+
+
+def test_over_capacity_idle_provider_is_closed():
+    registry = ProviderRegistry(max_size=1)
+    with mock.patch.object(provider_registry, "get_storage_provider", FakeProvider):
+        first = registry.acquire("aws", {"bucket": "a"})
+        registry.release(first)
+        second = registry.acquire("aws", {"bucket": "b"})
+    assert first.closed
+    assert not second.closed
+    assert len(registry) == 1
+
+
+def test_busy_provider_is_closed_on_release_after_eviction():
+    registry = ProviderRegistry(idle_timeout=0)
+    with mock.patch.object(provider_registry, "get_storage_provider", FakeProvider):
+        provider = registry.acquire("aws", {"bucket": "a"})
+        time.sleep(0.01)
+        registry.evict_idle()
+        assert not provider.closed
+        registry.release(provider)
+    assert provider.closed
+
+
+def test_retired_provider_is_closed_outside_the_lock():
+    registry = ProviderRegistry(idle_timeout=0)
+    locked_on_close = []
+    with mock.patch.object(provider_registry, "get_storage_provider", FakeProvider):
+        provider = registry.acquire("aws", {"bucket": "a"})
+        time.sleep(0.01)
+        registry.evict_idle()
+        provider.close = lambda: locked_on_close.append(registry._lock.locked())
+        registry.release(provider)
+    assert locked_on_close == [False]
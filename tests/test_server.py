@@ -0,0 +1,51 @@
+import os
+import sys
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import server
+from transfer import transfer_manager
+
+
+def test_server_options_are_sized_by_worker_class():
+    sync = server.server_options("sync", cpus=4)
+    assert (sync["workers"], sync["threads"], sync["timeout"]) == (9, 1, 3600)
+    threaded = server.server_options("gthread", cpus=4)
+    assert threaded["workers"] == 4
+    assert threaded["threads"] * threaded["workers"] >= server.SERVER_CONCURRENCY
+    with pytest.raises(ValueError):
+        server.server_options("eventlet")
+
+
+def test_only_a_local_proxy_is_trusted_by_default():
+    with mock.patch.dict(os.environ):
+        os.environ.pop("FORWARDED_ALLOW_IPS", None)
+        assert server.server_options("gthread")["forwarded_allow_ips"] == "127.0.0.1"
+        os.environ["FORWARDED_ALLOW_IPS"] = "10.0.0.2"
+        assert server.server_options("gthread")["forwarded_allow_ips"] == "10.0.0.2"
+
+
+def test_workers_running_transfers_are_not_recycled():
+    worker = SimpleNamespace(max_requests=2000)
+    with mock.patch.object(transfer_manager, "running", return_value=True):
+        server.defer_recycling(worker, None)
+    assert worker.max_requests == sys.maxsize
+    with mock.patch.object(transfer_manager, "running", return_value=False):
+        server.defer_recycling(worker, None)
+    assert worker.max_requests == 2000
+
+
+@pytest.mark.parametrize(
+    "configured,expected", [(None, "sqlite"), ("memory", "memory")]
+)
+def test_multiple_workers_share_the_cache(configured, expected):
+    environ = {"WEB_CONCURRENCY": "2"}
+    if configured:
+        environ["CACHE_BACKEND"] = configured
+    with mock.patch.dict(os.environ, environ), mock.patch.object(server.Server, "run"):
+        if not configured:
+            os.environ.pop("CACHE_BACKEND", None)
+        server.run_server()
+        assert os.environ["CACHE_BACKEND"] == expected
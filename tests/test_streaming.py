@@ -0,0 +1,100 @@
+import io
+
+import pytest
+
+from streaming import MAX_FORM_FIELD_SIZE, DownloadStream, MultipartUploadStream
+
+BOUNDARY = b"boundary"
+
+
+def form_body(*parts, file_data=b""):
+    body = b""
+    for name, value in parts:
+        body += (
+            b"--boundary\r\n"
+            b'Content-Disposition: form-data; name="'
+            + name
+            + b'"\r\n\r\n'
+            + value
+            + b"\r\n"
+        )
+    body += (
+        b"--boundary\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="a.bin"\r\n'
+        b"Content-Type: application/octet-stream\r\n\r\n" + file_data + b"\r\n"
+        b"--boundary--\r\n"
+    )
+    return body
+
+
+class CountingBody(io.BytesIO):
+    """Request body that records how far it has been read"""
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.consumed = self.tell()
+        return chunk
+
+
+def test_file_part_is_read_incrementally():
+    data = bytes(range(256)) * 4096
+    body = CountingBody(form_body((b"folder", b"docs"), file_data=data))
+    stream = MultipartUploadStream(body, BOUNDARY, read_size=1024)
+
+    assert stream.next_file()
+    assert stream.fields == {"folder": "docs"}
+    assert stream.filename == "a.bin"
+    first = stream.read(4096)
+    assert first == data[:4096]
+    # Only a few reads past the requested bytes, not the whole body
+    assert body.consumed < 16 * 1024
+    assert first + stream.read() == data
+    assert stream.tell() == len(data)
+
+
+def test_body_without_file_part():
+    body = b'--boundary\r\nContent-Disposition: form-data; name="x"\r\n\r\n1\r\n'
+    stream = MultipartUploadStream(io.BytesIO(body + b"--boundary--\r\n"), BOUNDARY)
+    assert not stream.next_file()
+
+
+def test_truncated_body_is_rejected():
+    body = form_body(file_data=b"x" * 1000)[:-200]
+    stream = MultipartUploadStream(io.BytesIO(body), BOUNDARY)
+    assert stream.next_file()
+    with pytest.raises(ValueError):
+        stream.read()
+
+
+def test_large_form_fields_are_rejected():
+    body = form_body((b"folder", b"x" * (MAX_FORM_FIELD_SIZE + 1)))
+    stream = MultipartUploadStream(io.BytesIO(body), BOUNDARY)
+    with pytest.raises(ValueError):
+        stream.next_file()
+
+
+def test_download_chunks_are_relayed_lazily():
+    pulled = []
+
+    def chunks():
+        for chunk in (b"ab", b"", b"cde", b"f"):
+            pulled.append(chunk)
+            yield chunk
+
+    stream = DownloadStream(chunks(), 6)
+    assert pulled == []
+    assert stream.read(3) == b"abc"
+    assert pulled == [b"ab", b"", b"cde"]
+    # Iteration resumes with the buffered remainder and skips empty chunks
+    assert list(stream) == [b"de", b"f"]
+
+
+def test_download_close_runs_callbacks_once():
+    closed, sizes = [], []
+    stream = DownloadStream([b"ab", b"c"], 3, on_close=lambda: closed.append("body"))
+    stream.observe(sizes.append, lambda: closed.append("observer"))
+    assert stream.read() == b"abc"
+    stream.close()
+    stream.close()
+    assert sizes == [2, 1]
+    assert closed == ["body", "observer"]
@@ -0,0 +1,102 @@
+import pytest
+
+from memory_provider import MemoryProvider
+from sync import LocalFile, Sync, SyncRecord, SyncState, plan_sync
+
+SYNCED = SyncRecord(1, 100, 1, '"e1"')
+
+
+def local_file(size=1, mtime_ns=100):
+    return LocalFile("/unused", size, mtime_ns)
+
+
+def remote_object(etag='"e1"', size=1):
+    return {"name": "k", "size": size, "etag": etag}
+
+
+def plan(local, remote, state, direction="both", delete=False):
+    return [
+        (action.kind, action.key)
+        for action in plan_sync(local, remote, state, direction, delete)
+    ]
+
+
+def test_unchanged_files_need_nothing():
+    assert plan({"k": local_file()}, {"k": remote_object()}, {"k": SYNCED}) == []
+
+
+@pytest.mark.parametrize(
+    "local,remote,expected",
+    [
+        (local_file(mtime_ns=200), remote_object(), [("upload", "k")]),
+        (local_file(), remote_object('"e2"'), [("download", "k")]),
+        (local_file(mtime_ns=200), remote_object('"e2"'), [("conflict", "k")]),
+    ],
+)
+def test_two_way_sync_follows_the_changed_side(local, remote, expected):
+    assert plan({"k": local}, {"k": remote}, {"k": SYNCED}) == expected
+
+
+def test_new_files_on_both_sides_are_compared():
+    assert plan({"k": local_file()}, {"k": remote_object()}, {}) == [("compare", "k")]
+
+
+def test_deletions_are_restored_unless_delete_is_set():
+    assert plan({}, {"k": remote_object()}, {"k": SYNCED}) == [("download", "k")]
+    assert plan({}, {"k": remote_object()}, {"k": SYNCED}, delete=True) == [
+        ("delete_remote", "k")
+    ]
+    assert plan({"k": local_file()}, {}, {"k": SYNCED}, delete=True) == [
+        ("delete_local", "k")
+    ]
+    # A deleted side loses to a change on the other one
+    assert plan({}, {"k": remote_object('"e2"')}, {"k": SYNCED}, delete=True) == [
+        ("download", "k")
+    ]
+    assert plan({}, {}, {"k": SYNCED}) == [("forget", "k")]
+
+
+def test_one_way_sync_without_listing_uses_the_manifest():
+    local = {"k": local_file(), "new": local_file()}
+    assert plan(local, None, {"k": SYNCED}, "upload") == [("upload", "new")]
+    assert plan({}, None, {"k": SYNCED}, "upload", delete=True) == [
+        ("delete_remote", "k")
+    ]
+
+
+def test_one_way_sync_overwrites_the_other_side():
+    assert plan(
+        {"k": local_file()}, {"k": remote_object('"e2"')}, {"k": SYNCED}, "upload"
+    ) == [("upload", "k")]
+    assert plan(
+        {"k": local_file(mtime_ns=200)},
+        {"k": remote_object()},
+        {"k": SYNCED},
+        "download",
+    ) == [("download", "k")]
+
+
+def test_sync_round_trip(tmp_path):
+    local_dir = tmp_path / "local"
+    (local_dir / "docs").mkdir(parents=True)
+    (local_dir / "docs" / "a.txt").write_bytes(b"local")
+    provider = MemoryProvider({"photos/b.png": b"remote"})
+    state = SyncState(str(tmp_path / "sync.db"))
+
+    stats = Sync(provider, {}, str(local_dir), state=state).run()
+
+    assert stats == {"upload": 1, "download": 1}
+    assert provider.objects["docs/a.txt"] == b"local"
+    assert (local_dir / "photos" / "b.png").read_bytes() == b"remote"
+    # Everything is recorded, so a second run transfers nothing
+    assert Sync(provider, {}, str(local_dir), state=state).run() == {}
+
+
+def test_keys_cannot_escape_the_sync_directory(tmp_path):
+    provider = MemoryProvider({"../escape.txt": b"x"})
+    sync = Sync(
+        provider, {}, str(tmp_path), direction="download", state=SyncState(":memory:")
+    )
+    stats = sync.run()
+    assert stats == {"failed": 1}
+    assert not (tmp_path.parent / "escape.txt").exists()
@@ -0,0 +1,158 @@
+import threading
+from contextlib import contextmanager
+from unittest import mock
+
+import pytest
+
+import transfer
+from memory_provider import MemoryProvider
+from transfer import Transfer, TransferCheckpoint, TransferManager
+
+
+def test_transfer_copies_and_skips_existing(tmp_path):
+    source = MemoryProvider({"a": b"1", "b": b"22", "c": b"333"})
+    destination = MemoryProvider({"copy/a": b"1"})
+    job = Transfer("job", source, destination, "", "copy/", state_dir=str(tmp_path))
+    job.run()
+
+    assert job.state == "completed"
+    assert destination.objects == {"copy/a": b"1", "copy/b": b"22", "copy/c": b"333"}
+    assert source.downloads == ["b", "c"]
+    progress = job.progress()
+    assert progress["objects_done"] == 2
+    assert progress["objects_skipped"] == 1
+    assert progress["bytes_done"] == 5
+
+
+def test_transfer_resumes_after_checkpoint_cursor(tmp_path):
+    source = MemoryProvider({"a": b"1", "b": b"2", "c": b"3"})
+    checkpoint = TransferCheckpoint(str(tmp_path / "job.json"))
+    checkpoint.cursor = "a"
+    checkpoint.finished = ["c"]
+    checkpoint.save()
+
+    destination = MemoryProvider()
+    Transfer("job", source, destination, state_dir=str(tmp_path)).run()
+
+    assert source.downloads == ["b"]
+    checkpoint.load()
+    assert checkpoint.cursor == "c"
+    assert checkpoint.job["state"] == "completed"
+
+
+def test_transfer_records_failures_for_retry(tmp_path):
+    source = MemoryProvider({"a": b"1"})
+    destination = MemoryProvider()
+    destination.upload_file = mock.Mock(side_effect=OSError("disk full"))
+    with mock.patch.object(transfer, "TRANSFER_RETRIES", 1):
+        job = Transfer("job", source, destination, state_dir=str(tmp_path))
+        job.run()
+
+    assert job.state == "failed"
+    checkpoint = TransferCheckpoint(str(tmp_path / "job.json"))
+    checkpoint.load()
+    assert checkpoint.failed == {"a": "disk full"}
+
+
+@contextmanager
+def leased(providers):
+    yield providers.pop(0)
+
+
+def run_manager(manager, owner, providers, **kwargs):
+    """Start a job and wait for its thread"""
+    with mock.patch.object(
+        transfer.provider_registry,
+        "lease",
+        side_effect=lambda provider_type, config: leased(providers),
+    ):
+        job_id = manager.start(
+            owner, "aws", {"secret_key": "s3cret"}, "aws", {}, **kwargs
+        )
+        manager._threads[job_id].join(5)
+    return job_id
+
+
+def test_manager_scopes_jobs_to_their_owner(tmp_path):
+    manager = TransferManager(str(tmp_path))
+    job_id = run_manager(
+        manager, "alice", [MemoryProvider({"a": b"1"}), MemoryProvider()]
+    )
+
+    assert manager.progress(job_id, "alice")["state"] == "completed"
+    assert [job["id"] for job in manager.list("alice")] == [job_id]
+    assert manager.progress(job_id, "mallory") is None
+    assert manager.list("mallory") == []
+    assert not manager.cancel(job_id, "mallory")
+    assert not manager.resume(job_id, "mallory")
+    # The persisted job holds no credentials
+    assert "s3cret" not in (tmp_path / f"{job_id}.json").read_text()
+
+
+def test_manager_jobs_are_visible_to_other_processes(tmp_path):
+    manager = TransferManager(str(tmp_path))
+    job_id = run_manager(
+        manager, "alice", [MemoryProvider({"a": b"1"}), MemoryProvider()]
+    )
+
+    # Another worker process sharing the state directory
+    other = TransferManager(str(tmp_path))
+    progress = other.progress(job_id, "alice")
+    assert progress["state"] == "completed"
+    assert progress["objects_done"] == 1
+    assert other.progress(job_id, "mallory") is None
+    # Its credentials are only held by the process that started it
+    with pytest.raises(ValueError):
+        other.resume(job_id, "alice")
+
+
+def test_manager_registers_job_before_leasing(tmp_path):
+    manager = TransferManager(str(tmp_path))
+    leasing = threading.Event()
+    release = threading.Event()
+
+    def blocked_lease(provider_type, config):
+        leasing.set()
+        release.wait(5)
+        raise ConnectionError("invalid credentials")
+
+    with mock.patch.object(transfer.provider_registry, "lease", blocked_lease):
+        job_id = manager.start("alice", "aws", {"bucket": "src"}, "aws", {})
+        assert manager.progress(job_id, "alice")["state"] == "starting"
+        leasing.wait(5)
+        release.set()
+        manager._threads[job_id].join(5)
+
+    progress = manager.progress(job_id, "alice")
+    assert progress["state"] == "failed"
+    assert progress["error"] == "invalid credentials"
+
+
+def test_manager_cancel_from_another_process(tmp_path):
+    manager = TransferManager(str(tmp_path))
+    checkpoint = TransferCheckpoint(str(tmp_path / "0123456789abcdef.json"))
+    checkpoint.job = {"owner": "alice", "state": "running"}
+    checkpoint.save()
+
+    assert manager.cancel("0123456789abcdef", "alice")
+    assert checkpoint.cancel_requested()
+
+    # The running job sees the request and stops dispatching objects
+    source = MemoryProvider({"a": b"1"})
+    job = Transfer(
+        "0123456789abcdef", source, MemoryProvider(), state_dir=str(tmp_path)
+    )
+    job.run()
+    assert job.state == "cancelled"
+    assert source.downloads == []
+
+
+def test_active_job_of_an_exited_process_is_interrupted(tmp_path):
+    checkpoint = TransferCheckpoint(str(tmp_path / "job.json"))
+    checkpoint.job = {"owner": "alice", "state": "running"}
+    checkpoint.save()
+    checkpoint.load()
+    assert checkpoint.state() == "running"
+
+    with mock.patch.object(transfer, "_process_alive", return_value=False):
+        assert checkpoint.state() == "interrupted"
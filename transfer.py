@@ -0,0 +1,768 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional
+
+from provider_registry import provider_cache_key, provider_registry
+from storage_providers import StorageProvider, get_storage_provider
+
+logger = logging.getLogger(__name__)
+
+# Objects copied in parallel per transfer. Each one holds at most
+# ``concurrency + 1`` multipart parts of the destination in memory.
+TRANSFER_WORKERS = int(os.environ.get("TRANSFER_WORKERS", 4))
+# Upper bound of the workers a transfer requested through the API may use
+TRANSFER_MAX_WORKERS = int(os.environ.get("TRANSFER_MAX_WORKERS", 16))
+# Attempts per object before it is recorded as failed
+TRANSFER_RETRIES = int(os.environ.get("TRANSFER_RETRIES", 3))
+# Directory of the per-job checkpoint files
+TRANSFER_STATE_DIR = os.environ.get(
+    "TRANSFER_STATE_DIR",
+    os.path.join(tempfile.gettempdir(), "s3filesharegui-transfers"),
+)
+# Seconds between checkpoint writes while a transfer runs
+CHECKPOINT_INTERVAL = 5
+# Job states in which a process is working on the transfer
+ACTIVE_STATES = ("starting", "running")
+
+# ETags of single-part S3-style uploads are the MD5 of the content
+PLAIN_MD5_ETAG = re.compile(r'^"?([0-9a-f]{32})"?$')
+
+
+def transfer_id(
+    source_type: str,
+    source_config: dict,
+    destination_type: str,
+    destination_config: dict,
+    source_prefix: str = "",
+    destination_prefix: str = "",
+) -> str:
+    """Deterministic job id, so submitting the same transfer again resumes it"""
+    payload = json.dumps(
+        [
+            provider_cache_key(source_type, source_config),
+            provider_cache_key(destination_type, destination_config),
+            source_prefix,
+            destination_prefix,
+        ]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def progress_report(job_id: str, job: dict, stats: dict, failed: dict) -> dict:
+    """Progress of a transfer from its job state and counters"""
+    elapsed = 0
+    if job.get("started_at"):
+        elapsed = (job.get("finished_at") or time.time()) - job["started_at"]
+    bytes_done = stats.get("bytes_done", 0)
+    return {
+        "id": job_id,
+        "state": job.get("state", "pending"),
+        "error": job.get("error"),
+        "source": job.get("source"),
+        "destination": job.get("destination"),
+        "objects_done": stats.get("objects_done", 0),
+        "objects_skipped": stats.get("objects_skipped", 0),
+        "objects_failed": stats.get("objects_failed", len(failed)),
+        "bytes_done": bytes_done,
+        "bytes_per_second": int(bytes_done / elapsed) if elapsed else 0,
+        "failed": dict(list(failed.items())[:100]),
+    }
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def plain_md5(etag: Optional[str]) -> Optional[str]:
+    match = PLAIN_MD5_ETAG.match(etag or "")
+    return match.group(1) if match else None
+
+
+class _HashingReader(io.RawIOBase):
+    """Counts and MD5-hashes the bytes read from a download stream"""
+
+    def __init__(self, stream, on_bytes=None):
+        self.stream = stream
+        self.md5 = hashlib.md5()
+        self.bytes_read = 0
+        self.on_bytes = on_bytes
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = self.stream.readinto(buffer)
+        if count:
+            self.md5.update(memoryview(buffer)[:count])
+            self.bytes_read += count
+            if self.on_bytes:
+                self.on_bytes(count)
+        return count
+
+
+class TransferCheckpoint:
+    """Resume state of one transfer, persisted as JSON.
+
+    Keys are dispatched in listing order. ``cursor`` is the last key such
+    that it and every key before it is finished, so a resumed transfer lists
+    from there; keys finished out of order past the cursor are kept in
+    ``finished``. Failed keys are retried on resume. ``job`` holds the
+    job's owner and state and the process running it, so that any process
+    sharing the state directory can report on it. No credentials are
+    stored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.cursor: Optional[str] = None
+        self.finished: List[str] = []
+        self.failed: Dict[str, str] = {}
+        self.stats: Dict[str, int] = {}
+        self.job: Dict[str, object] = {}
+
+    def load(self) -> bool:
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        self.cursor = state.get("cursor")
+        self.finished = state.get("finished", [])
+        self.failed = state.get("failed", {})
+        self.stats = state.get("stats", {})
+        self.job = state.get("job", {})
+        return True
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(
+                {
+                    "cursor": self.cursor,
+                    "finished": self.finished,
+                    "failed": self.failed,
+                    "stats": self.stats,
+                    "job": {
+                        **self.job,
+                        "host": socket.gethostname(),
+                        "pid": os.getpid(),
+                        "updated_at": time.time(),
+                    },
+                },
+                f,
+            )
+        os.replace(temp_path, self.path)
+
+    def state(self) -> str:
+        """The job's state; an active job whose process has exited on this
+        host is interrupted"""
+        state = self.job.get("state", "pending")
+        if (
+            state in ACTIVE_STATES
+            and self.job.get("host") == socket.gethostname()
+            and not _process_alive(self.job.get("pid", 0))
+        ):
+            return "interrupted"
+        return state
+
+    @property
+    def cancel_path(self) -> str:
+        return f"{self.path}.cancel"
+
+    def request_cancel(self) -> None:
+        """Ask the process running the job to stop dispatching objects"""
+        with open(self.cancel_path, "w"):
+            pass
+
+    def cancel_requested(self) -> bool:
+        return os.path.exists(self.cancel_path)
+
+    def clear_cancel(self) -> None:
+        try:
+            os.remove(self.cancel_path)
+        except FileNotFoundError:
+            pass
+
+
+class Transfer:
+    """Copies every object under a prefix from one provider to another.
+
+    Objects are streamed from the source straight into the destination's
+    multipart upload by ``workers`` threads, so memory use is bounded by the
+    part buffers regardless of object size. Each copy is verified by size,
+    and by MD5 wherever a side's ETag is a plain MD5. Objects already at the
+    destination with the same size (and MD5, when known) are skipped.
+    Progress is checkpointed, so an interrupted transfer resumes where it
+    stopped.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        source: StorageProvider,
+        destination: StorageProvider,
+        source_prefix: str = "",
+        destination_prefix: str = "",
+        workers: int = TRANSFER_WORKERS,
+        verify: bool = True,
+        state_dir: str = TRANSFER_STATE_DIR,
+        owner: Optional[str] = None,
+    ):
+        self.job_id = job_id
+        self.owner = owner
+        self.source = source
+        self.destination = destination
+        self.source_prefix = source_prefix
+        self.destination_prefix = destination_prefix
+        self.workers = max(1, workers)
+        self.verify = verify
+        self.checkpoint = TransferCheckpoint(os.path.join(state_dir, f"{job_id}.json"))
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            "objects_done": 0,
+            "objects_skipped": 0,
+            "objects_failed": 0,
+            "bytes_done": 0,
+        }
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        # Listed keys in dispatch order that the cursor has not passed yet,
+        # and those of them that are finished
+        self._order: List[str] = []
+        self._done: set = set()
+        self._retrying: set = set()
+
+    def cancel(self) -> None:
+        """Stop dispatching objects; in-flight copies finish and are saved"""
+        self._cancelled.set()
+
+    def progress(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        return progress_report(
+            self.job_id, self._job_state(), stats, self.checkpoint.failed
+        )
+
+    def _job_state(self) -> dict:
+        return {
+            "owner": self.owner,
+            "state": self.state,
+            "error": self.error,
+            "source": f"{self.source.provider_type}:{self.source_prefix}",
+            "destination": (
+                f"{self.destination.provider_type}:{self.destination_prefix}"
+            ),
+            "started_at": self._started_at,
+            "finished_at": self._finished_at,
+        }
+
+    def run(self) -> None:
+        self.state = "running"
+        self.error = None
+        self._started_at = time.time()
+        self._finished_at = None
+        self._cancelled.clear()
+        try:
+            self.checkpoint.load()
+            if self.checkpoint.cancel_requested():
+                self._cancelled.set()
+            self._save_state()
+            self._stats.update(self.checkpoint.stats)
+            self._stats["objects_failed"] = 0
+            self._retrying = set(self.checkpoint.failed)
+            self.checkpoint.failed = {}
+            self._order, self._done = [], set()
+            self._copy_all(self._entries(self._retrying))
+            if self._cancelled.is_set():
+                self.state = "cancelled"
+            else:
+                self.state = "failed" if self.checkpoint.failed else "completed"
+        except Exception as e:
+            logger.error(f"Transfer {self.job_id} failed: {str(e)}")
+            self.error = str(e)
+            self.state = "failed"
+        finally:
+            self._finished_at = time.time()
+            self._save()
+        logger.info(
+            f"Transfer {self.job_id} {self.state}: {self._stats['objects_done']} "
+            f"copied, {self._stats['objects_skipped']} skipped, "
+            f"{self._stats['objects_failed']} failed"
+        )
+
+    def _entries(self, retry: set) -> Iterator[dict]:
+        """Source objects still to copy: failed ones first, then the listing
+        resumed from the checkpoint cursor"""
+        for name in retry:
+            try:
+                yield self.source.get_file_info(name)
+            except Exception as e:
+                self._record_failure(name, str(e))
+        finished = set(self.checkpoint.finished)
+        start_after = self.checkpoint.cursor
+        for entry in self.source.list_files(self.source_prefix, start_after):
+            if entry["name"] in finished:
+                # Finished by the previous run; only the cursor moves over it
+                self._order.append(entry["name"])
+                self._done.add(entry["name"])
+                continue
+            yield entry
+
+    def _copy_all(self, entries: Iterator[dict]) -> None:
+        existing = self._destination_listing()
+        in_flight = {}
+        last_save = time.monotonic()
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix=f"transfer-{self.job_id}"
+        ) as pool:
+            entries = iter(entries)
+            while True:
+                while (
+                    len(in_flight) < 2 * self.workers and not self._cancelled.is_set()
+                ):
+                    entry = next(entries, None)
+                    if entry is None:
+                        break
+                    # Retried keys lie behind the cursor and do not move it
+                    if entry["name"] not in self._retrying:
+                        self._order.append(entry["name"])
+                    in_flight[pool.submit(self._copy, entry, existing)] = entry
+                if not in_flight:
+                    break
+                # The timeout keeps cancel requests of other processes and
+                # the checkpoint current while large objects are copied
+                finished, _ = wait(
+                    in_flight, timeout=CHECKPOINT_INTERVAL, return_when=FIRST_COMPLETED
+                )
+                with self._lock:
+                    for future in finished:
+                        name = in_flight.pop(future)["name"]
+                        if name not in self._retrying:
+                            self._done.add(name)
+                    self._advance_cursor()
+                if time.monotonic() - last_save >= CHECKPOINT_INTERVAL:
+                    if self.checkpoint.cancel_requested():
+                        self._cancelled.set()
+                    self._save()
+                    last_save = time.monotonic()
+
+    def _advance_cursor(self) -> None:
+        """Move the cursor over the finished keys at the head of the order"""
+        advanced = 0
+        while advanced < len(self._order) and self._order[advanced] in self._done:
+            self._done.discard(self._order[advanced])
+            advanced += 1
+        if advanced:
+            self.checkpoint.cursor = self._order[advanced - 1]
+            del self._order[:advanced]
+
+    def _destination_listing(self):
+        """Lookup of existing destination objects by merge-joining the sorted
+        destination listing with the sorted source keys"""
+        start_after = None
+        if self.checkpoint.cursor:
+            start_after = self._destination_key(self.checkpoint.cursor)
+        listing = iter(
+            self.destination.list_files(self.destination_prefix, start_after)
+        )
+        state = {"current": next(listing, None)}
+        lock = threading.Lock()
+
+        def lookup(key: str) -> Optional[dict]:
+            with lock:
+                # Workers may ask slightly out of order; keys already passed
+                # are then treated as missing and simply copied again
+                while state["current"] is not None and state["current"]["name"] < key:
+                    state["current"] = next(listing, None)
+                current = state["current"]
+                return current if current and current["name"] == key else None
+
+        return lookup
+
+    def _destination_key(self, name: str) -> str:
+        return self.destination_prefix + name[len(self.source_prefix) :]
+
+    def _copy(self, entry: dict, existing) -> None:
+        name = entry["name"]
+        key = self._destination_key(name)
+        current = existing(key)
+        if current is not None and self._same_object(entry, current):
+            self._count("objects_skipped")
+            return
+        error = None
+        for attempt in range(TRANSFER_RETRIES):
+            if attempt:
+                time.sleep(2**attempt)
+            try:
+                self._copy_object(entry, key)
+                self._count("objects_done")
+                return
+            except Exception as e:
+                error = str(e)
+                logger.warning(f"Error copying {name} (attempt {attempt + 1}): {error}")
+        self._record_failure(name, error)
+
+    def _copy_object(self, entry: dict, key: str) -> None:
+        if key.endswith("/") and not entry.get("size"):
+            self.destination.create_folder(key)
+            return
+        stream = self.source.download_file(entry["name"])
+        reader = _HashingReader(stream, self._count_bytes)
+        try:
+            self.destination.upload_file(reader, key, size=entry.get("size"))
+        finally:
+            stream.close()
+        if self.verify:
+            self._verify(entry, key, reader)
+
+    def _verify(self, entry: dict, key: str, reader: _HashingReader) -> None:
+        md5 = reader.md5.hexdigest()
+        source_md5 = plain_md5(entry.get("etag"))
+        if entry.get("size") is not None and reader.bytes_read != entry["size"]:
+            raise ValueError(
+                f"Read {reader.bytes_read} bytes, source has {entry['size']}"
+            )
+        if source_md5 and source_md5 != md5:
+            raise ValueError("Source data does not match its MD5 ETag")
+        info = self.destination.get_file_info(key)
+        if info["size"] != reader.bytes_read:
+            raise ValueError(
+                f"Destination has {info['size']} bytes, {reader.bytes_read} were sent"
+            )
+        destination_md5 = plain_md5(info.get("etag"))
+        if destination_md5 and destination_md5 != md5:
+            raise ValueError("Destination MD5 does not match the source data")
+
+    @staticmethod
+    def _same_object(entry: dict, current: dict) -> bool:
+        if entry.get("size") != current.get("size"):
+            return False
+        source_md5 = plain_md5(entry.get("etag"))
+        destination_md5 = plain_md5(current.get("etag"))
+        return not (source_md5 and destination_md5) or source_md5 == destination_md5
+
+    def _record_failure(self, name: str, error: str) -> None:
+        with self._lock:
+            self.checkpoint.failed[name] = error
+            self._stats["objects_failed"] += 1
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _count_bytes(self, count: int) -> None:
+        with self._lock:
+            self._stats["bytes_done"] += count
+
+    def _save(self) -> None:
+        with self._lock:
+            self.checkpoint.finished = [
+                name for name in self._order if name in self._done
+            ]
+            self.checkpoint.stats = {
+                name: value
+                for name, value in self._stats.items()
+                if name != "objects_failed"
+            }
+        self._save_state()
+
+    def _save_state(self) -> None:
+        self.checkpoint.job = self._job_state()
+        try:
+            self.checkpoint.save()
+        except OSError as e:
+            logger.error(f"Error saving transfer checkpoint: {str(e)}")
+
+
+class TransferManager:
+    """Transfers started through the API, each run in a background thread.
+
+    Providers are leased from the shared registry for the duration of a
+    run. Each job is owned by the storage configuration that started it and
+    is invisible to others. Its state is saved with its checkpoint, so every
+    worker process sharing ``TRANSFER_STATE_DIR`` reports its progress and
+    can cancel it. Credentials are kept only in the memory of the process
+    that started the job; elsewhere, and after a restart, submitting the
+    same transfer again resumes it from its checkpoint.
+    """
+
+    def __init__(self, state_dir: str = TRANSFER_STATE_DIR):
+        self.state_dir = state_dir
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Transfer] = {}
+        self._specs: Dict[str, dict] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+
+    def start(
+        self,
+        owner: str,
+        source_type: str,
+        source_config: dict,
+        destination_type: str,
+        destination_config: dict,
+        source_prefix: str = "",
+        destination_prefix: str = "",
+        workers: int = TRANSFER_WORKERS,
+        verify: bool = True,
+    ) -> str:
+        job_id = transfer_id(
+            source_type,
+            source_config,
+            destination_type,
+            destination_config,
+            source_prefix,
+            destination_prefix,
+        )
+        spec = {
+            "owner": owner,
+            "source_type": source_type,
+            "source_config": dict(source_config),
+            "destination_type": destination_type,
+            "destination_config": dict(destination_config),
+            "source_prefix": source_prefix,
+            "destination_prefix": destination_prefix,
+            "workers": workers,
+            "verify": verify,
+        }
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return job_id
+            checkpoint = self._checkpoint(job_id)
+            if checkpoint.load() and checkpoint.state() in ACTIVE_STATES:
+                # Running in another process
+                return job_id
+            # Registered before the providers are leased, so the job can be
+            # looked up as soon as its id is returned
+            checkpoint.clear_cancel()
+            checkpoint.job = {
+                "owner": owner,
+                "state": "starting",
+                "error": None,
+                "source": f"{source_type}:{source_prefix}",
+                "destination": f"{destination_type}:{destination_prefix}",
+                "started_at": time.time(),
+                "finished_at": None,
+            }
+            checkpoint.save()
+            self._specs[job_id] = spec
+            self._jobs.pop(job_id, None)
+            thread = threading.Thread(
+                target=self._run, args=(job_id,), name=f"transfer-{job_id}", daemon=True
+            )
+            self._threads[job_id] = thread
+        thread.start()
+        return job_id
+
+    def running(self) -> bool:
+        """Whether a job of this process is starting or running"""
+        with self._lock:
+            return any(thread.is_alive() for thread in self._threads.values())
+
+    def resume(self, job_id: str, owner: str) -> bool:
+        """Start the job again; raises ValueError when this process does not
+        hold its credentials"""
+        spec = self._specs.get(job_id)
+        if spec is None:
+            if self._owned_checkpoint(job_id, owner) is None:
+                return False
+            raise ValueError("Submit the transfer again to resume it")
+        if spec["owner"] != owner:
+            return False
+        self.start(**spec)
+        return True
+
+    def cancel(self, job_id: str, owner: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is not None and job.owner == owner:
+            job.cancel()
+            return True
+        checkpoint = self._owned_checkpoint(job_id, owner)
+        if checkpoint is None:
+            return False
+        if checkpoint.state() in ACTIVE_STATES:
+            checkpoint.request_cancel()
+        return True
+
+    def progress(self, job_id: str, owner: str) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        if job is not None and job.owner == owner:
+            return job.progress()
+        checkpoint = self._owned_checkpoint(job_id, owner)
+        if checkpoint is None:
+            return None
+        return progress_report(
+            job_id,
+            dict(checkpoint.job, state=checkpoint.state()),
+            checkpoint.stats,
+            checkpoint.failed,
+        )
+
+    def list(self, owner: str) -> List[dict]:
+        try:
+            names = sorted(os.listdir(self.state_dir))
+        except FileNotFoundError:
+            return []
+        jobs = []
+        for name in names:
+            if name.endswith(".json"):
+                progress = self.progress(name[: -len(".json")], owner)
+                if progress is not None:
+                    jobs.append(progress)
+        return jobs
+
+    def _checkpoint(self, job_id: str) -> TransferCheckpoint:
+        return TransferCheckpoint(os.path.join(self.state_dir, f"{job_id}.json"))
+
+    def _owned_checkpoint(
+        self, job_id: str, owner: str
+    ) -> Optional[TransferCheckpoint]:
+        if not re.match(r"^[0-9a-f]{16}$", job_id):
+            return None
+        checkpoint = self._checkpoint(job_id)
+        try:
+            if not checkpoint.load():
+                return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Error reading transfer checkpoint {job_id}: {str(e)}")
+            return None
+        if checkpoint.job.get("owner") != owner:
+            return None
+        return checkpoint
+
+    def _run(self, job_id: str) -> None:
+        spec = self._specs[job_id]
+        try:
+            with provider_registry.lease(
+                spec["source_type"], spec["source_config"]
+            ) as source, provider_registry.lease(
+                spec["destination_type"], spec["destination_config"]
+            ) as destination:
+                job = Transfer(
+                    job_id,
+                    source,
+                    destination,
+                    spec["source_prefix"],
+                    spec["destination_prefix"],
+                    spec["workers"],
+                    spec["verify"],
+                    self.state_dir,
+                    spec["owner"],
+                )
+                self._jobs[job_id] = job
+                job.run()
+        except Exception as e:
+            logger.error(f"Error starting transfer {job_id}: {str(e)}")
+            checkpoint = self._checkpoint(job_id)
+            try:
+                checkpoint.load()
+                checkpoint.job.update(
+                    state="failed", error=str(e), finished_at=time.time()
+                )
+                checkpoint.save()
+            except (OSError, ValueError) as save_error:
+                logger.error(f"Error saving transfer checkpoint: {str(save_error)}")
+
+
+def _load_config(value: str) -> dict:
+    """Provider config given inline as JSON or as a path to a JSON file"""
+    if os.path.exists(value):
+        with open(value) as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Copy objects between storage providers, resuming from "
+        "the last checkpoint when run again with the same arguments."
+    )
+    parser.add_argument("--source-type", required=True)
+    parser.add_argument(
+        "--source-config", required=True, help="JSON credentials or a JSON file"
+    )
+    parser.add_argument("--source-prefix", default="")
+    parser.add_argument("--destination-type", required=True)
+    parser.add_argument(
+        "--destination-config", required=True, help="JSON credentials or a JSON file"
+    )
+    parser.add_argument("--destination-prefix", default="")
+    parser.add_argument("--workers", type=int, default=TRANSFER_WORKERS)
+    parser.add_argument("--no-verify", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    source_config = _load_config(args.source_config)
+    destination_config = _load_config(args.destination_config)
+    job_id = transfer_id(
+        args.source_type,
+        source_config,
+        args.destination_type,
+        destination_config,
+        args.source_prefix,
+        args.destination_prefix,
+    )
+    source = get_storage_provider(args.source_type, **source_config)
+    destination = get_storage_provider(args.destination_type, **destination_config)
+    job = Transfer(
+        job_id,
+        source,
+        destination,
+        args.source_prefix,
+        args.destination_prefix,
+        args.workers,
+        not args.no_verify,
+    )
+    runner = threading.Thread(target=job.run, daemon=True)
+    runner.start()
+    try:
+        while runner.is_alive():
+            runner.join(2)
+            p = job.progress()
+            print(
+                f"\r{p['objects_done']} copied, {p['objects_skipped']} skipped, "
+                f"{p['objects_failed']} failed, {p['bytes_done'] / 1024**2:.1f} MB "
+                f"({p['bytes_per_second'] / 1024**2:.1f} MB/s)",
+                end="",
+                file=sys.stderr,
+            )
+    except KeyboardInterrupt:
+        job.cancel()
+        runner.join()
+    finally:
+        print(file=sys.stderr)
+        source.close()
+        destination.close()
+    for name, error in job.checkpoint.failed.items():
+        print(f"failed: {name}: {error}", file=sys.stderr)
+    print(f"Transfer {job_id}: {job.state}", file=sys.stderr)
+    return 0 if job.state == "completed" else 1
+
+
+# Create global instances
+transfer_manager = TransferManager()
+
+
+if __name__ == "__main__":
+    sys.exit(main())